@@ -0,0 +1,328 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from apkg_exporter import CARD_CSS, NoteType
+from metrics import default_metrics
+
+DEFAULT_URL = 'http://127.0.0.1:8765'
+"""
+AnkiConnect插件默认的监听地址。
+"""
+
+DEFAULT_BATCH_SIZE = 500
+"""
+每次请求默认包含的笔记个数。
+"""
+
+DEFAULT_MAX_IN_FLIGHT = 4
+"""
+默认同时进行中的最大请求数。
+"""
+
+DEFAULT_TIMEOUT = 60.0
+"""
+每次请求默认的超时时间，单位为秒。
+"""
+
+API_VERSION = 6
+"""
+使用的AnkiConnect接口版本。
+"""
+
+
+class AnkiConnectError(Exception):
+    """
+    表示AnkiConnect请求失败或返回错误时抛出的异常。
+    """
+
+
+class SyncResult(NamedTuple):
+    """
+    此模型表示一次同步的结果。
+    """
+    added: int
+    """新增的笔记个数。"""
+    updated: int
+    """字段或标签有变化而更新的笔记个数。"""
+    unchanged: int
+    """没有变化、未发送的笔记个数。"""
+    failed: int
+    """新增或更新失败的笔记个数。"""
+    moved: int = 0
+    """原在其他牌组中、移入目标牌组的笔记个数。"""
+
+
+class AnkiConnectClient:
+    """
+    此模型表示AnkiConnect插件的HTTP客户端。
+
+    `requests` 模块在构造此对象时才导入，因此不同步到Anki时不会导入它。
+
+    此对象可在多个线程之间共享。
+    """
+    def __init__(self,
+                 url: str = DEFAULT_URL,
+                 timeout: float = DEFAULT_TIMEOUT,
+                 pool_size: int = DEFAULT_MAX_IN_FLIGHT) -> None:
+        """
+        构造函数。
+
+        :param url: AnkiConnect插件的监听地址。
+        :param timeout: 每次请求的超时时间，单位为秒。
+        :param pool_size: 连接池的大小。
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+        self._url = url
+        self._timeout = timeout
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+    def invoke(self, action: str, **params: Any) -> Any:
+        """
+        调用一个AnkiConnect接口。
+
+        :param action: 接口名称，例如 `'addNotes'`。
+        :param params: 接口参数。
+        :return: 接口返回的结果。
+        :raise AnkiConnectError: 若请求失败或接口返回错误。
+        """
+        import requests
+        metrics = default_metrics()
+        metrics.inc('hanzi_anki_requests_total', action=action)
+        try:
+            with metrics.timer('hanzi_anki_request_seconds', action=action):
+                response = self._session.post(self._url,
+                                              json={'action': action, 'version': API_VERSION,
+                                                    'params': params},
+                                              timeout=self._timeout)
+                response.raise_for_status()
+                body = response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise AnkiConnectError(f'AnkiConnect request {action} failed: {e}') from e
+        if not isinstance(body, dict) or set(body) != {'result', 'error'}:
+            raise AnkiConnectError(f'Unexpected AnkiConnect response to {action}: {body}')
+        if body['error'] is not None:
+            raise AnkiConnectError(f'AnkiConnect {action} error: {body["error"]}')
+        return body['result']
+
+    def multi(self, actions: List[Tuple[str, Dict[str, Any]]]) -> List[Any]:
+        """
+        在一次请求中批量调用多个AnkiConnect接口。
+
+        :param actions: `(接口名称, 接口参数)` 二元组的列表。
+        :return: 各个接口返回的结果，顺序与 `actions` 一致；返回错误的接口对应的
+            结果为形如 `{'result': None, 'error': ...}` 的字典。
+        :raise AnkiConnectError: 若请求失败。
+        """
+        return self.invoke('multi', actions=[{'action': action, 'version': API_VERSION,
+                                              'params': params}
+                                             for action, params in actions])
+
+    def close(self) -> None:
+        """
+        关闭此客户端的连接池。
+        """
+        self._session.close()
+
+
+class AnkiConnectSink:
+    """
+    此模型表示将卡片数据同步到Anki的输出端，通过AnkiConnect插件访问Anki。
+
+    同步时先批量查询同一笔记类型的所有已有笔记，按键字段（第一个字段）与待同步的
+    卡片对应；只有新增的卡片和字段或标签有变化的卡片才会发送给Anki。Anki不允许同一
+    笔记类型中有键字段重复的笔记，因此与待同步的卡片对应、但位于其他牌组中的已有
+    笔记，会通过 `changeDeck` 接口移入目标牌组后再按需更新，而不是重复添加。
+    新增的笔记按 `batch_size` 个一批通过 `addNotes` 接口发送；更新的笔记按批通过
+    `multi` 接口批量调用 `updateNoteFields` 和 `updateNoteTags`。同时进行中的
+    请求最多为 `max_in_flight` 个，以免压垮Anki。
+
+    此对象不是线程安全的，应只在一个线程中使用。
+    """
+    def __init__(self,
+                 deck: str,
+                 note_type: NoteType,
+                 client: Optional[AnkiConnectClient] = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT) -> None:
+        """
+        构造函数。
+
+        :param deck: 牌组名称，若不存在将自动创建。
+        :param note_type: 笔记类型，若Anki中没有同名的笔记类型将自动创建。
+        :param client: AnkiConnect客户端；若为 `None` 则连接默认地址。
+        :param batch_size: 每次请求包含的笔记个数。
+        :param max_in_flight: 同时进行中的最大请求数。
+        """
+        if batch_size < 1:
+            raise ValueError('batch_size must be a positive integer')
+        if max_in_flight < 1:
+            raise ValueError('max_in_flight must be a positive integer')
+        self._deck = deck
+        self._note_type = note_type
+        self._client = client if client is not None else AnkiConnectClient()
+        self._batch_size = batch_size
+        self._max_in_flight = max_in_flight
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    def sync(self, notes: Iterable[Tuple[List[Optional[str]], Iterable[str]]]) -> SyncResult:
+        """
+        将卡片数据同步到Anki。
+
+        :param notes: 笔记数据，每个元素为 `(字段值列表, 标签)` 二元组，字段值的顺序
+            与笔记类型的字段一致；值为 `None` 的字段同步为空字符串。
+        :return: 同步的结果。
+        :raise AnkiConnectError: 若无法访问AnkiConnect。
+        """
+        self._prepare()
+        existing, elsewhere = self._existing_notes()
+        names = self._note_type.fields
+        added = []
+        updated = []
+        unchanged = 0
+        moved: List[int] = []
+        for values, tags in notes:
+            values = ['' if value is None else value for value in values]
+            if len(values) != len(names):
+                raise ValueError(f'Expect {len(names)} fields but got {len(values)}: {values}')
+            fields = dict(zip(names, values))
+            tags = sorted(set(tags))
+            note = existing.get(values[0])
+            if note is not None and note[0] in elsewhere:
+                moved.append(note[0])
+            if note is None:
+                added.append({'deckName': self._deck, 'modelName': self._note_type.name,
+                              'fields': fields, 'tags': tags})
+            elif note[1] != fields or note[2] != tags:
+                updated.append((note[0], fields, tags))
+            else:
+                unchanged += 1
+        if moved:
+            self._client.invoke('changeDeck', deck=self._deck,
+                                cards=[card for note_id in moved for card in elsewhere[note_id]])
+        failed = 0
+        in_flight: List[Future] = []
+        with ThreadPoolExecutor(self._max_in_flight, thread_name_prefix='AnkiConnect') as pool:
+            for start in range(0, len(added), self._batch_size):
+                in_flight.append(pool.submit(self._add, added[start:start + self._batch_size]))
+            for start in range(0, len(updated), self._batch_size):
+                in_flight.append(pool.submit(self._update,
+                                             updated[start:start + self._batch_size]))
+            for future in in_flight:
+                failed += future.result()
+        result = SyncResult(len(added), len(updated), unchanged, failed, len(moved))
+        self._logger.info('Synced deck %s to Anki: %d added, %d updated, %d unchanged, '
+                          '%d failed, %d moved from other decks.', self._deck, *result)
+        return result
+
+    def _prepare(self) -> None:
+        """
+        确保Anki中存在目标牌组和笔记类型。
+        """
+        note_type = self._note_type
+        if note_type.name not in self._client.invoke('modelNames'):
+            self._client.invoke('createModel',
+                                modelName=note_type.name,
+                                inOrderFields=note_type.fields,
+                                css=CARD_CSS,
+                                cardTemplates=[{'Name': 'Card 1',
+                                                'Front': note_type.front,
+                                                'Back': note_type.back}])
+        self._client.invoke('createDeck', deck=self._deck)
+
+    def _existing_notes(self) -> Tuple[Dict[str, Tuple[int, Dict[str, str], List[str]]],
+                                       Dict[int, List[int]]]:
+        """
+        批量查询所有牌组中同一笔记类型的所有已有笔记。
+
+        :return: `(已有笔记, 其他牌组中的笔记)` 二元组。前者是以笔记的键字段为键、以
+            `(笔记ID, 字段值字典, 排序后的标签列表)` 为值的字典；后者是以不在目标
+            牌组中的笔记的ID为键、以其卡片ID列表为值的字典。
+        """
+        note_type = f'"note:{self._note_type.name}"'
+        note_ids = self._client.invoke('findNotes', query=note_type)
+        in_deck = set(self._client.invoke('findNotes', query=f'"deck:{self._deck}" {note_type}'))
+        key_field = self._note_type.fields[0]
+        result = {}
+        elsewhere = {}
+        for start in range(0, len(note_ids), self._batch_size):
+            infos = self._client.invoke('notesInfo',
+                                        notes=note_ids[start:start + self._batch_size])
+            for info in infos:
+                fields = {name: field['value'] for name, field in info['fields'].items()}
+                result[fields.get(key_field, '')] = (info['noteId'], fields,
+                                                     sorted(info['tags']))
+                if info['noteId'] not in in_deck:
+                    elsewhere[info['noteId']] = info['cards']
+        return result, elsewhere
+
+    def _add(self, notes: List[Dict[str, Any]]) -> int:
+        """
+        发送一批新增的笔记。
+
+        :param notes: 一批 `addNotes` 接口的笔记参数。
+        :return: 新增失败的笔记个数。
+        """
+        note_ids = self._client.invoke('addNotes', notes=notes)
+        failed = [note['fields'][self._note_type.fields[0]]
+                  for note, note_id in zip(notes, note_ids) if note_id is None]
+        if failed:
+            self._logger.error('Failed to add %d notes to Anki: %s', len(failed),
+                               ', '.join(failed[:10]))
+        return len(failed)
+
+    def _update(self, notes: List[Tuple[int, Dict[str, str], List[str]]]) -> int:
+        """
+        发送一批更新的笔记。
+
+        :param notes: 一批 `(笔记ID, 字段值字典, 标签列表)` 三元组。
+        :return: 更新失败的笔记个数。
+        """
+        actions = []
+        for note_id, fields, tags in notes:
+            actions.append(('updateNoteFields', {'note': {'id': note_id, 'fields': fields}}))
+            actions.append(('updateNoteTags', {'note': note_id, 'tags': tags}))
+        results = self._client.multi(actions)
+        failed = 0
+        for (note_id, _, _), field_result, tag_result in zip(notes, results[::2], results[1::2]):
+            errors = [r['error'] for r in (field_result, tag_result)
+                      if isinstance(r, dict) and r.get('error')]
+            if errors:
+                failed += 1
+                self._logger.error('Failed to update Anki note %d: %s', note_id,
+                                   '; '.join(errors))
+        return failed
+
+
+def push_to_anki(url: str,
+                 deck: str,
+                 note_type: NoteType,
+                 notes: Iterable[Tuple[List[Optional[str]], Iterable[str]]]) -> SyncResult:
+    """
+    通过AnkiConnect将卡片数据同步到Anki的指定牌组。
+
+    :param url: AnkiConnect插件的监听地址。
+    :param deck: 牌组名称。
+    :param note_type: 笔记类型。
+    :param notes: 笔记数据，每个元素为 `(字段值列表, 标签)` 二元组。
+    :return: 同步的结果。
+    :raise AnkiConnectError: 若无法访问AnkiConnect，或有笔记新增或更新失败。
+    """
+    client = AnkiConnectClient(url)
+    try:
+        result = AnkiConnectSink(deck, note_type, client).sync(notes)
+    finally:
+        client.close()
+    if result.failed:
+        raise AnkiConnectError(f'Failed to sync {result.failed} notes to Anki deck {deck}.')
+    return result
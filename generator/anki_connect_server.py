@@ -0,0 +1,221 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import argparse
+import json
+import logging
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from anki_connect import API_VERSION
+
+_QUERY_TERM_PATTERN = re.compile(r'"(deck|note):([^"]*)"')
+
+
+class MockAnkiConnect(ThreadingHTTPServer):
+    """
+    此模型表示模拟AnkiConnect插件的本地替身HTTP服务器。
+
+    服务器在内存中保存牌组、笔记类型和笔记，支持 `AnkiConnectSink` 用到的接口：
+    `version`、`modelNames`、`createModel`、`createDeck`、`findNotes`（只支持
+    `"deck:牌组" "note:笔记类型"` 及 `"note:笔记类型"` 形式的查询）、`notesInfo`、
+    `addNotes`、`updateNoteFields`、`updateNoteTags`、`changeDeck` 和 `multi`。
+    每个笔记只有一张卡片，卡片ID与笔记ID相同。每个接口的调用次数记录在
+    `calls` 中，可以模拟每个请求的延迟，用于测试和基准测试同步过程。
+    """
+    daemon_threads = True
+
+    def __init__(self,
+                 host: str = '127.0.0.1',
+                 port: int = 0,
+                 latency: float = 0.0) -> None:
+        """
+        构造函数。
+
+        :param host: 监听的主机地址。
+        :param port: 监听的端口，为0表示自动选择一个空闲端口。
+        :param latency: 每个请求的延迟，单位为秒。
+        """
+        super().__init__((host, port), _AnkiConnectRequestHandler)
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.decks = {'Default'}
+        self.models: Dict[str, List[str]] = {}
+        self.notes: Dict[int, Dict[str, Any]] = {}
+        self.calls: Dict[str, int] = {}
+        self._keys: Dict[Tuple[str, str], int] = {}
+        self._next_id = int(time.time() * 1000)
+        self._actions: Dict[str, Callable[..., Any]] = {
+            'version': lambda: API_VERSION,
+            'modelNames': lambda: sorted(self.models),
+            'createModel': self._create_model,
+            'createDeck': self._create_deck,
+            'findNotes': self._find_notes,
+            'notesInfo': self._notes_info,
+            'addNotes': lambda notes: [self._add_note(note) for note in notes],
+            'updateNoteFields': self._update_note_fields,
+            'updateNoteTags': self._update_note_tags,
+            'changeDeck': self._change_deck,
+            'multi': self._multi,
+        }
+
+    @property
+    def url(self) -> str:
+        """
+        获取此服务器的URL。
+
+        :return: 此服务器的URL。
+        """
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        处理一个AnkiConnect请求。
+
+        :param request: 请求的JSON对象。
+        :return: 响应的JSON对象，包含 `result` 和 `error` 两个字段。
+        """
+        action = request.get('action')
+        with self.lock:
+            self.calls[action] = self.calls.get(action, 0) + 1
+            handler = self._actions.get(action)
+            if handler is None:
+                return {'result': None, 'error': 'unsupported action'}
+            try:
+                return {'result': handler(**request.get('params', {})), 'error': None}
+            except Exception as e:
+                return {'result': None, 'error': str(e)}
+
+    def _create_model(self, modelName: str, inOrderFields: List[str], **_) -> Dict:
+        if modelName in self.models:
+            raise ValueError('Model name already exists')
+        self.models[modelName] = list(inOrderFields)
+        return {'name': modelName}
+
+    def _create_deck(self, deck: str) -> int:
+        self.decks.add(deck)
+        return len(self.decks)
+
+    def _find_notes(self, query: str) -> List[int]:
+        terms = dict(_QUERY_TERM_PATTERN.findall(query))
+        return [note_id for note_id, note in self.notes.items()
+                if note['deckName'] == terms.get('deck', note['deckName'])
+                and note['modelName'] == terms.get('note', note['modelName'])]
+
+    def _notes_info(self, notes: List[int]) -> List[Dict]:
+        result = []
+        for note_id in notes:
+            note = self.notes.get(note_id)
+            if note is None:
+                result.append({})
+                continue
+            names = self.models[note['modelName']]
+            result.append({
+                'noteId': note_id,
+                'modelName': note['modelName'],
+                'tags': list(note['tags']),
+                'cards': [note_id],
+                'fields': {name: {'value': note['fields'].get(name, ''), 'order': order}
+                           for order, name in enumerate(names)},
+            })
+        return result
+
+    def _add_note(self, note: Dict[str, Any]) -> Optional[int]:
+        # 与Anki一样，同一笔记类型中键字段为空或重复的笔记添加失败
+        names = self.models.get(note['modelName'])
+        if names is None or note['deckName'] not in self.decks:
+            return None
+        key = (note['modelName'], note['fields'].get(names[0], ''))
+        if not key[1] or key in self._keys:
+            return None
+        self._next_id += 1
+        self._keys[key] = self._next_id
+        self.notes[self._next_id] = {'deckName': note['deckName'],
+                                     'modelName': note['modelName'],
+                                     'fields': dict(note['fields']),
+                                     'tags': list(note.get('tags', []))}
+        return self._next_id
+
+    def _update_note_fields(self, note: Dict[str, Any]) -> None:
+        stored = self.notes.get(note['id'])
+        if stored is None:
+            raise ValueError(f'Note was not found: {note["id"]}')
+        stored['fields'].update(note['fields'])
+
+    def _update_note_tags(self, note: int, tags: List[str]) -> None:
+        stored = self.notes.get(note)
+        if stored is None:
+            raise ValueError(f'Note was not found: {note}')
+        stored['tags'] = list(tags)
+
+    def _change_deck(self, cards: List[int], deck: str) -> None:
+        self.decks.add(deck)
+        for card in cards:
+            stored = self.notes.get(card)
+            if stored is None:
+                raise ValueError(f'Card was not found: {card}')
+            stored['deckName'] = deck
+
+    def _multi(self, actions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        result = []
+        for action in actions:
+            name = action.get('action')
+            self.calls[name] = self.calls.get(name, 0) + 1
+            try:
+                result.append({'result': self._actions[name](**action.get('params', {})),
+                               'error': None})
+            except Exception as e:
+                result.append({'result': None, 'error': str(e)})
+        return result
+
+
+class _AnkiConnectRequestHandler(BaseHTTPRequestHandler):
+    """
+    AnkiConnect替身服务器的请求处理器。
+    """
+    server: MockAnkiConnect
+
+    def log_message(self, format, *args) -> None:
+        logging.getLogger(MockAnkiConnect.__name__).debug(format, *args)
+
+    def do_POST(self) -> None:
+        if self.server.latency > 0:
+            time.sleep(self.server.latency)
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            request = json.loads(self.rfile.read(length))
+        except ValueError as e:
+            response = {'result': None, 'error': f'invalid request: {e}'}
+        else:
+            response = self.server.handle(request)
+        content = json.dumps(response, ensure_ascii=False).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='启动模拟AnkiConnect插件的本地替身服务器。')
+    parser.add_argument('--port', type=int, default=8766, help='监听的端口，默认为8766')
+    parser.add_argument('--latency', type=float, default=0.0, metavar='SECONDS',
+                        help='每个请求的延迟（秒），默认为0')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(levelname)s - %(message)s')
+    server = MockAnkiConnect(port=args.port, latency=args.latency)
+    logging.getLogger(__name__).info('Serving mock AnkiConnect at %s', server.url)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,406 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+import zipfile
+from typing import Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from card_file import CardRecord
+from card_writer import DEFAULT_BATCH_SIZE, CardWriter
+
+_SCHEMA = '''
+CREATE TABLE col (
+    id integer primary key, crt integer not null, mod integer not null,
+    scm integer not null, ver integer not null, dty integer not null,
+    usn integer not null, ls integer not null, conf text not null,
+    models text not null, decks text not null, dconf text not null,
+    tags text not null
+);
+CREATE TABLE notes (
+    id integer primary key, guid text not null, mid integer not null,
+    mod integer not null, usn integer not null, tags text not null,
+    flds text not null, sfld integer not null, csum integer not null,
+    flags integer not null, data text not null
+);
+CREATE TABLE cards (
+    id integer primary key, nid integer not null, did integer not null,
+    ord integer not null, mod integer not null, usn integer not null,
+    type integer not null, queue integer not null, due integer not null,
+    ivl integer not null, factor integer not null, reps integer not null,
+    lapses integer not null, left integer not null, odue integer not null,
+    odid integer not null, flags integer not null, data text not null
+);
+CREATE TABLE revlog (
+    id integer primary key, cid integer not null, usn integer not null,
+    ease integer not null, ivl integer not null, lastIvl integer not null,
+    factor integer not null, time integer not null, type integer not null
+);
+CREATE TABLE graves (usn integer not null, oid integer not null, type integer not null);
+CREATE INDEX ix_notes_usn on notes (usn);
+CREATE INDEX ix_cards_usn on cards (usn);
+CREATE INDEX ix_revlog_usn on revlog (usn);
+CREATE INDEX ix_cards_nid on cards (nid);
+CREATE INDEX ix_cards_sched on cards (did, queue, due);
+CREATE INDEX ix_revlog_cid on revlog (cid);
+CREATE INDEX ix_notes_csum on notes (csum);
+'''
+
+CARD_CSS = '''.card {
+  font-family: "Kaiti SC", "STKaiti", "KaiTi", serif;
+  font-size: 24px;
+  text-align: center;
+  color: black;
+  background-color: white;
+}
+.key { font-size: 96px; }
+.pinyin { font-size: 32px; color: #c0392b; }
+.definitions { font-size: 20px; text-align: left; }
+'''
+"""
+所有笔记类型的卡片共用的样式表。
+"""
+
+_BASE91_TABLE = ('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+                 '!#$%&()*+,-./:;<=>?@[]^_`{|}~')
+
+_MEDIA_PATTERN = re.compile(r'\[sound:([^\]]+)\]|<img[^>]*\ssrc="([^"]+)"')
+
+_HTML_TAG_PATTERN = re.compile(r'<[^>]*>')
+
+
+class NoteType(NamedTuple):
+    """
+    此模型表示Anki笔记类型（模板）。
+    """
+    id: int
+    """笔记类型的ID，必须保持不变，以便重复导入时更新同一笔记类型。"""
+    name: str
+    """笔记类型的名称。"""
+    fields: List[str]
+    """笔记的字段名称列表，第一个字段为排序字段，也是笔记的键。"""
+    front: str
+    """卡片正面的模板。"""
+    back: str
+    """卡片背面的模板。"""
+
+
+CHARACTER_NOTE_TYPE = NoteType(
+    id=1698652800005,
+    name='汉字卡片',
+    fields=['汉字', '拼音', '图片', '读音', '释义', '例词例句'],
+    front='<div class="key">{{汉字}}</div>',
+    back='{{FrontSide}}<hr id="answer">'
+         '<div class="pinyin">{{拼音}}</div>'
+         '<div>{{图片}}</div><div>{{读音}}</div>'
+         '<div class="definitions">{{释义}}</div>'
+         '<div class="examples">{{例词例句}}</div>',
+)
+"""
+汉字卡片的笔记类型。
+"""
+
+WORD_NOTE_TYPE = NoteType(
+    id=1698652800004,
+    name='生词卡片',
+    fields=['生词', '拼音', '释义'],
+    front='<div class="key">{{生词}}</div>',
+    back='{{FrontSide}}<hr id="answer">'
+         '<div class="pinyin">{{拼音}}</div>'
+         '<div class="definitions">{{释义}}</div>',
+)
+"""
+生词卡片的笔记类型。
+"""
+
+SENTENCE_NOTE_TYPE = NoteType(
+    id=1698652800003,
+    name='句子卡片',
+    fields=['句子'],
+    front='<div>{{句子}}</div>',
+    back='{{FrontSide}}',
+)
+"""
+句子卡片的笔记类型。
+"""
+
+
+class ApkgCardWriter(CardWriter):
+    """
+    此模型表示Anki的 `.apkg` 牌组包的输出端。
+
+    笔记按批写入牌组包内的SQLite数据库，提交时再与引用的媒体文件一起打包。每个
+    笔记的GUID由笔记类型和笔记的键（第一个字段）计算得到，因此重复导入同一牌组包
+    时，Anki会原地更新已有的笔记，而不会产生重复的笔记。若指定了 `media_dir`，
+    字段中以 `[sound:文件名]` 或 `<img src="文件名">` 引用的本地媒体文件也会打包
+    到牌组包中。
+
+    写入的卡片的字段值即为笔记的字段值，顺序与 `note_type.fields` 一致；值为
+    `None` 的字段导出为空字符串。
+    """
+    def __init__(self,
+                 path: str,
+                 deck_name: str,
+                 note_type: NoteType,
+                 media_dir: Optional[str] = None,
+                 batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        """
+        构造函数。
+
+        :param path: 输出的 `.apkg` 文件名。
+        :param deck_name: 牌组名称。
+        :param note_type: 笔记类型。
+        :param media_dir: 本地媒体文件所在的文件夹；若为 `None` 则不打包媒体文件。
+        :param batch_size: 批量写入的笔记个数。
+        """
+        super().__init__(path, batch_size)
+        self._deck_name = deck_name
+        self._note_type = note_type
+        self._media_dir = media_dir
+        self._media: Set[str] = set()
+        self._due = 0
+        self._now = int(time.time())
+        self._deck_id = _stable_id(f'deck:{deck_name}')
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._temp_dir = tempfile.mkdtemp()
+        self._db_file = os.path.join(self._temp_dir, 'collection.anki2')
+        self._conn = sqlite3.connect(self._db_file)
+        self._conn.executescript(_SCHEMA)
+        with self._conn:
+            self._conn.execute('INSERT INTO col VALUES (1, ?, ?, ?, 11, 0, 0, 0, ?, ?, ?, ?, ?)',
+                               (self._now, self._now * 1000, self._now * 1000,
+                                json.dumps(_collection_config(self._deck_id, note_type)),
+                                json.dumps(_models(self._deck_id, note_type, self._now)),
+                                json.dumps(_decks(self._deck_id, deck_name, self._now)),
+                                json.dumps(_deck_configs()),
+                                '{}'))
+
+    def _write_batch(self, records: List[CardRecord]) -> None:
+        note_type = self._note_type
+        now = self._now
+        note_rows = []
+        card_rows = []
+        for fields, tags in records:
+            values = ['' if value is None else value for value in fields]
+            if len(values) != len(note_type.fields):
+                raise ValueError(f'Expect {len(note_type.fields)} fields but got '
+                                 f'{len(values)}: {values}')
+            key = values[0]
+            note_id = _stable_id(f'note:{note_type.id}:{key}')
+            sort_field = _HTML_TAG_PATTERN.sub('', key)
+            checksum = int(hashlib.sha1(sort_field.encode('utf-8')).hexdigest()[:8], 16)
+            self._due += 1
+            note_rows.append((note_id, _guid(note_type, key), note_type.id, now, -1,
+                              f' {" ".join(sorted(tags))} ', '\x1f'.join(values),
+                              sort_field, checksum, 0, ''))
+            card_rows.append((_stable_id(f'card:{note_type.id}:{key}'), note_id, self._deck_id,
+                              0, now, -1, 0, 0, self._due, 0, 0, 0, 0, 0, 0, 0, 0, ''))
+            if self._media_dir is not None:
+                self._media.update(_find_media(values))
+        with self._conn:
+            self._conn.executemany('INSERT INTO notes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                   note_rows)
+            self._conn.executemany('INSERT INTO cards VALUES '
+                                   '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                   card_rows)
+
+    def _commit(self) -> None:
+        try:
+            self._conn.close()
+            media_files = []
+            for filename in sorted(self._media):
+                path = os.path.join(self._media_dir, filename)
+                if os.path.exists(path):
+                    media_files.append((filename, path))
+                else:
+                    self._logger.warning('Media file not found: %s', path)
+            temp_file = f'{self._path}.tmp'
+            try:
+                with zipfile.ZipFile(temp_file, 'w', zipfile.ZIP_DEFLATED) as apkg:
+                    apkg.write(self._db_file, 'collection.anki2')
+                    apkg.writestr('media', json.dumps({str(i): filename for i, (filename, _)
+                                                       in enumerate(media_files)}))
+                    for i, (_, path) in enumerate(media_files):
+                        apkg.write(path, str(i))
+                os.replace(temp_file, self._path)
+            except BaseException:
+                # 写了一半的临时文件没有用处，删除后再抛出异常，已有的牌组包保持不变
+                if os.path.exists(temp_file):
+                    os.remove(temp_file)
+                raise
+        finally:
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+        self._logger.info('Exported %d notes and %d media files to %s',
+                          self.count, len(media_files), self._path)
+
+    def _discard(self) -> None:
+        self._conn.close()
+        shutil.rmtree(self._temp_dir, ignore_errors=True)
+
+
+def export_apkg(output_file: str,
+                deck_name: str,
+                note_type: NoteType,
+                notes: Iterable[Tuple[List[Optional[str]], Iterable[str]]],
+                media_dir: Optional[str] = None) -> int:
+    """
+    将卡片数据直接导出为Anki的 `.apkg` 牌组包，参见 `ApkgCardWriter`。
+
+    :param output_file: 输出的 `.apkg` 文件名。
+    :param deck_name: 牌组名称。
+    :param note_type: 笔记类型。
+    :param notes: 笔记数据，每个元素为 `(字段值列表, 标签)` 二元组，字段值的顺序
+        与 `note_type.fields` 一致。
+    :param media_dir: 本地媒体文件所在的文件夹；若为 `None` 则不打包媒体文件。
+    :return: 导出的笔记个数。
+    """
+    with ApkgCardWriter(output_file, deck_name, note_type, media_dir) as writer:
+        writer.write_all(CardRecord(fields, tags) for fields, tags in notes)
+    return writer.count
+
+
+def _find_media(values: List[str]) -> Set[str]:
+    """
+    查找字段值中引用的本地媒体文件。
+
+    :param values: 字段值列表。
+    :return: 引用的本地媒体文件名集合。
+    """
+    result = set()
+    for value in values:
+        for match in _MEDIA_PATTERN.finditer(value):
+            filename = match.group(1) or match.group(2)
+            if not filename.startswith(('http://', 'https://', '//')):
+                result.add(filename)
+    return result
+
+
+def _stable_id(key: str) -> int:
+    """
+    由指定的键计算一个稳定的正整数ID。
+
+    :param key: 指定的键。
+    :return: 由该键的SHA-1摘要得到的53位正整数。
+    """
+    return int(hashlib.sha1(key.encode('utf-8')).hexdigest()[:13], 16) or 1
+
+
+def _guid(note_type: NoteType, key: str) -> str:
+    """
+    计算笔记的GUID。
+
+    :param note_type: 笔记类型。
+    :param key: 笔记的键。
+    :return: 由笔记类型和笔记的键得到的base91编码的GUID。
+    """
+    digest = hashlib.sha256(f'{note_type.name}:{key}'.encode('utf-8')).digest()
+    value = int.from_bytes(digest[:8], 'big')
+    chars = []
+    while value > 0:
+        value, remainder = divmod(value, len(_BASE91_TABLE))
+        chars.append(_BASE91_TABLE[remainder])
+    return ''.join(reversed(chars)) or _BASE91_TABLE[0]
+
+
+def _collection_config(deck_id: int, note_type: NoteType) -> dict:
+    """
+    生成牌组包中集合的配置。
+
+    :param deck_id: 牌组ID。
+    :param note_type: 笔记类型。
+    :return: 集合的配置。
+    """
+    return {
+        'activeDecks': [deck_id], 'curDeck': deck_id, 'newSpread': 0,
+        'collapseTime': 1200, 'timeLim': 0, 'estTimes': True, 'dueCounts': True,
+        'curModel': str(note_type.id), 'nextPos': 1, 'sortType': 'noteFld',
+        'sortBackwards': False, 'addToCur': True,
+    }
+
+
+def _models(deck_id: int, note_type: NoteType, now: int) -> dict:
+    """
+    生成牌组包中的笔记类型定义。
+
+    :param deck_id: 牌组ID。
+    :param note_type: 笔记类型。
+    :param now: 当前时间戳（秒）。
+    :return: 以笔记类型ID为键的笔记类型定义。
+    """
+    return {
+        str(note_type.id): {
+            'id': note_type.id,
+            'name': note_type.name,
+            'type': 0,
+            'mod': now,
+            'usn': -1,
+            'sortf': 0,
+            'did': deck_id,
+            'tmpls': [{
+                'name': 'Card 1', 'ord': 0, 'qfmt': note_type.front,
+                'afmt': note_type.back, 'did': None, 'bqfmt': '', 'bafmt': '',
+            }],
+            'flds': [{
+                'name': name, 'ord': ord_, 'sticky': False, 'rtl': False,
+                'font': 'Arial', 'size': 20, 'media': [],
+            } for ord_, name in enumerate(note_type.fields)],
+            'css': CARD_CSS,
+            'latexPre': '\\documentclass[12pt]{article}\n\\special{papersize=3in,5in}\n'
+                        '\\usepackage[utf8]{inputenc}\n\\usepackage{amssymb,amsmath}\n'
+                        '\\pagestyle{empty}\n\\setlength{\\parindent}{0in}\n'
+                        '\\begin{document}\n',
+            'latexPost': '\\end{document}',
+            'tags': [],
+            'vers': [],
+            'req': [[0, 'any', [0]]],
+        },
+    }
+
+
+def _decks(deck_id: int, deck_name: str, now: int) -> dict:
+    """
+    生成牌组包中的牌组定义。
+
+    :param deck_id: 牌组ID。
+    :param deck_name: 牌组名称。
+    :param now: 当前时间戳（秒）。
+    :return: 以牌组ID为键的牌组定义。
+    """
+    def deck(id_: int, name: str) -> dict:
+        return {
+            'id': id_, 'name': name, 'desc': '', 'mod': now, 'usn': -1,
+            'collapsed': False, 'newToday': [0, 0], 'revToday': [0, 0],
+            'lrnToday': [0, 0], 'timeToday': [0, 0], 'dyn': 0, 'conf': 1,
+            'extendNew': 10, 'extendRev': 50,
+        }
+    return {'1': deck(1, 'Default'), str(deck_id): deck(deck_id, deck_name)}
+
+
+def _deck_configs() -> dict:
+    """
+    生成牌组包中的默认牌组选项。
+
+    :return: 以选项ID为键的牌组选项。
+    """
+    return {
+        '1': {
+            'id': 1, 'name': 'Default', 'mod': 0, 'usn': 0, 'maxTaken': 60,
+            'autoplay': True, 'timer': 0, 'replayq': True, 'dyn': False,
+            'new': {'bury': True, 'delays': [1, 10], 'initialFactor': 2500,
+                    'ints': [1, 4, 7], 'order': 1, 'perDay': 20, 'separate': True},
+            'lapse': {'delays': [10], 'leechAction': 0, 'leechFails': 8,
+                      'minInt': 1, 'mult': 0},
+            'rev': {'bury': True, 'ease4': 1.3, 'fuzz': 0.05, 'ivlFct': 1,
+                    'maxIvl': 36500, 'minSpace': 1, 'perDay': 200},
+        },
+    }
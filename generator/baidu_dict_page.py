@@ -4,42 +4,58 @@
 #     All rights reserved.                                                     #
 #                                                                              #
 # ##############################################################################
-from typing import Optional
+from typing import TYPE_CHECKING, List, Optional
 from urllib.parse import quote
 
-from bs4 import BeautifulSoup
-
 from dict_page import DictPage
+from extraction import ExtractionPlan, FieldSpec
+
+if TYPE_CHECKING:
+    from bs4 import Tag
+
+
+def _get_image(element: None, ch: str) -> Optional[str]:
+    return f'https://img.zdic.net/kai/jbh/{hex(ord(ch)).upper()[2:]}.gif'
+
+
+def _get_pinyin(element: 'Tag', ch: str) -> Optional[str]:
+    return element.text
+
+
+def _get_pronounce(element: 'Tag', ch: str) -> Optional[str]:
+    return element.attrs['url']
+
+
+def _get_definitions(elements: List['Tag'], ch: str) -> Optional[str]:
+    definitions = []
+    for p in elements:
+        definition = p.text.strip().replace('～', ch)
+        definitions.append(definition)
+    return '<br>'.join(definitions)
 
 
 class BaiduDictPage(DictPage):
     """
     此模型表示指定汉字对应的百度汉语页面内容。
     """
+    SOURCE = 'baidu'
+
+    BASE_URL = 'https://dict.baidu.com'
+
+    # 修改下面的提取规则后须递增此版本号
+    EXTRACTOR_VERSION = 1
+
+    EXTRACTION_PLAN = ExtractionPlan(
+        fields={
+            'image': FieldSpec(None, _get_image),
+            'pinyin': FieldSpec('#pinyin > span > b', _get_pinyin),
+            'pronounce': FieldSpec('.mp3-play', _get_pronounce),
+            'definitions': FieldSpec('#basicmean-wrapper > .tab-content > dl > dd > p',
+                                     _get_definitions, select_all=True),
+        },
+        # 只解析拼音及读音（#pinyin）和基本释义（#basicmean-wrapper）所在的子树
+        parse_only={'id': ['pinyin', 'basicmean-wrapper']},
+    )
+
     def _get_page_url(self, ch) -> str:
-        return f'https://dict.baidu.com/s?wd={quote(ch)}&ptype=zici'
-
-    def _get_image(self, soup: BeautifulSoup) -> Optional[str]:
-        return f'https://img.zdic.net/kai/jbh/{self._unicodeHex}.gif'
-
-    def _get_pinyin(self, soup: BeautifulSoup) -> Optional[str]:
-        pinyin_element = soup.select_one('#pinyin > span > b')
-        if pinyin_element:
-            return pinyin_element.text
-        return None
-
-    def _get_pronounce(self, soup: BeautifulSoup) -> Optional[str]:
-        pronounce_element = soup.select_one('.mp3-play')
-        if pronounce_element:
-            return pronounce_element.attrs['url']
-        return None
-
-    def _get_definitions(self, soup: BeautifulSoup) -> Optional[str]:
-        definitions_elements = soup.select('#basicmean-wrapper > .tab-content > dl > dd > p')
-        if definitions_elements:
-            definitions = []
-            for p in definitions_elements:
-                definition = p.text.strip().replace('～', self._char)
-                definitions.append(definition)
-            return '<br>'.join(definitions)
-        return None
+        return f'{self.BASE_URL}/s?wd={quote(ch)}&ptype=zici'
@@ -0,0 +1,311 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import argparse
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import generator_character_cards
+from baidu_dict_page import BaiduDictPage
+from dict_server import DEFAULT_CARD_FILE, DictServer, FixturePages
+from generator_character_cards import (IncompleteDeckError, collect_characters, generate_cards,
+                                       get_dict_page_class)
+from http_client import HttpClient
+from page_cache import PageCache
+from page_fetcher import PageFetcher
+from zdic_dict_page import ZdicDictPage
+
+_ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+DEFAULT_INPUT_FILES = os.path.join(_ROOT_DIR, 'data', 'character', '*.txt')
+"""
+默认的基准测试语料，即仓库中的汉字列表文件。
+"""
+
+DEFAULT_BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                     'benchmark_baseline.json')
+"""
+默认的基准测试基线文件。
+"""
+
+DEFAULT_TOLERANCE = 0.2
+"""
+判定性能退化的默认容差，即吞吐量下降或延迟上升超过基线的比例。
+"""
+
+
+class TimingFetcher(PageFetcher):
+    """
+    此模型表示记录每个页面的下载耗时和内容的页面获取器。
+    """
+    def __init__(self, **kwargs) -> None:
+        """
+        构造函数。
+
+        :param kwargs: 传递给 `PageFetcher` 的参数。
+        """
+        super().__init__(**kwargs)
+        self.fetch_times: Dict[str, float] = {}
+        self.contents: Dict[str, bytes] = {}
+
+    def fetch(self, source: str, url: str) -> bytes:
+        start = time.perf_counter()
+        content = super().fetch(source, url)
+        self.fetch_times[url] = time.perf_counter() - start
+        self.contents[url] = content
+        return content
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """
+    计算一组耗时的p50、p95和p99分位数。
+
+    :param values: 以秒为单位的耗时。
+    :return: 以毫秒为单位的各分位数。
+    """
+    if not values:
+        return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+    ordered = sorted(values)
+
+    def at(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {'p50': at(0.50), 'p95': at(0.95), 'p99': at(0.99)}
+
+
+def peak_rss_mb(who: int) -> float:
+    """
+    获取当前进程或其已结束的子进程的峰值常驻内存。
+
+    :param who: `resource.RUSAGE_SELF` 或 `resource.RUSAGE_CHILDREN`。
+    :return: 峰值常驻内存，单位为MB。
+    """
+    rss = resource.getrusage(who).ru_maxrss
+    # Linux下 ru_maxrss 的单位为KB，macOS下为字节
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(rss / scale, 1)
+
+
+def _serve(queue: multiprocessing.Queue,
+           card_file: str,
+           recorded: Optional[str],
+           latency: float,
+           jitter: float,
+           error_rate: float) -> None:
+    """
+    在子进程中运行本地替身服务器，并通过队列返回其根URL。
+    """
+    cache = PageCache(recorded) if recorded else None
+    server = DictServer(FixturePages(card_file, cache), latency=latency,
+                        jitter=jitter, error_rate=error_rate)
+    queue.put(server.base_url)
+    server.serve_forever()
+
+
+def run_benchmark(input_files: List[str],
+                  source: str = 'zdic',
+                  concurrency: int = 16,
+                  parse_workers: Optional[int] = None,
+                  latency: float = 0.05,
+                  jitter: float = 0.02,
+                  error_rate: float = 0.0,
+                  card_file: str = DEFAULT_CARD_FILE,
+                  recorded: Optional[str] = None) -> Dict:
+    """
+    针对本地替身服务器运行一次汉字卡片生成，并统计其性能指标。
+
+    替身服务器运行在单独的进程中，因此其内存和CPU占用不计入被测的生成器。
+
+    :param input_files: 汉字列表文件。
+    :param source: 字典页面的来源，`'composite'`、`'zdic'` 或 `'baidu'`。
+    :param concurrency: 并发下载字典页面的线程数。
+    :param parse_workers: 并行解析字典页面的进程数；若为 `None` 则使用CPU的核数。
+    :param latency: 替身服务器每个请求的平均延迟，单位为秒。
+    :param jitter: 替身服务器延迟的最大抖动，单位为秒。
+    :param error_rate: 替身服务器返回HTTP 503错误的概率。
+    :param card_file: 用于合成页面的汉字卡片表格文件。
+    :param recorded: 记录了真实页面的页面缓存数据库文件。
+    :return: 性能指标。
+    """
+    queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=_serve, daemon=True,
+                                     args=(queue, card_file, recorded,
+                                           latency, jitter, error_rate))
+    server.start()
+    base_url = queue.get(timeout=30)
+    saved_base_urls = (ZdicDictPage.BASE_URL, BaiduDictPage.BASE_URL)
+    saved_source = generator_character_cards.DICT_PAGE_TYPE
+    ZdicDictPage.BASE_URL = f'{base_url}/zdic'
+    BaiduDictPage.BASE_URL = f'{base_url}/baidu'
+    generator_character_cards.DICT_PAGE_TYPE = source
+    client = HttpClient(backoff=0.05, pool_size=concurrency)
+    fetcher = TimingFetcher(client=client)
+    characters = collect_characters(input_files)
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_file = os.path.join(temp_dir, 'characters.txt')
+            start = time.perf_counter()
+            try:
+                cards = len(generate_cards(characters, output_file, concurrency=concurrency,
+                                           fetcher=fetcher, parse_workers=parse_workers))
+            except IncompleteDeckError as e:
+                # 注入错误时可能有汉字查询失败，只统计查询成功的卡片
+                cards = len(characters) - len(e.failed)
+            elapsed = time.perf_counter() - start
+        rss_self = peak_rss_mb(resource.RUSAGE_SELF)
+        rss_children = peak_rss_mb(resource.RUSAGE_CHILDREN)
+        # 解析阶段可能运行在其他进程中，因此在本进程中重新解析一遍页面来统计解析耗时
+        page_class = get_dict_page_class()
+        parse_times = {}
+        for ch in characters:
+            url = page_class(ch, fetcher).url
+            if url in fetcher.contents:
+                parse_start = time.perf_counter()
+                page_class.extract_record(ch, fetcher.contents[url])
+                parse_times[url] = time.perf_counter() - parse_start
+    finally:
+        characters.close()
+        client.close()
+        ZdicDictPage.BASE_URL, BaiduDictPage.BASE_URL = saved_base_urls
+        generator_character_cards.DICT_PAGE_TYPE = saved_source
+        server.terminate()
+        server.join()
+    fetch_total = sum(fetcher.fetch_times.values())
+    parse_total = sum(parse_times.values())
+    latencies = [fetcher.fetch_times[url] + parse_times[url] for url in parse_times]
+    if not latencies:
+        # 综合来源在获取阶段内部请求并解析各来源的页面，只能统计各个页面的下载耗时
+        latencies = list(fetcher.fetch_times.values())
+    return {
+        'characters': len(characters),
+        'cards': cards,
+        'elapsed_seconds': round(elapsed, 3),
+        'characters_per_second': round(len(characters) / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': percentiles(latencies),
+        'fetch_ms': percentiles(list(fetcher.fetch_times.values())),
+        'parse_ms': percentiles(list(parse_times.values())),
+        'fetch_seconds_total': round(fetch_total, 3),
+        'parse_seconds_total': round(parse_total, 3),
+        'parse_share': round(parse_total / (fetch_total + parse_total), 4)
+        if fetch_total + parse_total else 0.0,
+        'peak_rss_mb': rss_self,
+        'peak_rss_children_mb': rss_children,
+    }
+
+
+def scenario_name(source: str,
+                  concurrency: int,
+                  parse_workers: Optional[int],
+                  latency: float,
+                  jitter: float,
+                  error_rate: float) -> str:
+    """
+    获取基准测试场景的名称，用作基线文件中的键。
+
+    :return: 基准测试场景的名称。
+    """
+    workers = 'auto' if parse_workers is None else parse_workers
+    return (f'{source}-c{concurrency}-p{workers}'
+            f'-l{latency:g}-j{jitter:g}-e{error_rate:g}')
+
+
+def compare(result: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    将基准测试结果与基线进行比较。
+
+    :param result: 基准测试结果。
+    :param baseline: 同一场景的基线。
+    :param tolerance: 允许的退化比例。
+    :return: 超出容差的退化描述；若没有退化则为空列表。
+    """
+    regressions = []
+    if result['characters_per_second'] < baseline['characters_per_second'] * (1 - tolerance):
+        regressions.append(f"throughput {result['characters_per_second']} chars/s "
+                           f"< baseline {baseline['characters_per_second']} chars/s")
+    for metric in ('latency_ms', 'parse_ms'):
+        current = result[metric]['p95']
+        expected = baseline[metric]['p95']
+        if current > expected * (1 + tolerance):
+            regressions.append(f'{metric} p95 {current} > baseline {expected}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='针对模拟字典网站的本地替身服务器，对汉字卡片生成器进行基准测试。')
+    parser.add_argument('input_files', nargs='*',
+                        help='汉字列表文件，默认为 data/character/*.txt')
+    parser.add_argument('--source', choices=['composite', 'zdic', 'baidu'], default='zdic',
+                        help='字典页面的来源，默认为zdic')
+    parser.add_argument('--concurrency', type=int, default=16, metavar='N',
+                        help='并发下载字典页面的线程数，默认为16')
+    parser.add_argument('--parse-workers', type=int, default=None, metavar='N',
+                        help='并行解析字典页面的进程数，默认为CPU的核数；为0表示不使用子进程')
+    parser.add_argument('--latency', type=float, default=0.05, metavar='SECONDS',
+                        help='替身服务器每个请求的平均延迟（秒），默认为0.05')
+    parser.add_argument('--jitter', type=float, default=0.02, metavar='SECONDS',
+                        help='替身服务器延迟的最大抖动（秒），默认为0.02')
+    parser.add_argument('--error-rate', type=float, default=0.0, metavar='RATE',
+                        help='替身服务器返回HTTP 503错误的概率，默认为0')
+    parser.add_argument('--repeat', type=int, default=3, metavar='N',
+                        help='重复运行的次数，取吞吐量居中的一次作为结果，默认为3')
+    parser.add_argument('--cards', default=DEFAULT_CARD_FILE, metavar='FILE',
+                        help='用于合成页面的汉字卡片表格文件，默认为 cards/characters.txt')
+    parser.add_argument('--recorded', metavar='FILE',
+                        help='记录了真实页面的页面缓存数据库文件')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_FILE, metavar='FILE',
+                        help='基线文件，默认为 generator/benchmark_baseline.json')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='将本次结果保存为该场景的基线，而不是与基线比较')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, metavar='RATIO',
+                        help=f'判定性能退化的容差比例，默认为{DEFAULT_TOLERANCE}')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING,
+                        format='%(asctime)s %(levelname)s - %(message)s')
+    logger = logging.getLogger(__name__)
+    input_files = args.input_files or sorted(glob.glob(DEFAULT_INPUT_FILES))
+    name = scenario_name(args.source, args.concurrency, args.parse_workers,
+                         args.latency, args.jitter, args.error_rate)
+    results = [run_benchmark(input_files, args.source, args.concurrency, args.parse_workers,
+                             args.latency, args.jitter, args.error_rate,
+                             args.cards, args.recorded)
+               for _ in range(max(1, args.repeat))]
+    results.sort(key=lambda r: r['characters_per_second'])
+    result = results[len(results) // 2]
+    print(json.dumps({name: result}, ensure_ascii=False, indent=2))
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baselines = json.load(file)
+    if args.save_baseline:
+        baselines[name] = result
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump(baselines, file, ensure_ascii=False, indent=2, sort_keys=True)
+            file.write('\n')
+        logger.warning('Saved baseline for scenario %s to %s', name, args.baseline)
+        return
+    if name not in baselines:
+        logger.warning('No baseline for scenario %s in %s', name, args.baseline)
+        return
+    regressions = compare(result, baselines[name], args.tolerance)
+    for regression in regressions:
+        logger.error('Regression in scenario %s: %s', name, regression)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import csv
+import json
+import os
+import re
+from typing import Dict, Iterator, List, NamedTuple, Set
+
+FIELD_SEPARATOR = '|'
+"""
+Anki卡片表格数据中字段之间的分隔符。
+"""
+
+QUOTE_CHAR = '"'
+"""
+Anki卡片表格数据中引用字段的引号。含有分隔符、换行符或以引号开头的字段值用引号
+括起来，其中的引号写作两个引号，这也是Anki导入文本文件时支持的格式。
+"""
+
+JSONL_EXTENSION = '.jsonl'
+"""
+JSON Lines格式的卡片文件的扩展名；其他扩展名的卡片文件均为以分隔符隔开的表格
+格式。
+"""
+
+_QUOTE_PATTERN = re.compile(r'^"|[|\n\r]')
+
+
+class CardRecord(NamedTuple):
+    """
+    此模型表示一张Anki卡片的数据。
+    """
+    fields: List[str]
+    """该卡片的字段值列表（不含标签），第一个字段为卡片的键，例如汉字。"""
+    tags: Set[str]
+    """该卡片的标签集合。"""
+
+    @property
+    def key(self) -> str:
+        """
+        获取此卡片的键。
+
+        :return: 此卡片的第一个字段的值。
+        """
+        return self.fields[0]
+
+
+def quote_field(value: str) -> str:
+    """
+    将字段值转义为Anki卡片表格数据中的字段。
+
+    :param value: 字段值。
+    :return: 若字段值含有分隔符、换行符或以引号开头，则返回用引号括起来的字段值；
+        否则原样返回。
+    """
+    if _QUOTE_PATTERN.search(value):
+        return QUOTE_CHAR + value.replace(QUOTE_CHAR, QUOTE_CHAR * 2) + QUOTE_CHAR
+    return value
+
+
+def format_line(record: CardRecord) -> str:
+    """
+    生成Anki卡片表格数据行。
+
+    :param record: 卡片的数据。
+    :return: 该卡片对应的Anki卡片表格数据行，最后一个字段为以空格隔开的标签，以
+        换行符结尾。
+    """
+    values = record.fields + [' '.join(record.tags)]
+    line = FIELD_SEPARATOR.join(values)
+    # 绝大多数行不需要转义，先整行检查，只有可能需要转义时才逐个字段检查
+    if line.count(FIELD_SEPARATOR) != len(values) - 1 \
+            or QUOTE_CHAR in line or '\n' in line or '\r' in line:
+        line = FIELD_SEPARATOR.join(map(quote_field, values))
+    return line + '\n'
+
+
+def read_cards(card_file: str) -> Dict[str, List[str]]:
+    """
+    读取已生成的Anki卡片表格文件。
+
+    :param card_file: Anki卡片表格文件名。
+    :return: 以每行第一个字段（即卡片的键，例如汉字）为键、以该行所有字段组成的
+        列表为值的字典，保持文件中各行的顺序；若文件不存在则返回空字典。
+    """
+    if not os.path.exists(card_file):
+        return {}
+    return {fields[0]: fields for fields in iter_cards(card_file)}
+
+
+def iter_cards(card_file: str) -> Iterator[List[str]]:
+    """
+    逐行读取Anki卡片表格文件。
+
+    文件的格式由扩展名决定：扩展名为 `JSONL_EXTENSION` 的文件每行为一个JSON对象，
+    否则为以分隔符隔开的表格数据。
+
+    :param card_file: Anki卡片表格文件名。
+    :return: 按文件中的顺序排列的每行所有字段组成的列表的惰性迭代器，最后一个字段
+        为以空格隔开的标签，跳过空行。
+    """
+    if card_file.endswith(JSONL_EXTENSION):
+        with open(card_file, 'r', encoding='utf-8') as file:
+            for line in file:
+                if line.strip():
+                    obj = json.loads(line)
+                    yield obj['fields'] + [' '.join(obj['tags'])]
+        return
+    with open(card_file, 'r', encoding='utf-8', newline='') as file:
+        for row in csv.reader(file, delimiter=FIELD_SEPARATOR, quotechar=QUOTE_CHAR):
+            if any(row):
+                yield row
+
+
+def iter_records(card_file: str) -> Iterator[CardRecord]:
+    """
+    逐张读取卡片文件中的卡片数据。
+
+    :param card_file: 卡片文件名，格式由扩展名决定，参见 `iter_cards()`。
+    :return: 按文件中的顺序排列的卡片数据的惰性迭代器，跳过空行。
+    """
+    for row in iter_cards(card_file):
+        yield CardRecord(row[:-1], set(row[-1].split()))
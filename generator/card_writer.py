@@ -0,0 +1,243 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import json
+import os
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Type
+
+from card_file import JSONL_EXTENSION, CardRecord, format_line
+from journal import replace_atomically
+
+DEFAULT_BATCH_SIZE = 1024
+"""
+卡片输出端默认的批量写入张数。
+"""
+
+_FILE_BUFFER_SIZE = 1024 * 1024
+
+
+class CardWriter(ABC):
+    """
+    此模型表示卡片数据的输出端。
+
+    卡片先缓存在内存中，每累积 `batch_size` 张批量写出一次；全部写完后调用
+    `close()` 提交。写出过程中发生异常时调用 `abort()` 放弃已写出的数据，已有的
+    输出文件保持不变。此对象可用作上下文管理器：正常退出时提交，因异常退出时放弃。
+
+    子类需实现 `_write_batch()`、`_commit()` 和 `_discard()` 方法。
+
+    此对象不是线程安全的，应只在一个线程中使用。
+    """
+    def __init__(self, path: str, batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        """
+        构造函数。
+
+        :param path: 输出文件名。
+        :param batch_size: 批量写入的张数。
+        """
+        if batch_size < 1:
+            raise ValueError('batch_size must be a positive integer')
+        self._path = path
+        self._batch_size = batch_size
+        self._buffer: List[CardRecord] = []
+        self._count = 0
+        self._closed = False
+
+    @property
+    def path(self) -> str:
+        """
+        获取输出文件名。
+
+        :return: 输出文件名。
+        """
+        return self._path
+
+    @property
+    def count(self) -> int:
+        """
+        获取已写入的卡片张数。
+
+        :return: 已写入的卡片张数，包括尚在缓存中的卡片。
+        """
+        return self._count
+
+    def write(self, record: CardRecord) -> None:
+        """
+        写入一张卡片。
+
+        :param record: 卡片的数据。
+        """
+        if self._closed:
+            raise ValueError(f'The card writer is closed: {self._path}')
+        self._buffer.append(record)
+        self._count += 1
+        if len(self._buffer) >= self._batch_size:
+            self._flush()
+
+    def write_all(self, records: Iterable[CardRecord]) -> None:
+        """
+        依次写入多张卡片。
+
+        :param records: 卡片的数据。
+        """
+        for record in records:
+            self.write(record)
+
+    def close(self) -> None:
+        """
+        写出缓存中的卡片并提交输出文件。
+        """
+        if self._closed:
+            return
+        self._flush()
+        self._closed = True
+        self._commit()
+
+    def abort(self) -> None:
+        """
+        放弃已写入的卡片，已有的输出文件保持不变。
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._buffer.clear()
+        self._discard()
+
+    def __enter__(self) -> 'CardWriter':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _flush(self) -> None:
+        """
+        批量写出缓存中的卡片。
+        """
+        if self._buffer:
+            self._write_batch(self._buffer)
+            self._buffer = []
+
+    @abstractmethod
+    def _write_batch(self, records: List[CardRecord]) -> None:
+        """
+        批量写出一批卡片。
+
+        :param records: 一批卡片的数据。
+        """
+
+    @abstractmethod
+    def _commit(self) -> None:
+        """
+        提交输出文件。
+        """
+
+    @abstractmethod
+    def _discard(self) -> None:
+        """
+        放弃已写出的数据。
+        """
+
+
+class _TempFileCardWriter(CardWriter):
+    """
+    此模型表示先写入临时文件、提交时再原子地替换输出文件的文本卡片输出端。
+
+    每批卡片格式化后拼接成一个字符串，只调用一次写入。子类需实现 `_format()` 方法。
+    """
+    def __init__(self, path: str, batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        super().__init__(path, batch_size)
+        self._temp_file = f'{path}.tmp'
+        self._file = open(self._temp_file, 'w', encoding='utf-8', newline='',
+                          buffering=_FILE_BUFFER_SIZE)
+
+    def _write_batch(self, records: List[CardRecord]) -> None:
+        self._file.write(''.join(map(self._format, records)))
+
+    def _commit(self) -> None:
+        self._file.close()
+        replace_atomically(self._temp_file, self._path)
+
+    def _discard(self) -> None:
+        self._file.close()
+        os.remove(self._temp_file)
+
+    @abstractmethod
+    def _format(self, record: CardRecord) -> str:
+        """
+        将一张卡片格式化为输出文件中的一行。
+
+        :param record: 卡片的数据。
+        :return: 以换行符结尾的一行。
+        """
+
+
+class TextCardWriter(_TempFileCardWriter):
+    """
+    此模型表示Anki卡片表格文件的输出端。
+
+    每张卡片一行，字段之间以 `card_file.FIELD_SEPARATOR` 隔开，最后一个字段为以
+    空格隔开的标签；含有分隔符或换行符的字段按 `card_file.quote_field()` 转义。
+    """
+    def _format(self, record: CardRecord) -> str:
+        return format_line(record)
+
+
+class JsonlCardWriter(_TempFileCardWriter):
+    """
+    此模型表示JSON Lines格式的卡片文件的输出端。
+
+    每张卡片一行，为形如 `{"fields": [...], "tags": [...]}` 的JSON对象，标签按
+    字典序排列。
+    """
+    def _format(self, record: CardRecord) -> str:
+        return json.dumps({'fields': record.fields, 'tags': sorted(record.tags)},
+                          ensure_ascii=False) + '\n'
+
+
+CARD_WRITERS: Dict[str, Type[CardWriter]] = {
+    '.txt': TextCardWriter,
+    '.csv': TextCardWriter,
+    '.tsv': TextCardWriter,
+    JSONL_EXTENSION: JsonlCardWriter,
+}
+"""
+以输出文件的扩展名为键的卡片输出端类型。
+
+Anki牌组包（`.apkg`）需要牌组名称和笔记类型，不能只由文件名确定，因此不在此
+注册，而是由 `apkg_exporter.ApkgCardWriter` 单独导出。
+"""
+
+
+def get_card_writer_class(path: str) -> Type[CardWriter]:
+    """
+    按输出文件的扩展名获取对应的卡片输出端类型。
+
+    :param path: 输出文件名。
+    :return: 对应的卡片输出端类型。
+    :raise ValueError: 若 `CARD_WRITERS` 中没有该扩展名。
+    """
+    extension = os.path.splitext(path)[1].lower()
+    writer_class = CARD_WRITERS.get(extension)
+    if writer_class is None:
+        raise ValueError(f'Unsupported card file extension "{extension}": {path}; '
+                         f'expected one of {", ".join(CARD_WRITERS)}')
+    return writer_class
+
+
+def open_card_writer(path: str, batch_size: int = DEFAULT_BATCH_SIZE) -> CardWriter:
+    """
+    按输出文件的扩展名打开对应的卡片输出端。
+
+    :param path: 输出文件名。
+    :param batch_size: 批量写入的张数。
+    :return: 对应的卡片输出端，调用者用完后需关闭。
+    :raise ValueError: 若不支持该扩展名，见 `get_card_writer_class()`。
+    """
+    return get_card_writer_class(path)(path, batch_size)
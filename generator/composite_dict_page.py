@@ -0,0 +1,170 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import json
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+from dict_page import DEFAULT_HEDGE_DELAY, DictPage, load_dict_page_class
+from extraction import DictRecord
+from http_client import FetchError
+from metrics import default_metrics
+from page_fetcher import PageFetcher
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _lookup_executor() -> ThreadPoolExecutor:
+    """
+    获取进程内共享的、用于查询各个字典来源的线程池。
+
+    :return: 进程内共享的线程池。
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=32,
+                                           thread_name_prefix='CompositeDictPage')
+        return _executor
+
+
+class CompositeDictPage(DictPage):
+    """
+    此模型表示综合多个字典来源得到的指定汉字的信息。
+
+    各来源按 `SOURCES` 中的顺序排列优先级，其中当前不可用的来源（例如未打开的
+    本地字典索引）被跳过。查询时采用对冲请求的策略：先只查询
+    第一个来源；若它在延迟预算 `HEDGE_DELAY` 内没有返回结果，或者查询失败，再
+    查询下一个来源，并采用最先返回的结果。若得到的结果中有字段缺失（例如拼音或
+    读音），则继续查询其余来源，按优先级用它们的结果逐个补全缺失的字段。
+
+    是否需要补全字段取决于解析的结果，因此各来源的页面在获取阶段即被解析，
+    `fetch_content()` 返回的是合并后的汉字信息。这些解析在查询线程中进行，不使用
+    解析进程池，且结果取决于哪个来源先返回，因此此来源不是默认的字典来源。被放弃的较慢的请求仍会在后台
+    完成，其页面会写入页面缓存。各来源的查询优先使用记录缓存中的提取结果。
+    """
+    SOURCE = 'composite'
+
+    SOURCES: List[str] = ['zdic', 'baidu', 'local']
+    """
+    参与综合的字典来源的名称（参见 `dict_page.DICT_PAGE_CLASSES`），按优先级从高
+    到低排列。本地字典索引的优先级最低，只在用 `local_dict_page.open_index()` 打开
+    索引后作为后备来源参与综合。
+    """
+
+    HEDGE_DELAY = DEFAULT_HEDGE_DELAY
+    """
+    延迟预算，单位为秒；一个来源在此时间内没有返回结果时，同时查询下一个来源。
+    """
+
+    # 各来源的页面在获取阶段即已解析，合并后的结果无需再缓存，也无需在解析进程中提取
+    EXTRACTOR_VERSION = None
+    EXTRACT_INLINE = True
+
+    def __init__(self, char: str, fetcher: Optional[PageFetcher] = None) -> None:
+        """
+        构造函数。
+
+        :param char: 指定的汉字。
+        :param fetcher: 用于获取页面内容的获取器；若为 `None` 则直接从网络下载。
+        """
+        super().__init__(char, fetcher)
+        page_classes = [load_dict_page_class(source) for source in self.SOURCES]
+        self._pages = [page_class(char, self._fetcher)
+                       for page_class in page_classes if page_class.is_available()]
+
+    def fetch_content(self) -> bytes:
+        metrics = default_metrics()
+        executor = _lookup_executor()
+        pending: Dict[Future, int] = {}
+        records: Dict[int, DictRecord] = {}
+        errors = []
+        started = 0
+
+        def start_next(reason: Optional[str]) -> None:
+            nonlocal started
+            page = self._pages[started]
+            if reason is not None:
+                metrics.inc('hanzi_secondary_requests_total', source=page.SOURCE, reason=reason)
+            pending[executor.submit(self._lookup, page)] = started
+            started += 1
+
+        start_next(None)
+        while pending or started < len(self._pages):
+            merged = self._merge(records)
+            if merged is not None and not merged.missing_fields():
+                break
+            if started < len(self._pages):
+                if records:
+                    # 已有结果但字段不全，补全字段不受延迟预算的限制
+                    start_next('fill')
+                    continue
+                if not pending:
+                    # 之前的来源均已失败
+                    start_next('fallback')
+                    continue
+            timeout = self.HEDGE_DELAY if started < len(self._pages) else None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                # 超出延迟预算仍没有结果，同时查询下一个来源
+                start_next('hedge')
+                continue
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    records[index] = future.result()
+                except Exception as e:
+                    source = self._pages[index].SOURCE
+                    errors.append(f'{source}: {e}')
+                    metrics.inc('hanzi_source_failures_total', source=source)
+                    self._logger.warning('Failed to look up character "%s" in %s: %s',
+                                         self._char, source, e)
+        merged = self._merge(records)
+        if merged is None:
+            raise FetchError(f'All sources failed for character "{self._char}": '
+                             + '; '.join(errors))
+        preferred = records[min(records)]
+        for name, value, original in zip(DictRecord._fields, merged, preferred):
+            if value and not original:
+                metrics.inc('hanzi_filled_fields_total', field=name)
+        return json.dumps(list(merged), ensure_ascii=False).encode('utf-8')
+
+    @classmethod
+    def extract_record(cls,
+                       char: str,
+                       content: bytes,
+                       timings: Optional[Dict[str, float]] = None) -> DictRecord:
+        return DictRecord(*json.loads(content.decode('utf-8')))
+
+    @staticmethod
+    def _lookup(page: DictPage) -> DictRecord:
+        """
+        查询一个字典来源中指定汉字的信息。
+
+        :param page: 该来源中指定汉字的字典页面。
+        :return: 从该页面中提取出的汉字信息。
+        :raise FetchError: 若无法获取该页面。
+        """
+        return page.lookup()
+
+    @staticmethod
+    def _merge(records: Dict[int, DictRecord]) -> Optional[DictRecord]:
+        """
+        按优先级合并各来源的查询结果，每个字段取优先级最高的非空值。
+
+        :param records: 以来源的优先级序号为键的查询结果。
+        :return: 合并后的汉字信息；若没有任何结果则返回 `None`。
+        """
+        if not records:
+            return None
+        ordered = [records[index] for index in sorted(records)]
+        return DictRecord(*(next((value for value in values if value), values[0])
+                            for values in zip(*ordered)))
+
+    def _get_page_url(self, ch) -> str:
+        return f'composite:{ch}'
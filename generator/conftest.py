@@ -0,0 +1,11 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import os
+import sys
+
+# 各脚本以同目录下的模块名相互导入，从仓库根目录运行测试时也需能找到它们
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -0,0 +1,277 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import logging
+import os
+import re
+import sqlite3
+import tempfile
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from metrics import default_metrics
+
+ITEM_SEPARATORS = re.compile(r'[、,\s]+')
+"""
+输入文件中汉字或生词之间的分隔符：中文顿号、英文逗号或空白字符。
+"""
+
+DEFAULT_MAX_ITEMS = 100000
+"""
+语料在内存中聚合的默认最大条目数，超出后转存到磁盘上的临时数据库中。
+"""
+
+Entry = Tuple[str, str, str]
+"""
+语料中的一个条目：`(条目, 书籍名称, 章节名称)`。
+"""
+
+
+def _read_lines(input_files: List[str]) -> Iterator[Tuple[str, str, str]]:
+    """
+    逐行读取输入文件，并跟踪每行所属的书籍和章节。
+
+    书籍名称为输入文件去除后缀的文件名；章节名称为该行之前最近的以 `#` 开头的
+    行的内容。
+
+    :param input_files: 输入文件的文件名列表。
+    :return: `(去除首尾空白的行, 书籍名称, 章节名称)` 的迭代器；章节行本身也会
+        返回，其章节名称为新的章节名称。
+    """
+    logger = logging.getLogger(__name__)
+    for input_file in input_files:
+        logger.info('Processing input file: %s', input_file)
+        book = os.path.splitext(os.path.basename(input_file))[0]
+        chapter = ''
+        with open(input_file, 'r', encoding='utf-8') as file:
+            for line in file:
+                line = line.strip()
+                if line.startswith('#'):
+                    chapter = line[1:].strip()
+                yield line, book, chapter
+
+
+def read_items(input_files: List[str]) -> Iterator[Entry]:
+    """
+    流式地读取输入文件中以分隔符隔开的条目（汉字或生词）。
+
+    条目之间以中文顿号、英文逗号或空白字符（包括换行）隔开。
+
+    :param input_files: 输入文件的文件名列表。
+    :return: 按文件中的顺序排列的 `(条目, 书籍名称, 章节名称)` 的惰性迭代器，
+        同一条目可能出现多次。
+    """
+    for line, book, chapter in _read_lines(input_files):
+        if line and not line.startswith('#'):
+            for item in ITEM_SEPARATORS.split(line):
+                if item:
+                    yield item, book, chapter
+
+
+def read_paragraphs(input_files: List[str]) -> Iterator[Entry]:
+    """
+    流式地读取输入文件中以空行或章节行隔开的段落（句子）。
+
+    同一段落中的多行首尾相接拼成一个条目。
+
+    :param input_files: 输入文件的文件名列表。
+    :return: 按文件中的顺序排列的 `(段落, 书籍名称, 章节名称)` 的惰性迭代器，
+        同一段落可能出现多次。
+    """
+    paragraph = ''
+    book = chapter = ''
+    for line, line_book, line_chapter in _read_lines(input_files):
+        if paragraph and (not line or line.startswith('#') or line_book != book):
+            yield paragraph, book, chapter
+            paragraph = ''
+        if line and not line.startswith('#'):
+            paragraph += line
+        book, chapter = line_book, line_chapter
+    if paragraph:
+        yield paragraph, book, chapter
+
+
+class Corpus:
+    """
+    此模型表示从输入文件中流式读取的语料，以及每个条目的标签。
+
+    条目的标签由其所属的书籍名称和章节名称构成，同一条目出现在多个章节中时有多个
+    标签。语料可以通过 `new_items()` 边读取边处理：每个条目第一次出现时立即返回，
+    因此下游（例如下载字典页面）不必等待所有输入文件读完；条目的完整标签则要在
+    语料读完后才能确定，通过 `items()` 获取。
+
+    条目数超过 `max_items` 时，已聚合的条目和标签会转存到磁盘上的临时SQLite数据库
+    中，之后的聚合也在数据库中进行，因此内存占用与语料的大小无关。
+
+    此对象不是线程安全的，应只在一个线程中使用。
+    """
+    def __init__(self,
+                 entries: Iterable[Entry],
+                 kind: str,
+                 max_items: int = DEFAULT_MAX_ITEMS) -> None:
+        """
+        构造函数。
+
+        :param entries: `(条目, 书籍名称, 章节名称)` 的迭代器，由 `read_items()`
+            或 `read_paragraphs()` 返回。
+        :param kind: 条目的类型，例如 `'character'`，用作指标的标签。
+        :param max_items: 在内存中聚合的最大条目数。
+        """
+        self._entries = iter(entries)
+        self._kind = kind
+        self._max_items = max_items
+        self._tags: Dict[str, Set[str]] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_dir: Optional[tempfile.TemporaryDirectory] = None
+        self._count = 0
+        self._exhausted = False
+        self._elapsed = 0.0
+
+    def new_items(self) -> Iterator[str]:
+        """
+        继续读取语料，每个条目第一次出现时返回该条目。
+
+        :return: 按第一次出现的顺序排列的条目的惰性迭代器。
+        """
+        while not self._exhausted:
+            start = time.perf_counter()
+            try:
+                item, book, chapter = next(self._entries)
+            except StopIteration:
+                self._exhausted = True
+                metrics = default_metrics()
+                metrics.observe('hanzi_collect_seconds',
+                                self._elapsed + time.perf_counter() - start, kind=self._kind)
+                metrics.inc('hanzi_collected_items_total', self._count, kind=self._kind)
+                return
+            is_new = self._add(item, f'{book}{chapter}')
+            self._elapsed += time.perf_counter() - start
+            if is_new:
+                yield item
+
+    def read_all(self) -> int:
+        """
+        读完剩余的语料。
+
+        :return: 语料中不同条目的总数。
+        """
+        for _ in self.new_items():
+            pass
+        return self._count
+
+    def items(self) -> Iterator[Tuple[str, Set[str]]]:
+        """
+        读完剩余的语料，并返回所有条目及其标签。
+
+        :return: 按第一次出现的顺序排列的 `(条目, 标签集合)` 的迭代器。
+        """
+        self.read_all()
+        if self._db is None:
+            yield from self._tags.items()
+            return
+        cursor = self._db.execute('SELECT item, tag FROM tags ORDER BY seq')
+        item = None
+        tags = set()
+        for row_item, tag in cursor:
+            if row_item != item:
+                if item is not None:
+                    yield item, tags
+                item, tags = row_item, set()
+            tags.add(tag)
+        if item is not None:
+            yield item, tags
+
+    def __iter__(self) -> Iterator[str]:
+        """
+        读完剩余的语料，并返回所有条目。
+
+        :return: 按第一次出现的顺序排列的条目的迭代器。
+        """
+        return (item for item, _ in self.items())
+
+    def __len__(self) -> int:
+        """
+        获取已读取的不同条目的个数。
+
+        :return: 已读取的不同条目的个数；语料读完后即为语料中不同条目的总数。
+        """
+        return self._count
+
+    def __contains__(self, item: str) -> bool:
+        """
+        判断已读取的语料中是否包含指定的条目。
+
+        :param item: 指定的条目。
+        :return: 若已读取的语料中包含该条目，则返回 `True`。
+        """
+        if self._db is None:
+            return item in self._tags
+        return self._db.execute('SELECT 1 FROM items WHERE item = ?',
+                                (item,)).fetchone() is not None
+
+    def close(self) -> None:
+        """
+        删除转存到磁盘上的临时数据库。
+        """
+        if self._db is not None:
+            self._db.close()
+            self._db_dir.cleanup()
+            self._db = None
+
+    def _add(self, item: str, tag: str) -> bool:
+        """
+        记录条目的一个标签。
+
+        :param item: 条目。
+        :param tag: 该条目的标签。
+        :return: 若该条目是第一次出现，则返回 `True`。
+        """
+        if self._db is None:
+            tags = self._tags.get(item)
+            if tags is not None:
+                tags.add(tag)
+                return False
+            if self._count < self._max_items:
+                self._tags[item] = {tag}
+                self._count += 1
+                return True
+            self._spill()
+        is_new = self._db.execute('INSERT OR IGNORE INTO items (item, seq) VALUES (?, ?)',
+                                  (item, self._count)).rowcount == 1
+        if is_new:
+            self._count += 1
+        self._db.execute('INSERT OR IGNORE INTO tags (item, tag, seq) '
+                         'SELECT ?, ?, seq FROM items WHERE item = ?', (item, tag, item))
+        return is_new
+
+    def _spill(self) -> None:
+        """
+        将内存中聚合的条目和标签转存到磁盘上的临时数据库中。
+        """
+        logging.getLogger(__name__).info('Spilling %d %s items to disk.',
+                                         self._count, self._kind)
+        self._db_dir = tempfile.TemporaryDirectory(prefix='hanzi-corpus-')
+        self._db = sqlite3.connect(os.path.join(self._db_dir.name, 'corpus.sqlite3'),
+                                   check_same_thread=False)
+        self._db.executescript('''
+            PRAGMA journal_mode=OFF;
+            PRAGMA synchronous=OFF;
+            CREATE TABLE items (item TEXT PRIMARY KEY, seq INTEGER NOT NULL);
+            CREATE TABLE tags (
+                item TEXT NOT NULL,
+                tag  TEXT NOT NULL,
+                seq  INTEGER NOT NULL,
+                PRIMARY KEY (item, tag)
+            );
+            CREATE INDEX tags_seq ON tags (seq);
+        ''')
+        self._db.executemany('INSERT INTO items (item, seq) VALUES (?, ?)',
+                             ((item, seq) for seq, item in enumerate(self._tags)))
+        self._db.executemany('INSERT INTO tags (item, tag, seq) VALUES (?, ?, ?)',
+                             ((item, tag, seq)
+                              for seq, (item, tags) in enumerate(self._tags.items())
+                              for tag in tags))
+        self._tags = {}
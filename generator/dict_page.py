@@ -4,29 +4,83 @@
 #     All rights reserved.                                                     #
 #                                                                              #
 # ##############################################################################
+import importlib
 import logging
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import Dict, Optional, Type
 
-import requests
-from bs4 import BeautifulSoup
+from extraction import DictRecord, ExtractionPlan
+from http_client import FetchError
+from page_cache import content_digest
+from page_fetcher import PageFetcher
+
+DICT_PAGE_CLASSES: Dict[str, str] = {
+    'composite': 'composite_dict_page:CompositeDictPage',
+    'zdic': 'zdic_dict_page:ZdicDictPage',
+    'baidu': 'baidu_dict_page:BaiduDictPage',
+    'local': 'local_dict_page:LocalDictPage',
+}
+"""
+以字典来源的名称为键、以 `模块名:类名` 形式的字典页面类型为值的注册表。
+
+字典页面的模块只在第一次用到该来源时才导入，因此只使用缓存或本地索引时不会
+导入网页解析等较重的模块。
+"""
+
+DEFAULT_HEDGE_DELAY = 2.0
+"""
+综合来源默认的延迟预算，单位为秒，参见 `composite_dict_page.CompositeDictPage`。
+"""
 
 
 class DictPage(ABC):
     """
     此模型表示指定汉字对应的字典网页页面内容。
+
+    子类需定义字典页面的来源名称 `SOURCE` 和页面提取方案 `EXTRACTION_PLAN`，
+    并实现 `_get_page_url()` 方法。
+    """
+    SOURCE = ''
+    """
+    字典页面的来源名称，由子类定义，用作页面缓存的键的一部分。
+    """
+
+    BASE_URL = ''
+    """
+    字典网站的根URL，由子类定义。基准测试时可将其替换为本地替身服务器的地址。
+    """
+
+    EXTRACTION_PLAN: ExtractionPlan = None
+    """
+    字典页面的提取方案，由子类定义。
+    """
+
+    EXTRACTOR_VERSION: Optional[int] = 1
     """
-    def __init__(self, char: str) -> None:
+    字典页面提取方案的版本号，与提取器的类名一起用作记录缓存的键的一部分。修改
+    提取规则（包括各字段的提取函数）后必须递增此版本号，使记录缓存中旧的提取结果
+    失效，之后将从缓存的页面内容中重新提取，而无需重新下载页面。若为 `None` 则
+    不缓存提取结果。
+    """
+
+    EXTRACT_INLINE: bool = False
+    """
+    提取代价是否很小；若为 `True`，则批量查询时直接在获取页面的线程中提取，而不
+    提交到解析进程。
+    """
+
+    def __init__(self, char: str, fetcher: Optional[PageFetcher] = None) -> None:
         """
         构造函数。
 
         :param char: 指定的汉字。
+        :param fetcher: 用于获取页面内容的获取器；若为 `None` 则直接从网络下载。
         """
         self._char = char
-        self._unicodeHex = hex(ord(char)).upper()[2:]
         self._url = self._get_page_url(char)
+        self._fetcher = fetcher if fetcher is not None else PageFetcher()
         self._logger = logging.getLogger(self.__class__.__name__)
-        self._soup = None
+        self._record = None
 
     @property
     def char(self) -> str:
@@ -43,7 +97,7 @@ class DictPage(ABC):
 
         :return: 指定汉字的Unicode编码的大写16进制表示。
         """
-        return self._unicodeHex
+        return hex(ord(self._char)).upper()[2:]
 
     @property
     def url(self) -> str:
@@ -54,19 +108,30 @@ class DictPage(ABC):
         """
         return self._url
 
+    def get_record(self) -> DictRecord:
+        """
+        获取从字典网页页面中提取出的指定汉字的信息。
+
+        页面只会被下载和解析一次，之后的调用直接返回已提取的结果。
+
+        :return: 从字典网页页面中提取出的指定汉字的信息。
+        :raise FetchError: 若无法获取该汉字对应的字典网页页面。
+        """
+        if self._record is None:
+            self._record = self.lookup()
+            missing = self._record.missing_fields()
+            if missing:
+                self._logger.error('Failed to get %s for character "%s": %s',
+                                   ', '.join(missing), self._char, self._url)
+        return self._record
+
     def get_image(self) -> Optional[str]:
         """
         获取指定汉字的图片的URL。
 
         :return: 该汉字的图片的URL。
         """
-        if self._soup is None:
-            self._soup = self._get_soup()
-        result = self._get_image(self._soup)
-        if result is None or result == '':
-            self._logger.error('Failed to get image for character "%s": %s',
-                               self._char, self._url)
-        return result
+        return self.get_record().image
 
     def get_pinyin(self) -> Optional[str]:
         """
@@ -74,13 +139,7 @@ class DictPage(ABC):
 
         :return: 该汉字的拼音。
         """
-        if self._soup is None:
-            self._soup = self._get_soup()
-        result = self._get_pinyin(self._soup)
-        if result is None or result == '':
-            self._logger.error('Failed to get pinyin for character "%s": %s',
-                               self._char, self._url)
-        return result
+        return self.get_record().pinyin
 
     def get_pronounce(self) -> Optional[str]:
         """
@@ -88,13 +147,7 @@ class DictPage(ABC):
 
         :return: 该汉字的读音音频文件的URL。
         """
-        if self._soup is None:
-            self._soup = self._get_soup()
-        result = self._get_pronounce(self._soup)
-        if result is None or result == '':
-            self._logger.error('Failed to get pronounce for character "%s": %s',
-                               self._char, self._url)
-        return result
+        return self.get_record().pronounce
 
     def get_definitions(self) -> Optional[str]:
         """
@@ -102,65 +155,114 @@ class DictPage(ABC):
 
         :return: 该汉字的解释。
         """
-        if self._soup is None:
-            self._soup = self._get_soup()
-        result = self._get_definitions(self._soup)
-        if result is None or result == '':
-            self._logger.error('Failed to get definitions for character "%s": %s',
-                               self._char, self._url)
-        return result
+        return self.get_record().definitions
 
-    def _get_soup(self) -> BeautifulSoup:
+    def lookup(self) -> DictRecord:
         """
-        获取指定汉字对应的字典网页页面解析后的 BeautifulSoup 对象。
+        查询指定汉字的信息。
+
+        优先使用记录缓存中由当前版本的提取器从页面的当前内容中提取出的记录；未命中
+        时获取并解析页面，再将提取结果写入记录缓存。
 
-        :return: 指定汉字对应的字典网页页面解析后的 BeautifulSoup 对象。
+        获取或解析页面时发生的其他异常（例如本地索引或缓存数据库的错误）也转换为
+        `FetchError`，因此调用者只需按查询失败处理，不会因个别汉字中断整个批量查询。
+
+        :return: 从字典网页页面中提取出的指定汉字的信息。
+        :raise FetchError: 若无法获取或解析该汉字对应的字典网页页面。
         """
-        response = requests.get(self._url)
-        content = response.content
-        return BeautifulSoup(content, 'html.parser')
+        try:
+            record = self.get_cached_record()
+            if record is None:
+                content = self.fetch_content()
+                record = self.extract_record(self._char, content)
+                self.put_cached_record(content_digest(content), record)
+        except FetchError:
+            raise
+        except Exception as e:
+            raise FetchError(f'Failed to look up "{self._char}" in {self.SOURCE}: '
+                             f'{type(e).__name__}: {e}') from e
+        return record
 
-    @abstractmethod
-    def _get_page_url(self, ch) -> str:
+    def get_cached_record(self) -> Optional[DictRecord]:
         """
-        获取指定汉字对应的字典网页页面的URL。
+        从记录缓存中读取由当前版本的提取器从页面的当前内容中提取出的记录。
 
-        :param ch: 指定的汉字。
-        :return: 该汉字对应的字典网页页面的URL。
+        :return: 缓存的记录；若未命中或不缓存提取结果，则返回 `None`。
         """
+        if self.EXTRACTOR_VERSION is None:
+            return None
+        record = self._fetcher.get_record(self.SOURCE, self._url, self.__class__.__name__,
+                                          self.EXTRACTOR_VERSION, self._char)
+        return DictRecord(*record) if record is not None else None
 
-    @abstractmethod
-    def _get_image(self, soup: BeautifulSoup) -> Optional[str]:
+    def put_cached_record(self, digest: str, record: DictRecord) -> None:
         """
-        获取指定汉字的图片的URL。
+        将由当前版本的提取器提取出的记录写入记录缓存。
 
-        :param soup: 解析后的指定汉字对应的字典网页页面内容。
-        :return: 该汉字的图片的URL。
+        :param digest: 提取记录所用的页面内容的摘要，由 `content_digest()` 计算。
+        :param record: 提取出的记录。
         """
+        if self.EXTRACTOR_VERSION is not None:
+            self._fetcher.put_record(digest, self.__class__.__name__,
+                                     self.EXTRACTOR_VERSION, self._char, list(record))
 
-    @abstractmethod
-    def _get_pinyin(self, soup: BeautifulSoup) -> Optional[str]:
+    def fetch_content(self) -> bytes:
         """
-        获取指定汉字的拼音。
+        获取指定汉字对应的字典网页页面的原始内容。
 
-        :param soup: 解析后的指定汉字对应的字典网页页面内容。
-        :return: 该汉字的拼音。
+        :return: 指定汉字对应的字典网页页面的原始内容。
+        :raise FetchError: 若无法获取该页面。
         """
+        return self._fetcher.fetch(self.SOURCE, self._url)
 
-    @abstractmethod
-    def _get_pronounce(self, soup: BeautifulSoup) -> Optional[str]:
+    @classmethod
+    def is_available(cls) -> bool:
         """
-        获取指定汉字的读音。
+        判断此字典来源当前是否可用。
 
-        :param soup: 解析后的指定汉字对应的字典网页页面内容。
-        :return: 该汉字的读音音频文件的URL。
+        :return: 此字典来源当前是否可用；默认总是可用，需要事先准备数据的来源
+            （例如本地字典索引）可覆盖此方法。
+        """
+        return True
+
+    @classmethod
+    def extract_record(cls,
+                       char: str,
+                       content: bytes,
+                       timings: Optional[Dict[str, float]] = None) -> DictRecord:
         """
+        从字典网页页面的原始内容中提取指定汉字的信息。
+
+        此方法不访问网络，也不依赖页面对象的状态。
+
+        :param char: 指定的汉字。
+        :param content: 该汉字对应的字典网页页面的原始内容。
+        :param timings: 若不为 `None`，则将每个字段的提取耗时（秒）以字段名称为
+            键记录到此字典中。
+        :return: 从该页面中提取出的汉字信息。
+        """
+        return cls.EXTRACTION_PLAN.extract(char, content, timings)
 
     @abstractmethod
-    def _get_definitions(self, soup: BeautifulSoup) -> Optional[str]:
+    def _get_page_url(self, ch) -> str:
         """
-        获取指定汉字的释义。
+        获取指定汉字对应的字典网页页面的URL。
 
-        :param soup: 解析后的指定汉字对应的字典网页页面内容。
-        :return: 该汉字的释义。
+        :param ch: 指定的汉字。
+        :return: 该汉字对应的字典网页页面的URL。
         """
+
+
+def load_dict_page_class(source: str) -> Type[DictPage]:
+    """
+    获取指定字典来源的字典页面类型，第一次调用时导入其所在的模块。
+
+    :param source: 字典来源的名称，必须是 `DICT_PAGE_CLASSES` 中的键。
+    :return: 该来源的字典页面类型。
+    :raise ValueError: 若该来源未注册。
+    """
+    target = DICT_PAGE_CLASSES.get(source)
+    if target is None:
+        raise ValueError(f'Unknown dict page type: {source}')
+    module_name, class_name = target.split(':')
+    return getattr(importlib.import_module(module_name), class_name)
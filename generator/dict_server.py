@@ -0,0 +1,253 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import argparse
+import html
+import logging
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, quote, unquote, urlparse
+
+from card_file import read_cards
+from page_cache import PageCache
+
+DEFAULT_CARD_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 '..', 'cards', 'characters.txt')
+"""
+默认用于合成替身页面的汉字卡片表格文件。
+"""
+
+
+class FixturePages:
+    """
+    此模型表示本地替身服务器提供的汉典和百度汉语的固定页面。
+
+    页面优先从页面缓存（即以前真实下载并记录下来的页面）中读取；缓存中没有的页面，
+    则根据已生成的汉字卡片表格数据，按汉典或百度汉语的页面结构合成。
+    """
+    def __init__(self, card_file: str, cache: Optional[PageCache] = None) -> None:
+        """
+        构造函数。
+
+        :param card_file: 用于合成页面的汉字卡片表格文件。
+        :param cache: 记录了真实页面的页面缓存；若为 `None` 则只使用合成的页面。
+        """
+        self._cards = read_cards(card_file)
+        self._cache = cache
+
+    def get(self, source: str, ch: str) -> Optional[bytes]:
+        """
+        获取指定来源中指定汉字的页面。
+
+        :param source: 页面的来源，`'zdic'` 或 `'baidu'`。
+        :param ch: 指定的汉字。
+        :return: 页面内容；若既没有记录的页面，也无法合成页面，则返回 `None`。
+        """
+        if self._cache is not None:
+            url = {
+                'zdic': f'https://www.zdic.net/hans/{quote(ch)}',
+                'baidu': f'https://dict.baidu.com/s?wd={quote(ch)}&ptype=zici',
+            }[source]
+            content = self._cache.get(source, url, allow_stale=True)
+            if content is not None:
+                return content
+        fields = self._cards.get(ch)
+        if fields is None or len(fields) < 5:
+            return None
+        if source == 'zdic':
+            return self._render_zdic(fields).encode('utf-8')
+        return self._render_baidu(fields).encode('utf-8')
+
+    @staticmethod
+    def _definitions(fields: List[str]) -> List[str]:
+        """
+        从汉字卡片表格数据中取出去掉编号的各条释义。
+
+        :param fields: 汉字卡片表格数据的各个字段。
+        :return: 经HTML转义的各条释义。
+        """
+        return [html.escape(d.split('. ', 1)[-1]) for d in fields[4].split('<br>')]
+
+    def _render_zdic(self, fields: List[str]) -> str:
+        """
+        按汉典页面的结构合成页面。
+
+        :param fields: 汉字卡片表格数据的各个字段。
+        :return: 合成的页面。
+        """
+        items = ''.join(f'<li>{d}</li>' for d in self._definitions(fields))
+        mp3 = fields[3].replace('https:', '', 1)
+        return ('<!DOCTYPE html><html><head><meta charset="utf-8">'
+                f'<title>{fields[0]}的解释|汉典</title></head><body>'
+                '<header><nav><a href="/">汉典</a></nav></header>'
+                '<div class="res_c_center"><table class="dsk"><tr><td>'
+                f'<span class="dicpy">{fields[1]} <span class="ptr">'
+                f'<a class="audio_play_button" data-src-mp3="{mp3}"></a></span></span>'
+                '</td></tr></table>'
+                '<div class="content definitions jnr">'
+                f'<ol>{items}</ol></div></div>'
+                '<footer><p>Copyright zdic.net</p></footer></body></html>')
+
+    def _render_baidu(self, fields: List[str]) -> str:
+        """
+        按百度汉语页面的结构合成页面。
+
+        :param fields: 汉字卡片表格数据的各个字段。
+        :return: 合成的页面。
+        """
+        items = ''.join(f'<p>{d}</p>' for d in self._definitions(fields))
+        return ('<!DOCTYPE html><html><head><meta charset="utf-8">'
+                f'<title>{fields[0]} - 百度汉语</title></head><body>'
+                f'<div id="pinyin"><span>[<b>{fields[1]}</b>]'
+                f'<a class="mp3-play" url="{fields[3]}"></a></span></div>'
+                '<div id="basicmean-wrapper"><div class="tab-content"><dl><dd>'
+                f'{items}</dd></dl></div></div></body></html>')
+
+
+class DictServer(ThreadingHTTPServer):
+    """
+    此模型表示模拟汉典和百度汉语网站的本地替身HTTP服务器。
+
+    服务器在 `/zdic/hans/<汉字>` 和 `/baidu/s?wd=<汉字>` 上提供固定页面，并可以
+    模拟网络延迟、延迟抖动、服务端错误（以一定概率返回HTTP 503）和限流（同时处理
+    的请求过多时返回带 `Retry-After` 头的HTTP 429）。将
+    `ZdicDictPage.BASE_URL` 和 `BaiduDictPage.BASE_URL` 分别设置为
+    `<服务器地址>/zdic` 和 `<服务器地址>/baidu` 即可让生成器访问此服务器。
+    """
+    daemon_threads = True
+
+    def __init__(self,
+                 pages: FixturePages,
+                 host: str = '127.0.0.1',
+                 port: int = 0,
+                 latency: float = 0.0,
+                 jitter: float = 0.0,
+                 error_rate: float = 0.0,
+                 max_concurrency: int = 0) -> None:
+        """
+        构造函数。
+
+        :param pages: 服务器提供的固定页面。
+        :param host: 监听的主机地址。
+        :param port: 监听的端口，为0表示自动选择一个空闲端口。
+        :param latency: 每个请求的平均延迟，单位为秒。
+        :param jitter: 延迟的最大抖动，单位为秒；实际延迟在
+            `[latency - jitter, latency + jitter]` 之间均匀分布。
+        :param error_rate: 返回HTTP 503错误的概率，取值范围为 `[0, 1]`。
+        :param max_concurrency: 同时处理的请求数的上限，超出时返回HTTP 429；为0表示
+            不限制。
+        """
+        super().__init__((host, port), _DictRequestHandler)
+        self.pages = pages
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        """
+        获取此服务器的根URL。
+
+        :return: 此服务器的根URL。
+        """
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+
+class _DictRequestHandler(BaseHTTPRequestHandler):
+    """
+    本地替身服务器的请求处理器。
+    """
+    server: DictServer
+
+    def log_message(self, format, *args) -> None:
+        logging.getLogger(DictServer.__name__).debug(format, *args)
+
+    def do_GET(self) -> None:
+        with self.server.lock:
+            self.server.in_flight += 1
+            overloaded = 0 < self.server.max_concurrency < self.server.in_flight
+        try:
+            if overloaded:
+                self._send(429, b'Too Many Requests', 'text/plain; charset=utf-8',
+                           {'Retry-After': '1'})
+            else:
+                self._serve()
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+    def _serve(self) -> None:
+        delay = self.server.latency + random.uniform(-self.server.jitter, self.server.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if random.random() < self.server.error_rate:
+            self._send(503, b'Service Unavailable', 'text/plain; charset=utf-8')
+            return
+        url = urlparse(self.path)
+        content = None
+        if url.path.startswith('/zdic/hans/'):
+            content = self.server.pages.get('zdic', unquote(url.path[len('/zdic/hans/'):]))
+        elif url.path == '/baidu/s':
+            words = parse_qs(url.query).get('wd')
+            if words:
+                content = self.server.pages.get('baidu', words[0])
+        if content is None:
+            self._send(404, b'Not Found', 'text/plain; charset=utf-8')
+        else:
+            self._send(200, content, 'text/html; charset=utf-8')
+
+    def _send(self,
+              status: int,
+              content: bytes,
+              content_type: str,
+              headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='启动模拟汉典和百度汉语网站的本地替身服务器。')
+    parser.add_argument('--port', type=int, default=8765, help='监听的端口，默认为8765')
+    parser.add_argument('--cards', default=DEFAULT_CARD_FILE, metavar='FILE',
+                        help='用于合成页面的汉字卡片表格文件，默认为 cards/characters.txt')
+    parser.add_argument('--recorded', metavar='FILE',
+                        help='记录了真实页面的页面缓存数据库文件')
+    parser.add_argument('--latency', type=float, default=0.05, metavar='SECONDS',
+                        help='每个请求的平均延迟（秒），默认为0.05')
+    parser.add_argument('--jitter', type=float, default=0.02, metavar='SECONDS',
+                        help='延迟的最大抖动（秒），默认为0.02')
+    parser.add_argument('--error-rate', type=float, default=0.0, metavar='RATE',
+                        help='返回HTTP 503错误的概率，默认为0')
+    parser.add_argument('--max-concurrency', type=int, default=0, metavar='N',
+                        help='同时处理的请求数的上限，超出时返回HTTP 429，默认为0即不限制')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(levelname)s - %(message)s')
+    cache = PageCache(args.recorded) if args.recorded else None
+    server = DictServer(FixturePages(args.cards, cache), port=args.port,
+                        latency=args.latency, jitter=args.jitter,
+                        error_rate=args.error_rate,
+                        max_concurrency=args.max_concurrency)
+    logging.getLogger(__name__).info('Serving dictionary pages at %s', server.base_url)
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
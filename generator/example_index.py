@@ -0,0 +1,221 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import logging
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from card_file import iter_cards
+
+DEFAULT_LIMIT = 3
+"""
+每张汉字卡片中默认列出的例词和例句的条数（分别计算）。
+"""
+
+EXAMPLE_KINDS = ('word', 'sentence')
+"""
+例子的类型，按在汉字卡片中列出的顺序排列。
+"""
+
+HAN_PATTERN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+"""
+匹配一个汉字的正则表达式；例子中的标点符号等其他字符不计入索引。
+"""
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sources (
+    kind  TEXT PRIMARY KEY,
+    path  TEXT NOT NULL,
+    size  INTEGER NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    kind TEXT NOT NULL,
+    text TEXT NOT NULL,
+    tags TEXT NOT NULL,
+    seq  INTEGER NOT NULL,
+    gen  INTEGER NOT NULL,
+    PRIMARY KEY (kind, text)
+);
+CREATE TABLE IF NOT EXISTS postings (
+    char TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    text TEXT NOT NULL,
+    PRIMARY KEY (char, kind, text)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_item ON postings (kind, text);
+'''
+
+
+class ExampleIndex:
+    """
+    此模型表示从汉字到包含该汉字的例词和例句的倒排索引。
+
+    索引保存在一个SQLite数据库文件中，由生词和句子的Anki卡片表格文件生成：每个
+    例子（生词或句子）记录其文本、标签（引入它的书籍和章节）和在文件中的顺序，
+    并为其中的每个不同的汉字记录一条倒排项。查询某个汉字的例子时只需读取该汉字的
+    倒排项，耗时与例子的总数无关。
+
+    卡片表格文件的大小和修改时间未变时不重新读取；文件有变化时只为新增的例子
+    建立倒排项、删除已不存在的例子的倒排项，其余例子只更新标签和顺序。
+
+    此对象可在多个线程之间共享。
+    """
+    def __init__(self, path: str) -> None:
+        """
+        构造函数。
+
+        :param path: 索引数据库文件的路径，若其所在目录不存在将自动创建。
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._path = path
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(_SCHEMA)
+
+    @property
+    def path(self) -> str:
+        """
+        获取索引数据库文件的路径。
+
+        :return: 索引数据库文件的路径。
+        """
+        return self._path
+
+    def update(self, kind: str, card_file: str) -> None:
+        """
+        按Anki卡片表格文件更新指定类型的例子。
+
+        :param kind: 例子的类型，`'word'` 或 `'sentence'`。
+        :param card_file: 该类型的例子的Anki卡片表格文件，每行第一个字段为例子的
+            文本，最后一个字段为以空格隔开的标签；若文件不存在则不更新。
+        """
+        if kind not in EXAMPLE_KINDS:
+            raise ValueError(f'Unknown example kind: {kind}')
+        if not os.path.exists(card_file):
+            self._logger.warning('Example card file does not exist: %s', card_file)
+            return
+        stat = os.stat(card_file)
+        source = (os.path.abspath(card_file), stat.st_size, stat.st_mtime)
+        with self._lock:
+            row = self._conn.execute('SELECT path, size, mtime FROM sources WHERE kind = ?',
+                                     (kind,)).fetchone()
+            if row == source:
+                return
+            items = ((fields[0], fields[-1]) for fields in iter_cards(card_file))
+            added, removed = self._replace_items(kind, items)
+            self._conn.execute('INSERT OR REPLACE INTO sources (kind, path, size, mtime) '
+                               'VALUES (?, ?, ?, ?)', (kind,) + source)
+            self._conn.commit()
+        self._logger.info('Updated %s examples from %s: %d added, %d removed.',
+                          kind, card_file, added, removed)
+
+    def examples(self,
+                 char: str,
+                 known: Dict[str, int],
+                 limit: int = DEFAULT_LIMIT) -> List[Tuple[str, str, List[str]]]:
+        """
+        查询包含指定汉字、且其中的汉字都已学过的例子。
+
+        :param char: 指定的汉字。
+        :param known: 已学过的汉字，以汉字为键、以其学习顺序为值；例子中的所有汉字
+            都在此字典中、且顺序都不晚于指定的汉字时，才视为已学过。
+        :param limit: 每种类型最多返回的例子条数。
+        :return: `(类型, 文本, 标签列表)` 三元组的列表，按 `EXAMPLE_KINDS` 中的类型
+            顺序、以及例子在卡片表格文件中的顺序排列。
+        """
+        rank = known.get(char)
+        if rank is None:
+            return []
+        result = []
+        with self._lock:
+            for kind in EXAMPLE_KINDS:
+                cursor = self._conn.execute(
+                    'SELECT items.text, items.tags FROM postings '
+                    'JOIN items ON items.kind = postings.kind AND items.text = postings.text '
+                    'WHERE postings.char = ? AND postings.kind = ? ORDER BY items.seq',
+                    (char, kind))
+                count = 0
+                for text, tags in cursor:
+                    if all(known.get(c, rank + 1) <= rank for c in HAN_PATTERN.findall(text)):
+                        result.append((kind, text, tags.split()))
+                        count += 1
+                        if count >= limit:
+                            break
+        return result
+
+    def close(self) -> None:
+        """
+        关闭索引数据库。
+        """
+        with self._lock:
+            self._conn.close()
+
+    def _replace_items(self, kind: str, items: Iterable[Tuple[str, str]]) -> Tuple[int, int]:
+        """
+        用新的例子替换索引中指定类型的所有例子，调用者需持有锁。
+
+        :param kind: 例子的类型。
+        :param items: 按顺序排列的 `(文本, 标签)` 二元组。
+        :return: `(新增的例子数, 删除的例子数)` 二元组。
+        """
+        gen = self._conn.execute('SELECT COALESCE(MAX(gen), 0) + 1 FROM items').fetchone()[0]
+        added = 0
+        for seq, (text, tags) in enumerate(items):
+            tags = ' '.join(sorted(tags.split()))
+            updated = self._conn.execute('UPDATE items SET tags = ?, seq = ?, gen = ? '
+                                         'WHERE kind = ? AND text = ?',
+                                         (tags, seq, gen, kind, text)).rowcount
+            if updated:
+                continue
+            self._conn.execute('INSERT INTO items (kind, text, tags, seq, gen) '
+                               'VALUES (?, ?, ?, ?, ?)', (kind, text, tags, seq, gen))
+            self._conn.executemany('INSERT INTO postings (char, kind, text) VALUES (?, ?, ?)',
+                                   ((c, kind, text) for c in set(HAN_PATTERN.findall(text))))
+            added += 1
+        self._conn.execute('DELETE FROM postings WHERE (kind, text) IN '
+                           '(SELECT kind, text FROM items WHERE kind = ? AND gen != ?)',
+                           (kind, gen))
+        removed = self._conn.execute('DELETE FROM items WHERE kind = ? AND gen != ?',
+                                     (kind, gen)).rowcount
+        return added, removed
+
+
+def format_examples(examples: List[Tuple[str, str, List[str]]]) -> str:
+    """
+    将例子格式化为汉字卡片中例词例句字段的值。
+
+    :param examples: `ExampleIndex.examples()` 返回的例子列表。
+    :return: 每个例子一行，形如 `例子（书籍章节）`，行之间以 `<br>` 隔开；若没有
+        例子则为空字符串。
+    """
+    return '<br>'.join(f'{text}（{"、".join(tags)}）' if tags else text
+                       for _, text, tags in examples)
+
+
+def open_examples(path: str,
+                  word_file: Optional[str],
+                  sentence_file: Optional[str]) -> ExampleIndex:
+    """
+    打开例词例句索引，并按生词和句子的Anki卡片表格文件更新索引。
+
+    :param path: 索引数据库文件的路径。
+    :param word_file: 生词的Anki卡片表格文件；若为 `None` 则不更新例词。
+    :param sentence_file: 句子的Anki卡片表格文件；若为 `None` 则不更新例句。
+    :return: 已更新的例词例句索引，调用者用完后需关闭。
+    """
+    index = ExampleIndex(path)
+    for kind, card_file in zip(EXAMPLE_KINDS, (word_file, sentence_file)):
+        if card_file:
+            index.update(kind, card_file)
+    return index
@@ -0,0 +1,176 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import importlib.util
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup, SoupStrainer, Tag
+
+HTML_PARSER = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
+"""
+解析字典网页页面所用的 BeautifulSoup 解析器；若安装了 lxml 则使用更快的 lxml，
+否则使用Python内置的 html.parser。
+"""
+
+
+class DictRecord(NamedTuple):
+    """
+    此模型表示从字典网页页面中提取出的指定汉字的信息。
+    """
+    image: Optional[str]
+    """该汉字的图片的URL。"""
+    pinyin: Optional[str]
+    """该汉字的拼音。"""
+    pronounce: Optional[str]
+    """该汉字的读音音频文件的URL。"""
+    definitions: Optional[str]
+    """该汉字的释义。"""
+
+    def missing_fields(self) -> List[str]:
+        """
+        获取此记录中缺失的字段。
+
+        :return: 值为 `None` 或空字符串的字段名称列表。
+        """
+        return [name for name, value in zip(self._fields, self) if not value]
+
+
+class FieldSpec(NamedTuple):
+    """
+    此模型表示字典网页页面中一个字段的提取规则。
+    """
+    selector: Optional[str]
+    """
+    定位该字段所在元素的CSS选择器；若为 `None` 表示该字段无需页面内容即可得到。
+    """
+    extract: Callable[[Any, str], Optional[str]]
+    """
+    从定位到的元素中提取字段值的函数。其第一个参数为定位到的元素（若
+    `select_all` 为 `True` 则为所有匹配元素组成的列表，若 `selector` 为 `None`
+    则为 `None`），第二个参数为指定的汉字。若未找到匹配的元素，则不调用此函数，
+    字段值为 `None`。
+    """
+    select_all: bool = False
+    """是否收集所有匹配的元素，默认只收集第一个匹配的元素。"""
+
+
+class ExtractionPlan:
+    """
+    此模型表示一个字典来源的页面提取方案。
+
+    提取方案由 `DictRecord` 中每个字段的提取规则组成，第一次提取时一次性编译所有
+    的CSS选择器，因此只定义而不使用提取方案时不会导入 BeautifulSoup 等网页解析
+    模块。提取时只解析 `parse_only` 指定的相关子树，并在一次遍历中为所有字段
+    找到匹配的元素，最后得到一个 `DictRecord`。
+
+    此对象除编译结果外是无状态的，可在多个线程或进程之间共享。
+    """
+    def __init__(self,
+                 fields: Dict[str, FieldSpec],
+                 parse_only: Optional[Dict[str, Any]] = None) -> None:
+        """
+        构造函数。
+
+        :param fields: 以 `DictRecord` 的字段名称为键的提取规则。
+        :param parse_only: 构造 `bs4.SoupStrainer` 的关键字参数，只解析页面中满足
+            此条件的元素及其子树；若为 `None` 则解析整个页面。
+        """
+        unknown = set(fields) - set(DictRecord._fields)
+        if unknown:
+            raise ValueError(f'Unknown record fields: {sorted(unknown)}')
+        self._fields = fields
+        self._parse_only = parse_only
+        self._compiled: Optional[Tuple[Optional['SoupStrainer'], Dict[str, Any]]] = None
+
+    def extract(self,
+                char: str,
+                content: bytes,
+                timings: Optional[Dict[str, float]] = None) -> DictRecord:
+        """
+        从字典网页页面内容中提取指定汉字的信息。
+
+        :param char: 指定的汉字。
+        :param content: 该汉字对应的字典网页页面的原始内容（UTF-8编码）。
+        :param timings: 若不为 `None`，则将每个字段的提取函数的耗时（秒）以字段
+            名称为键记录到此字典中。
+        :return: 从该页面中提取出的汉字信息。
+        """
+        soup = None
+        matches = {}
+        strainer, patterns = self._compile()
+        if patterns:
+            from bs4 import BeautifulSoup
+            soup = BeautifulSoup(content, HTML_PARSER,
+                                 parse_only=strainer,
+                                 from_encoding='utf-8')
+            matches = self._match(soup, patterns)
+        values = {}
+        try:
+            for name in DictRecord._fields:
+                spec = self._fields.get(name)
+                found = matches.get(name)
+                start = time.perf_counter()
+                if spec is None:
+                    values[name] = None
+                elif spec.selector is None:
+                    values[name] = spec.extract(None, char)
+                elif found:
+                    values[name] = spec.extract(found if spec.select_all else found[0], char)
+                else:
+                    values[name] = None
+                if timings is not None and spec is not None:
+                    timings[name] = time.perf_counter() - start
+        finally:
+            # 提取出的字段值都是字符串，不引用页面树，因此提取完毕（包括提取失败）后
+            # 立即释放整个页面树，而不必等待垃圾回收
+            if soup is not None:
+                soup.decompose()
+        return DictRecord(**values)
+
+    def _compile(self) -> Tuple[Optional['SoupStrainer'], Dict[str, Any]]:
+        """
+        编译解析条件和所有字段的CSS选择器，只在第一次调用时编译。
+
+        多个线程同时第一次调用时可能重复编译，但结果相同，因此无需加锁。
+
+        :return: `(解析条件, 以字段名称为键的已编译的CSS选择器)` 二元组。
+        """
+        if self._compiled is None:
+            import soupsieve
+            from bs4 import SoupStrainer
+            strainer = SoupStrainer(**self._parse_only) if self._parse_only is not None else None
+            patterns = {name: soupsieve.compile(spec.selector)
+                        for name, spec in self._fields.items()
+                        if spec.selector is not None}
+            self._compiled = (strainer, patterns)
+        return self._compiled
+
+    def _match(self,
+               soup: 'BeautifulSoup',
+               patterns: Dict[str, Any]) -> Dict[str, List['Tag']]:
+        """
+        在一次遍历中为所有字段查找匹配的元素。
+
+        :param soup: 解析后的页面内容。
+        :param patterns: 以字段名称为键的已编译的CSS选择器。
+        :return: 以字段名称为键、以按文档顺序排列的匹配元素列表为值的字典。
+        """
+        from bs4 import Tag
+        result = {name: [] for name in patterns}
+        pending = dict(patterns)
+        for element in soup.descendants:
+            if not isinstance(element, Tag):
+                continue
+            for name, pattern in list(pending.items()):
+                if pattern.match(element):
+                    result[name].append(element)
+                    if not self._fields[name].select_all:
+                        del pending[name]
+            if not pending:
+                break
+        return result
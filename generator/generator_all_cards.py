@@ -0,0 +1,162 @@
+# ==============================================================================
+#                                                                              =
+#    Copyright (c) 2023. Haixing Hu                                            =
+#    All rights reserved.                                                      =
+#                                                                              =
+# ==============================================================================
+import argparse
+import glob
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+import generator_character_cards
+import generator_sentence_cards
+import generator_word_cards
+from anki_connect import DEFAULT_URL as DEFAULT_ANKI_URL, AnkiConnectError
+from example_index import ExampleIndex, open_examples
+from metrics import REPORT_FORMATS, default_metrics
+
+DECKS = {
+    'character': ('characters.txt', '汉字'),
+    'word': ('words.txt', '生词'),
+    'sentence': ('sentences.txt', '句子'),
+}
+"""
+所有牌组的类型，以及每种牌组默认的输出文件名和Anki牌组名称。
+
+每种牌组的输入文件是数据目录下与其类型同名的子目录中的所有 `.txt` 文件。
+"""
+
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                'data')
+"""
+默认的数据目录。
+"""
+
+DEFAULT_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                  'cards')
+"""
+默认的输出目录。
+"""
+
+
+def find_input_files(data_dir: str, kind: str) -> List[str]:
+    """
+    查找指定类型的牌组的所有输入文件。
+
+    :param data_dir: 数据目录。
+    :param kind: 牌组的类型，例如 `'character'`。
+    :return: 按文件名排序的输入文件列表。
+    """
+    return sorted(glob.glob(os.path.join(data_dir, kind, '*.txt')))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='在一个进程中为所有书籍制作汉字、生词和句子'
+                                                 '的Anki卡片。')
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR, metavar='DIR',
+                        help='数据目录，其下的 character、word 和 sentence 子目录中分别是'
+                             f'各牌组的输入文件，默认为 {DEFAULT_DATA_DIR}')
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR, metavar='DIR',
+                        help=f'卡片表格文件的输出目录，默认为 {DEFAULT_OUTPUT_DIR}')
+    parser.add_argument('--decks', nargs='+', choices=list(DECKS), default=list(DECKS),
+                        metavar='KIND',
+                        help='要制作的牌组，可选 character、word、sentence，默认为全部')
+    generator_character_cards.add_lookup_arguments(parser)
+    generator_character_cards.add_build_arguments(parser)
+    parser.add_argument('--apkg-dir', metavar='DIR',
+                        help='同时将每个牌组直接导出为此目录下的Anki牌组包（.apkg）文件')
+    parser.add_argument('--anki-connect', nargs='?', const=DEFAULT_ANKI_URL, metavar='URL',
+                        help='同时通过AnkiConnect插件将卡片同步到正在运行的Anki中，只发送新增或'
+                             f'有变化的卡片；默认地址为 {DEFAULT_ANKI_URL}')
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='运行结束时将各阶段的耗时、缓存命中率和失败次数等指标写入此文件')
+    parser.add_argument('--metrics-format', choices=REPORT_FORMATS, default='json',
+                        help='指标报告的格式，默认为json')
+    args = parser.parse_args()
+    generator_character_cards.check_lookup_arguments(parser, args)
+    generator_character_cards.check_build_arguments(parser, args)
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(levelname)s - %(message)s')
+    logger = logging.getLogger(__name__)
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.apkg_dir:
+        os.makedirs(args.apkg_dir, exist_ok=True)
+
+    def apkg_file(kind: str) -> Optional[str]:
+        if not args.apkg_dir:
+            return None
+        return os.path.join(args.apkg_dir, os.path.splitext(DECKS[kind][0])[0] + '.apkg')
+
+    futures: Dict[str, Future] = {}
+    incomplete = False
+
+    def examples() -> ExampleIndex:
+        # 例词例句取自输出目录中的生词和句子牌组，若本次也生成它们，则要等它们生成完毕
+        for kind in ('word', 'sentence'):
+            if kind in futures:
+                futures[kind].result()
+        return open_examples(args.examples_index,
+                             os.path.join(args.output_dir, DECKS['word'][0]),
+                             os.path.join(args.output_dir, DECKS['sentence'][0]))
+
+    client, cache, fetcher = generator_character_cards.open_session(args)
+    # 各牌组在各自的线程中同时制作，共用同一个页面获取器：汉字牌组和生词牌组同时用到
+    # 的页面只下载一次。每个牌组的所有书籍共用同一个查询流水线，各牌组的流水线共用
+    # 同一个有 --concurrency 个线程的下载线程池，因此并发下载总数不随牌组数增加；
+    # 只有汉字牌组在解析进程池中解析页面，生词的拼音补全依赖解析结果，在下载线程中解析
+    fetch_pool = ThreadPoolExecutor(args.concurrency, thread_name_prefix='Fetch')
+    try:
+        with ThreadPoolExecutor(len(args.decks), thread_name_prefix='Deck') as executor:
+            # 先提交生词和句子牌组，汉字牌组写入卡片前需等待它们生成完毕
+            for kind in sorted(args.decks, key=lambda kind: kind == 'character'):
+                input_files = find_input_files(args.data_dir, kind)
+                if not input_files:
+                    logger.warning('No input files for %s deck in %s', kind,
+                                   os.path.join(args.data_dir, kind))
+                    continue
+                output_file = os.path.join(args.output_dir, DECKS[kind][0])
+                deck = DECKS[kind][1]
+                match kind:
+                    case 'character':
+                        futures[kind] = executor.submit(generator_character_cards.build_deck,
+                                                        input_files, output_file, args, client,
+                                                        fetcher, apkg_file(kind), deck,
+                                                        examples, args.anki_connect,
+                                                        fetch_pool)
+                    case 'word':
+                        futures[kind] = executor.submit(generator_word_cards.build_deck,
+                                                        input_files, output_file,
+                                                        args.concurrency, fetcher,
+                                                        apkg_file(kind), deck, args.anki_connect,
+                                                        fetch_pool)
+                    case 'sentence':
+                        futures[kind] = executor.submit(generator_sentence_cards.build_deck,
+                                                        input_files, output_file,
+                                                        apkg_file(kind), deck, args.anki_connect)
+            for kind, future in futures.items():
+                try:
+                    cards = future.result()
+                except (generator_character_cards.IncompleteDeckError, AnkiConnectError) as e:
+                    logger.error('Failed to build %s deck: %s', kind, e)
+                    incomplete = True
+                    continue
+                logger.info('Built %d %s cards.', len(cards), kind)
+        if args.metrics:
+            default_metrics().write_report(args.metrics, args.metrics_format)
+    finally:
+        fetch_pool.shutdown(wait=True, cancel_futures=True)
+        client.close()
+        if cache is not None:
+            cache.close()
+    if incomplete:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
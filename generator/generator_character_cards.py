@@ -4,14 +4,31 @@
 #    All rights reserved.                                                      =
 #                                                                              =
 # ==============================================================================
+import argparse
+import functools
 import logging
 import os
 import sys
-from typing import List, Dict, Set
+import time
+from concurrent.futures import Executor
+from typing import Callable, Iterator, List, Dict, Set, Optional, Tuple, Type, Union
 
-from dict_page import DictPage
-from zdic_dict_page import ZdicDictPage
-from baidu_dict_page import BaiduDictPage
+from anki_connect import DEFAULT_URL as DEFAULT_ANKI_URL, AnkiConnectError, push_to_anki
+from apkg_exporter import CHARACTER_NOTE_TYPE, export_apkg
+from card_file import CardRecord, read_cards
+from card_writer import get_card_writer_class, open_card_writer
+from corpus import DEFAULT_MAX_ITEMS, Corpus, read_items
+from dict_page import DEFAULT_HEDGE_DELAY, DICT_PAGE_CLASSES, DictPage, load_dict_page_class
+from example_index import ExampleIndex, format_examples, open_examples
+from extraction import DictRecord
+from journal import Journal, journal_path
+from http_client import HttpClient, DEFAULT_TIMEOUT, DEFAULT_RETRIES
+from media_downloader import MediaDownloader, is_remote, localize_card_file, localize_fields
+from metrics import REPORT_FORMATS, ProgressReporter, default_metrics
+from page_cache import PageCache, DEFAULT_TTL, DEFAULT_MAX_SIZE, content_digest
+from page_fetcher import PageFetcher, FetchError
+from pipeline import staged_map
+from rate_limiter import DEFAULT_MAX_RATE, RateLimiter
 
 DICT_PAGE_TYPE = 'zdic'
 """
@@ -19,96 +36,600 @@ DICT_PAGE_TYPE = 'zdic'
 
 - `'zdic'`: 表示使用汉典页面数据
 - `'baidu'`: 表示使用百度汉语页面数据
+- `'local'`: 表示使用由Unihan和CC-CEDICT生成的本地字典索引数据
+- `'composite'`: 表示综合使用汉典和百度汉语页面数据，优先使用汉典；汉典响应过慢
+  或失败时同时查询百度汉语，并用百度汉语的数据补全汉典缺失的字段；若打开了本地
+  字典索引，则最后用其数据补全
 """
 
+DEFAULT_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.cache',
+                                  'hanzi-anki-cards', 'pages.sqlite3')
+"""
+默认的字典页面缓存数据库文件。
+"""
+
+DEFAULT_EXAMPLES_FILE = os.path.join(os.path.dirname(DEFAULT_CACHE_FILE), 'examples.sqlite3')
+"""
+默认的例词例句索引数据库文件。
+"""
+
+
+class IncompleteDeckError(Exception):
+    """
+    表示部分汉字查询失败、无法生成完整牌组时抛出的异常。
+    """
+    def __init__(self, message: str, failed: List[str], written: bool) -> None:
+        """
+        构造函数。
+
+        :param message: 错误信息。
+        :param failed: 查询失败的汉字。
+        :param written: 是否已写入输出文件。查询失败的汉字沿用上次生成的卡片，没有
+            上次生成的卡片的则写入字段缺失的卡片，因此只要写入过程本身没有出错，
+            输出文件总会写入。
+        """
+        super().__init__(message)
+        self.failed = failed
+        self.written = written
+
+
+def get_dict_page_class() -> Type[DictPage]:
+    """
+    获取当前使用的字典页面的类型。
 
-def get_dict_page(ch: str) -> DictPage:
+    该类型所在的模块在第一次调用时才导入，参见 `dict_page.load_dict_page_class()`。
+
+    :return: 当前使用的字典页面的类型。
+    :raise ValueError: 若当前使用的字典来源未知。
+    """
+    return load_dict_page_class(DICT_PAGE_TYPE)
+
+
+def get_dict_page(ch: str, fetcher: Optional[PageFetcher] = None) -> DictPage:
     """
     获取指定汉字的字典页面。
 
     :param ch: 指定的汉字。
+    :param fetcher: 用于获取页面内容的获取器；若为 `None` 则直接从网络下载。
     :return: 指定汉字的字典页面。
     """
-    match DICT_PAGE_TYPE:
-        case 'zdic':
-            return ZdicDictPage(ch)
-        case 'baidu':
-            return BaiduDictPage(ch)
-        case _:
-            raise ValueError(f'Unknown dict page type: {DICT_PAGE_TYPE}')
+    return get_dict_page_class()(ch, fetcher)
 
 
-def collect_characters(input_files: List[str]) -> Dict[str, Set[str]]:
+def collect_characters(input_files: List[str],
+                       max_items: int = DEFAULT_MAX_ITEMS) -> Corpus:
     """
     收集所有待制作卡片的汉字及其标签。
 
+    输入文件是在迭代返回的语料时才逐行读取的，因此可以边读取边查询字典页面。
+
     :param input_files: 输入文件的文件名列表。
-    :return: 包含所有汉字及其对应的标签的字典。
+    :param max_items: 在内存中聚合的最大汉字个数，超出后转存到磁盘上。
+    :return: 包含所有汉字及其对应的标签的语料。
     """
-    logger = logging.getLogger(__name__)
-    result = {}
-    for input_file in input_files:
-        logger.info('Processing input file: %s', input_file)
-        with open(input_file, 'r', encoding='utf-8') as file:
-            lines = file.readlines()
-            book = os.path.splitext(os.path.basename(input_file))[0]
-            chapter = ''
-            for line in lines:
-                line = line.strip()
-                if line.startswith('#'):
-                    chapter = line[1:].strip()
-                elif line:
-                    tag = f'{book}{chapter}'
-                    chars = [c.strip() for c in line.split('、') if c.strip()]
-                    total = len(chars)
-                    current = 0
-                    for c in chars:
-                        current += 1
-                        if c in result:
-                            result[c].add(tag)
-                        else:
-                            result[c] = {tag}
-                        logger.info('Reading character %d/%d: %s [%s]', current, total, c, tag)
-    return result
-
-
-def generate_cards(characters: Dict[str, Set[str]], output_file: str):
+    return Corpus(read_items(input_files), 'character', max_items)
+
+
+def card_fields(ch: str, record: DictRecord) -> List[str]:
+    """
+    生成指定汉字对应的Anki卡片的字段值（不含标签）。
+
+    :param ch: 指定的汉字。
+    :param record: 从字典网页页面中提取出的该汉字的信息。
+    :return: 该汉字对应的Anki卡片的字段值列表，依次为汉字、拼音、图片、读音和释义，
+        缺失的字段值为 `'None'`。
+    """
+    return [ch, str(record.pinyin), str(record.image), str(record.pronounce),
+            str(record.definitions)]
+
+
+def previous_card(fields: List[str]) -> Optional[List[str]]:
+    """
+    取出上次生成的Anki卡片表格数据中查询得到的字段值，不论其中是否有字段缺失。
+
+    :param fields: 上次生成的该汉字的Anki卡片表格数据的各个字段（含标签），可以
+        包含或不包含例词例句字段。
+    :return: 该汉字对应的Anki卡片的查询得到的字段值列表（不含例词例句和标签）；
+        若数据的格式不正确则返回 `None`。
+    """
+    if len(fields) not in (6, 7):
+        return None
+    return fields[:5]
+
+
+def reuse_card(fields: List[str]) -> Optional[List[str]]:
+    """
+    复用已生成的Anki卡片表格数据。
+
+    :param fields: 已生成的该汉字的Anki卡片表格数据的各个字段（含标签），可以
+        包含或不包含例词例句字段。
+    :return: 该汉字对应的Anki卡片的查询得到的字段值列表（不含例词例句和标签）；
+        若已生成的数据中有字段缺失（例如上次查询失败），则返回 `None`，表示需要
+        重新查询。
+    """
+    if len(fields) not in (6, 7) or 'None' in fields[1:5]:
+        return None
+    return fields[:5]
+
+
+def extract_timed(page_class: Type[DictPage],
+                  ch: str,
+                  payload: Union[bytes, DictRecord]) \
+        -> Tuple[DictRecord, Dict[str, float], Optional[str]]:
+    """
+    从字典网页页面的原始内容中提取指定汉字的信息，并统计解析和各字段提取的耗时。
+
+    此函数可能在解析进程中调用，因此耗时随结果一起返回，由调用者记录到指标中。
+
+    :param page_class: 字典页面的类型。
+    :param ch: 指定的汉字。
+    :param payload: 该汉字对应的字典网页页面的原始内容；或者获取阶段已从记录缓存
+        中得到的汉字信息，此时无需解析。
+    :return: `(提取出的汉字信息, 耗时, 页面内容的摘要)` 三元组，其中耗时是以字段
+        名称为键的各字段提取耗时，以及键为 `''` 的整个解析过程的耗时，单位均为秒；
+        若汉字信息取自记录缓存，则耗时为空字典，摘要为 `None`。
+    """
+    if isinstance(payload, DictRecord):
+        return payload, {}, None
+    timings = {}
+    start = time.perf_counter()
+    record = page_class.extract_record(ch, payload, timings)
+    timings[''] = time.perf_counter() - start
+    return record, timings, content_digest(payload)
+
+
+def generate_cards(characters: Corpus,
+                   output_file: str,
+                   concurrency: int = 1,
+                   fetcher: Optional[PageFetcher] = None,
+                   existing: Optional[Dict[str, List[str]]] = None,
+                   parse_workers: Optional[int] = 0,
+                   journal: Optional[Journal] = None,
+                   examples: Optional[Callable[[], ExampleIndex]] = None,
+                   previous: Optional[Dict[str, List[str]]] = None,
+                   fetch_pool: Optional[Executor] = None) \
+        -> List[CardRecord]:
     """
     生成Anki卡片表格数据并将其写入输出文件。
 
-    :param characters: 包含现有汉字及其对应标签的字典
+    卡片的生成分为三个流水线阶段：由 `concurrency` 个线程并发下载字典页面，由
+    `parse_workers` 个进程并行解析页面，最后写入输出文件。汉字一读到就进入
+    流水线，不必等待所有输入文件读完；进度报告的总数随着汉字的读取而增加，输入
+    文件读完后即为待查询的汉字总数。各阶段之间待处理的汉字个数是有限的，因此
+    内存占用保持平稳。汉字的标签要在所有输入文件读完后才能确定，因此所有汉字都
+    查询完成后，才按汉字第一次出现的顺序写入输出文件。
+
+    下载页面前先查询记录缓存：若缓存中有当前版本的提取器从页面的当前内容中提取
+    出的记录，则直接使用，不再读取和解析页面；否则解析页面，并将提取结果写入
+    记录缓存。
+
+    若指定了 `existing`，则其中已有完整数据的汉字不再查询字典页面，只更新其
+    标签字段；只有新增的汉字或上次查询失败的汉字才会查询字典页面。
+
+    若指定了 `journal`，则每个查询完成的汉字都会记录到日志中；日志中已记录的、
+    来自同一字典来源的汉字不再查询。卡片先写入临时文件，全部完成后才原子地替换
+    输出文件，因此中途崩溃不会破坏已有的输出文件。
+
+    各阶段的耗时、缓存命中率和失败次数记录在默认指标集合中；处理进度每隔一段
+    时间输出一行日志。
+
+    查询失败的汉字沿用 `previous` 中上次生成的卡片，因此网络故障不会覆盖已有的完整
+    数据；没有上次生成的卡片的汉字与生词牌组一样写入字段值为 `'None'` 的卡片，下次
+    生成时会重新查询。写入输出文件后抛出 `IncompleteDeckError`；已查询完成的汉字都
+    已记录在日志中，可以断点续做。
+
+    若指定了 `examples`，则每张卡片在释义之后增加一个例词例句字段，列出包含该汉字、
+    且其中的汉字都不晚于该汉字学到的生词和句子；否则不增加此字段，输出文件的格式与
+    不列出例词例句时相同。
+
+    :param characters: 包含现有汉字及其对应标签的语料，由 `collect_characters()`
+        返回。
     :param output_file: 输出文件名。
+    :param concurrency: 并发下载字典页面的线程数，默认为1。
+    :param fetcher: 用于获取页面内容的获取器；若为 `None` 则直接从网络下载。
+    :param existing: 已生成的Anki卡片表格数据，由 `card_file.read_cards()` 读取；
+        若为 `None` 则重新查询所有汉字。
+    :param parse_workers: 并行解析字典页面的进程数；若为 `None` 则使用CPU的核数；
+        默认为0，表示直接在下载页面的线程中解析。
+    :param journal: 记录已完成的卡片数据的日志；若为 `None` 则不记录。
+    :param examples: 打开例词例句索引的函数，在所有汉字都查询完成、写入卡片之前
+        调用，因此可以等待生词和句子牌组生成完毕；索引用完后由此函数关闭。若为
+        `None` 则不列出例词例句。
+    :param previous: 上次生成的Anki卡片表格数据，由 `card_file.read_cards()` 读取，
+        查询失败的汉字沿用其中的数据；若为 `None` 则使用 `existing`。
+    :param fetch_pool: 下载字典页面的共享线程池，见 `pipeline.staged_map()`；若为
+        `None` 则创建一个有 `concurrency` 个线程的线程池。
+    :return: 写入输出文件的所有卡片的数据。
+    :raise IncompleteDeckError: 若有汉字查询失败。
     """
     logger = logging.getLogger(__name__)
-    total = len(characters)
-    current = 0
-    with open(output_file, 'w', encoding='utf-8') as file:
+    metrics = default_metrics()
+    existing = existing or {}
+    previous = existing if previous is None else previous
+    page_class = get_dict_page_class()
+    source = page_class.SOURCE
+    completed = journal.completed(source) if journal is not None else {}
+    looked_up: Dict[str, List[str]] = {}
+    failed: Set[str] = set()
+    cards = []
+    reused = 0
+    resumed = 0
+    kept = 0
+
+    def reuse(ch: str) -> Optional[List[str]]:
+        if ch in completed:
+            return completed[ch]
+        if ch in existing:
+            return reuse_card(existing[ch])
+        return None
+
+    def fetch(ch: str) -> Union[bytes, DictRecord]:
+        page = page_class(ch, fetcher)
+        record = page.get_cached_record()
+        if record is not None:
+            return record
+        with metrics.timer('hanzi_fetch_seconds', source=source):
+            return page.fetch_content()
+
+    progress = ProgressReporter(0, 'characters', logger=logger)
+
+    def to_look_up() -> Iterator[str]:
+        for ch in characters.new_items():
+            if reuse(ch) is None:
+                progress.expect()
+                yield ch
+
+    lookups = staged_map(to_look_up(),
+                         fetch,
+                         functools.partial(extract_timed, page_class),
+                         fetch_workers=concurrency,
+                         parse_workers=parse_workers,
+                         max_pending=max(64, 4 * concurrency),
+                         parse_inline=lambda payload: (page_class.EXTRACT_INLINE
+                                                       or isinstance(payload, DictRecord)),
+                         fetch_pool=fetch_pool)
+    for ch, future in lookups:
+        progress.advance()
+        try:
+            record, timings, digest = future.result()
+        except FetchError as e:
+            metrics.inc('hanzi_fetch_failures_total', source=source)
+            logger.error('Failed to fetch page for character "%s": %s', ch, e)
+            failed.add(ch)
+            continue
+        if digest is not None:
+            page_class(ch, fetcher).put_cached_record(digest, record)
+            metrics.observe('hanzi_parse_seconds', timings.pop(''), source=source)
+            for field, seconds in timings.items():
+                metrics.observe('hanzi_extract_seconds', seconds, source=source, field=field)
+        missing = record.missing_fields()
+        for field in missing:
+            metrics.inc('hanzi_missing_fields_total', source=source, field=field)
+        if missing:
+            logger.error('Failed to get %s for character "%s"', ', '.join(missing), ch)
+        fields = card_fields(ch, record)
+        if journal is not None:
+            journal.append(ch, source, fields)
+        metrics.inc('hanzi_cards_total', kind='character', origin='looked_up')
+        looked_up[ch] = fields
+    progress.finish()
+    index = examples() if examples is not None else None
+    known = {ch: rank for rank, ch in enumerate(characters)} if index is not None else {}
+    with open_card_writer(output_file) as writer:
         for ch, tags in characters.items():
-            current += 1
-            tags_str = ' '.join(tags)
-            logger.info('Processing character %d/%d: %s [%s]', current, total, ch, tags_str)
-            page = get_dict_page(ch)
-            image = page.get_image()
-            pinyin = page.get_pinyin()
-            pronounce = page.get_pronounce()
-            definitions = page.get_definitions()
-            line = f'{ch}|{pinyin}|{image}|{pronounce}|{definitions}|{tags_str}\n'
-            file.write(line)
+            fields = looked_up.get(ch)
+            if ch in failed:
+                fields = previous_card(previous[ch]) if ch in previous else None
+                if fields is not None:
+                    kept += 1
+                    metrics.inc('hanzi_cards_total', kind='character', origin='kept')
+                else:
+                    fields = card_fields(ch, DictRecord(None, None, None, None))
+                    metrics.inc('hanzi_cards_total', kind='character', origin='failed')
+            elif fields is None:
+                fields = reuse(ch)
+                if ch in completed:
+                    resumed += 1
+                    metrics.inc('hanzi_cards_total', kind='character', origin='resumed')
+                else:
+                    reused += 1
+                    metrics.inc('hanzi_cards_total', kind='character', origin='reused')
+            if index is not None:
+                fields = fields + [format_examples(index.examples(ch, known))]
+            card = CardRecord(fields, tags)
+            with metrics.timer('hanzi_write_seconds', kind='character'):
+                writer.write(card)
+            cards.append(card)
+    if index is not None:
+        index.close()
+    if resumed:
+        logger.info('Resumed %d characters from the journal.', resumed)
+    if kept:
+        logger.warning('Kept the previous cards of %d characters that failed to look up.', kept)
+    hits = metrics.counter('hanzi_cache_requests_total', source=source, result='hit')
+    misses = metrics.counter('hanzi_cache_requests_total', source=source, result='miss')
+    if hits + misses:
+        metrics.set('hanzi_cache_hit_ratio', hits / (hits + misses), source=source)
+    if existing:
+        removed = sum(1 for ch in existing if ch not in characters)
+        logger.info('Incremental rebuild: %d reused, %d looked up, %d removed.',
+                    reused, len(looked_up) + len(failed), removed)
+    if failed:
+        failed_chars = [ch for ch in characters if ch in failed]
+        raise IncompleteDeckError(f'Failed to look up {len(failed_chars)} characters, kept '
+                                  f'their previous cards in {output_file} or left their '
+                                  'fields empty: ' + _sample(failed_chars), failed_chars,
+                                  written=True)
+    return cards
+
+
+def _sample(chars: List[str], limit: int = 20) -> str:
+    """
+    列出部分汉字，用于错误信息。
+
+    :param chars: 汉字列表。
+    :param limit: 最多列出的汉字个数。
+    :return: 前 `limit` 个汉字拼接成的字符串，若有省略则以省略号结尾。
+    """
+    return ''.join(chars[:limit]) + ('…' if len(chars) > limit else '')
+
+
+def note_fields(fields: List[str]) -> List[Optional[str]]:
+    """
+    将Anki卡片表格数据的字段值转换为Anki笔记的字段值。
+
+    缺失的字段值转换为 `None`；远程的图片和读音URL分别转换为 `<img>` 和 `<audio>`
+    元素，已改写为本地引用的字段保持不变。没有例词例句字段的卡片，其笔记的例词例句
+    字段为 `None`。
+
+    :param fields: 该卡片的字段值列表（不含标签），可以包含或不包含例词例句字段。
+    :return: 对应的Anki笔记的字段值列表。
+    """
+    ch, pinyin, image, pronounce, definitions, examples = \
+        [None if value in ('None', '') else value for value in fields] + [None] * (6 - len(fields))
+    if is_remote(image):
+        image = f'<img src="{image}">'
+    if is_remote(pronounce):
+        pronounce = f'<audio controls src="{pronounce}"></audio>'
+    return [ch, pinyin, image, pronounce, definitions, examples]
+
+
+def add_lookup_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    向命令行参数解析器中添加查询字典数据相关的参数。
+
+    :param parser: 命令行参数解析器。
+    """
+    parser.add_argument('--source', choices=list(DICT_PAGE_CLASSES),
+                        default=DICT_PAGE_TYPE,
+                        help=f'字典数据的来源，默认为 {DICT_PAGE_TYPE}，即汉典；composite 表示'
+                             '综合汉典和百度汉语，并以 --local-index 指定的本地索引作为后备')
+    parser.add_argument('--hedge-delay', type=float, default=DEFAULT_HEDGE_DELAY,
+                        metavar='SECONDS',
+                        help='综合来源的延迟预算（秒）：汉典超过此时间未返回时同时查询百度汉语，'
+                             f'默认为{DEFAULT_HEDGE_DELAY:g}')
+    parser.add_argument('--local-index', metavar='FILE',
+                        help='本地字典索引文件，由 local_dict_index.py 生成；--source local 时必需，'
+                             '--source composite 时作为后备来源')
+    parser.add_argument('--concurrency', type=int, default=1, metavar='N',
+                        help='并发下载字典页面的线程数，默认为1')
+    parser.add_argument('--max-rate', type=float, default=DEFAULT_MAX_RATE, metavar='N',
+                        help='对每个网站的最大请求速率（次/秒）；开始时即按此速率和 --concurrency '
+                             '请求，只在网站限流或过载时自动降低；为0表示不限流（例如访问本地镜像时），'
+                             f'默认为{DEFAULT_MAX_RATE:g}')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, metavar='SECONDS',
+                        help=f'每个HTTP请求的超时时间（秒），默认为{DEFAULT_TIMEOUT:g}')
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES, metavar='N',
+                        help=f'HTTP请求失败后的最大重试次数，默认为{DEFAULT_RETRIES}')
+    parser.add_argument('--cache', default=DEFAULT_CACHE_FILE, metavar='FILE',
+                        help=f'字典页面缓存数据库文件，默认为 {DEFAULT_CACHE_FILE}')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='不使用字典页面缓存')
+    parser.add_argument('--cache-ttl', type=float, default=DEFAULT_TTL / 86400,
+                        metavar='DAYS', help='缓存条目的有效期（天），默认为30')
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_MAX_SIZE // 2**20,
+                        metavar='MB', help='缓存的最大容量（MB），默认为512')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--offline', action='store_true',
+                      help='只使用缓存中的页面，不访问网络')
+    mode.add_argument('--refresh', action='store_true',
+                      help='忽略已有缓存，重新下载所有页面并更新缓存')
+
+
+def check_lookup_arguments(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    """
+    检查由 `add_lookup_arguments()` 添加的命令行参数；若参数有误则退出程序。
+
+    :param parser: 命令行参数解析器。
+    :param args: 解析得到的命令行参数。
+    """
+    if args.source == 'local' and not args.local_index:
+        parser.error('--source local requires --local-index')
+    if args.concurrency < 1:
+        parser.error('--concurrency must be a positive integer')
+    if args.max_rate < 0:
+        parser.error('--max-rate must be a non-negative number')
+    if args.no_cache and (args.offline or args.refresh):
+        parser.error('--offline and --refresh require the page cache')
+
+
+def open_session(args: argparse.Namespace) -> Tuple[HttpClient, Optional[PageCache], PageFetcher]:
+    """
+    按命令行参数配置字典来源，并打开查询字典数据所用的HTTP客户端和页面缓存。
+
+    :param args: 由 `add_lookup_arguments()` 添加的命令行参数。
+    :return: `(HTTP客户端, 页面缓存, 页面获取器)` 三元组；若不使用页面缓存，则
+        页面缓存为 `None`。调用者用完后需关闭HTTP客户端和页面缓存。
+    """
+    global DICT_PAGE_TYPE
+    DICT_PAGE_TYPE = args.source
+    # 字典来源的模块只在用到时才导入，参见 `dict_page.load_dict_page_class()`
+    if args.source == 'composite':
+        load_dict_page_class('composite').HEDGE_DELAY = args.hedge_delay
+    if args.local_index:
+        from local_dict_page import open_index
+        open_index(args.local_index)
+    cache = None
+    if not args.no_cache:
+        cache = PageCache(args.cache,
+                          ttl=args.cache_ttl * 86400,
+                          max_size=args.cache_size * 2**20)
+    mode = 'offline' if args.offline else 'refresh' if args.refresh else 'default'
+    rate_limiter = None
+    if args.max_rate > 0:
+        rate_limiter = RateLimiter(args.max_rate, max_concurrency=args.concurrency)
+    client = HttpClient(timeout=args.timeout,
+                        retries=args.retries,
+                        pool_size=args.concurrency,
+                        rate_limiter=rate_limiter)
+    return client, cache, PageFetcher(cache, mode, client)
+
+
+def add_build_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    向命令行参数解析器中添加只用于汉字牌组的参数，包括解析进程数、媒体文件、增量
+    生成和断点续做相关的参数。
+
+    :param parser: 命令行参数解析器。
+    """
+    parser.add_argument('--parse-workers', type=int, default=None, metavar='N',
+                        help='并行解析字典页面的进程数，默认为CPU的核数；为0表示在下载线程中解析')
+    parser.add_argument('--media-dir', metavar='DIR',
+                        help='将卡片引用的图片和读音下载到此Anki媒体文件夹，并改写为本地引用')
+    parser.add_argument('--incremental', action='store_true',
+                        help='增量生成：复用输出文件中已有的卡片数据，只查询新增的汉字')
+    parser.add_argument('--resume', action='store_true',
+                        help='继续上次中断的生成：跳过日志文件（输出文件名加 .journal）中'
+                             '已完成的汉字')
+    parser.add_argument('--examples-index', default=DEFAULT_EXAMPLES_FILE, metavar='FILE',
+                        help=f'例词例句索引数据库文件，默认为 {DEFAULT_EXAMPLES_FILE}')
+
+
+def check_build_arguments(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    """
+    检查由 `add_build_arguments()` 添加的命令行参数；若参数有误则退出程序。
+
+    :param parser: 命令行参数解析器。
+    :param args: 解析得到的命令行参数。
+    """
+    if args.parse_workers is not None and args.parse_workers < 0:
+        parser.error('--parse-workers must be a non-negative integer')
+
+
+def build_deck(input_files: List[str],
+               output_file: str,
+               args: argparse.Namespace,
+               client: HttpClient,
+               fetcher: PageFetcher,
+               apkg_file: Optional[str] = None,
+               deck: str = '汉字',
+               examples: Optional[Callable[[], ExampleIndex]] = None,
+               anki_url: Optional[str] = None,
+               fetch_pool: Optional[Executor] = None) \
+        -> List[CardRecord]:
+    """
+    为输入文件中的汉字生成Anki卡片表格文件，并按需下载媒体文件、导出Anki牌组包、
+    同步到Anki。
+
+    :param input_files: 输入文件的文件名列表。
+    :param output_file: 输出文件名。
+    :param args: 由 `add_lookup_arguments()` 和 `add_build_arguments()` 添加的命令行
+        参数。
+    :param client: 用于下载媒体文件的HTTP客户端。
+    :param fetcher: 用于获取字典页面内容的获取器。
+    :param apkg_file: 导出的Anki牌组包文件；若为 `None` 则不导出。
+    :param deck: 导出的Anki牌组名称。
+    :param examples: 打开例词例句索引的函数，见 `generate_cards()`；若为 `None` 则
+        不列出例词例句。
+    :param anki_url: AnkiConnect插件的地址；若为 `None` 则不同步到Anki。
+    :param fetch_pool: 下载字典页面的共享线程池，见 `generate_cards()`。
+    :return: 写入输出文件的所有卡片的数据。
+    :raise IncompleteDeckError: 若有汉字查询失败；此时保留日志文件，以便断点续做，
+        也不下载媒体文件、导出或同步牌组。
+    :raise AnkiConnectError: 若同步到Anki失败。
+    """
+    previous = read_cards(output_file)
+    existing = previous if args.incremental else None
+    journal = Journal(journal_path(output_file), resume=args.resume)
+    characters = collect_characters(input_files)
+    try:
+        cards = generate_cards(characters, output_file, args.concurrency, fetcher,
+                               existing, args.parse_workers, journal, examples, previous,
+                               fetch_pool)
+        journal.close(remove=True)
+        if args.media_dir:
+            downloader = MediaDownloader(args.media_dir, client, args.concurrency,
+                                         offline=args.offline)
+            localize_card_file(output_file, downloader,
+                               image_columns=[2], sound_columns=[3])
+            if apkg_file or anki_url:
+                localize_fields([fields for fields, _ in cards], downloader,
+                                image_columns=[2], sound_columns=[3])
+        if apkg_file:
+            export_apkg(apkg_file, deck, CHARACTER_NOTE_TYPE,
+                        ((note_fields(fields), tags) for fields, tags in cards),
+                        media_dir=args.media_dir)
+        if anki_url:
+            push_to_anki(anki_url, deck, CHARACTER_NOTE_TYPE,
+                         ((note_fields(fields), tags) for fields, tags in cards))
+    finally:
+        characters.close()
+        journal.close()
+    return cards
 
 
 def main():
-    if len(sys.argv) < 3:
-        print(f'Usage: python3 {sys.argv[0]} input_file1 input_file2 ... output_file')
-        return
-    input_files = sys.argv[1:-1]
-    output_file = sys.argv[-1]
+    parser = argparse.ArgumentParser(description='为指定的汉字制作Anki卡片。')
+    parser.add_argument('input_files', nargs='+', metavar='input_file',
+                        help='输入文件名，可指定多个')
+    parser.add_argument('output_file',
+                        help='输出文件名；扩展名为 .jsonl 时输出JSON Lines格式，为 .txt、.csv '
+                             '或 .tsv 时输出Anki卡片表格；Anki牌组包请用 --apkg 导出')
+    add_lookup_arguments(parser)
+    add_build_arguments(parser)
+    parser.add_argument('--apkg', metavar='FILE',
+                        help='同时将卡片直接导出为此Anki牌组包（.apkg）文件')
+    parser.add_argument('--deck', default='汉字', metavar='NAME',
+                        help='导出的Anki牌组名称，默认为“汉字”')
+    parser.add_argument('--anki-connect', nargs='?', const=DEFAULT_ANKI_URL, metavar='URL',
+                        help='同时通过AnkiConnect插件将卡片同步到正在运行的Anki中，只发送新增或'
+                             f'有变化的卡片；默认地址为 {DEFAULT_ANKI_URL}')
+    parser.add_argument('--word-cards', metavar='FILE',
+                        help='生词的卡片表格文件，例如 cards/words.txt；指定时在汉字卡片中列出例词')
+    parser.add_argument('--sentence-cards', metavar='FILE',
+                        help='句子的卡片表格文件，例如 cards/sentences.txt；指定时在汉字卡片中'
+                             '列出例句')
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='运行结束时将各阶段的耗时、缓存命中率和失败次数等指标写入此文件')
+    parser.add_argument('--metrics-format', choices=REPORT_FORMATS, default='json',
+                        help='指标报告的格式，默认为json')
+    args = parser.parse_args()
+    check_lookup_arguments(parser, args)
+    check_build_arguments(parser, args)
+    try:
+        get_card_writer_class(args.output_file)
+    except ValueError as e:
+        parser.error(str(e))
 
     logging.basicConfig(level=logging.INFO,
                         format='%(asctime)s %(levelname)s - %(message)s')
-    if os.path.exists(output_file):
-        os.remove(output_file)
-    characters = collect_characters(input_files)
-    generate_cards(characters, output_file)
+    examples = None
+    if args.word_cards or args.sentence_cards:
+        examples = functools.partial(open_examples, args.examples_index,
+                                     args.word_cards, args.sentence_cards)
+    client, cache, fetcher = open_session(args)
+    try:
+        build_deck(args.input_files, args.output_file, args, client, fetcher,
+                   args.apkg, args.deck, examples, args.anki_connect)
+    except (IncompleteDeckError, AnkiConnectError) as e:
+        logging.getLogger(__name__).error('%s', e)
+        sys.exit(1)
+    finally:
+        if args.metrics:
+            default_metrics().write_report(args.metrics, args.metrics_format)
+        client.close()
+        if cache is not None:
+            cache.close()
 
 
 if __name__ == '__main__':
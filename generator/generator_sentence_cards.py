@@ -4,88 +4,120 @@
 #    All rights reserved.                                                      =
 #                                                                              =
 # ==============================================================================
+import argparse
 import logging
-import os
 import sys
-from typing import List, Dict, Set
+from typing import List, Optional
 
-logger = logging.getLogger(__name__)
+from anki_connect import DEFAULT_URL as DEFAULT_ANKI_URL, AnkiConnectError, push_to_anki
+from apkg_exporter import SENTENCE_NOTE_TYPE, export_apkg
+from card_file import CardRecord
+from card_writer import get_card_writer_class, open_card_writer
+from corpus import DEFAULT_MAX_ITEMS, Corpus, read_paragraphs
+from metrics import REPORT_FORMATS, ProgressReporter, default_metrics
 
 
-def add_sentence(sentence: str, book: str, chapter: str, result: Dict[str, Set[str]]):
-    if sentence:
-        tag = f'{book}{chapter}'
-        if sentence in result:
-            result[sentence].add(tag)
-        else:
-            result[sentence] = {tag}
-        logger.info('Reading sentence: %s [%s]', sentence, tag)
-
-
-def collect_sentences(input_files: List[str]) -> Dict[str, Set[str]]:
+def collect_sentences(input_files: List[str],
+                      max_items: int = DEFAULT_MAX_ITEMS) -> Corpus:
     """
     收集所有待制作卡片的句子及其标签。
 
+    同一段落（以空行或章节行隔开）中的多行拼成一个句子。
+
     :param input_files: 输入文件的文件名列表。
-    :return: 包含所有句子及其对应的标签的字典。
+    :param max_items: 在内存中聚合的最大句子个数，超出后转存到磁盘上。
+    :return: 包含所有句子及其对应的标签的语料。
     """
-    result = {}
-    for input_file in input_files:
-        logger.info('Processing input file: %s', input_file)
-        with open(input_file, 'r', encoding='utf-8') as file:
-            lines = file.readlines()
-            book = os.path.splitext(os.path.basename(input_file))[0]
-            chapter = ''
-            sentence = ''
-            for line in lines:
-                line = line.strip()
-                if line.startswith('#'):
-                    add_sentence(sentence, book, chapter, result)
-                    sentence = ''
-                    chapter = line[1:].strip()
-                elif line:
-                    # if sentence:
-                    #     sentence += '<br>'
-                    sentence += line
-                else:
-                    add_sentence(sentence, book, chapter, result)
-                    sentence = ''
-            add_sentence(sentence, book, chapter, result)
-    return result
-
-
-def generate_cards(sentences: Dict[str, Set[str]], output_file: str):
+    return Corpus(read_paragraphs(input_files), 'sentence', max_items)
+
+
+def generate_cards(sentences: Corpus,
+                   output_file: str) -> List[CardRecord]:
     """
     生成Anki卡片表格数据并将其写入输出文件。
 
-    :param sentences: 包含现有句子及其对应标签的字典
+    :param sentences: 包含现有句子及其对应标签的语料。
     :param output_file: 输出文件名。
+    :return: 写入输出文件的所有卡片的数据。
     """
-    logger = logging.getLogger(__name__)
-    total = len(sentences)
-    current = 0
-    with open(output_file, 'w', encoding='utf-8') as file:
+    metrics = default_metrics()
+    progress = ProgressReporter(sentences.read_all(), 'sentences',
+                                logger=logging.getLogger(__name__))
+    cards = []
+    with open_card_writer(output_file) as writer:
         for sentence, tags in sentences.items():
-            current += 1
-            tags_str = ' '.join(tags)
-            logger.info('Processing sentence %d/%d: %s [%s]', current, total, sentence, tags_str)
-            line = f'{sentence}|{tags_str}\n'
-            file.write(line)
+            progress.advance()
+            card = CardRecord([sentence], tags)
+            with metrics.timer('hanzi_write_seconds', kind='sentence'):
+                writer.write(card)
+            metrics.inc('hanzi_cards_total', kind='sentence')
+            cards.append(card)
+    progress.finish()
+    return cards
+
+
+def build_deck(input_files: List[str],
+               output_file: str,
+               apkg_file: Optional[str] = None,
+               deck: str = '句子',
+               anki_url: Optional[str] = None) -> List[CardRecord]:
+    """
+    为输入文件中的句子生成Anki卡片表格文件，并按需导出Anki牌组包、同步到Anki。
+
+    :param input_files: 输入文件的文件名列表。
+    :param output_file: 输出文件名。
+    :param apkg_file: 导出的Anki牌组包文件；若为 `None` 则不导出。
+    :param deck: 导出的Anki牌组名称。
+    :param anki_url: AnkiConnect插件的地址；若为 `None` 则不同步到Anki。
+    :return: 写入输出文件的所有卡片的数据。
+    :raise AnkiConnectError: 若同步到Anki失败。
+    """
+    sentences = collect_sentences(input_files)
+    try:
+        cards = generate_cards(sentences, output_file)
+    finally:
+        sentences.close()
+    if apkg_file:
+        export_apkg(apkg_file, deck, SENTENCE_NOTE_TYPE, cards)
+    if anki_url:
+        push_to_anki(anki_url, deck, SENTENCE_NOTE_TYPE, cards)
+    return cards
 
 
 def main():
-    if len(sys.argv) < 3:
-        print(f'Usage: python3 {sys.argv[0]} input_file1 input_file2 ... output_file')
-        return
-    input_files = sys.argv[1:-1]
-    output_file = sys.argv[-1]
+    parser = argparse.ArgumentParser(description='为指定的句子制作Anki卡片。')
+    parser.add_argument('input_files', nargs='+', metavar='input_file',
+                        help='输入文件名，可指定多个')
+    parser.add_argument('output_file',
+                        help='输出文件名；扩展名为 .jsonl 时输出JSON Lines格式，为 .txt、.csv '
+                             '或 .tsv 时输出Anki卡片表格；Anki牌组包请用 --apkg 导出')
+    parser.add_argument('--apkg', metavar='FILE',
+                        help='同时将卡片直接导出为此Anki牌组包（.apkg）文件')
+    parser.add_argument('--deck', default='句子', metavar='NAME',
+                        help='导出的Anki牌组名称，默认为“句子”')
+    parser.add_argument('--anki-connect', nargs='?', const=DEFAULT_ANKI_URL, metavar='URL',
+                        help='同时通过AnkiConnect插件将卡片同步到正在运行的Anki中，只发送新增或'
+                             f'有变化的卡片；默认地址为 {DEFAULT_ANKI_URL}')
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='运行结束时将各阶段的耗时等指标写入此文件')
+    parser.add_argument('--metrics-format', choices=REPORT_FORMATS, default='json',
+                        help='指标报告的格式，默认为json')
+    args = parser.parse_args()
+    try:
+        get_card_writer_class(args.output_file)
+    except ValueError as e:
+        parser.error(str(e))
 
     logging.basicConfig(level=logging.INFO,
                         format='%(asctime)s %(levelname)s - %(message)s')
-    if os.path.exists(output_file):
-        os.remove(output_file)
-    sentences = collect_sentences(input_files)
-    generate_cards(sentences, output_file)
+    try:
+        build_deck(args.input_files, args.output_file, args.apkg, args.deck, args.anki_connect)
+    except AnkiConnectError as e:
+        logging.getLogger(__name__).error('%s', e)
+        sys.exit(1)
+    finally:
+        if args.metrics:
+            default_metrics().write_report(args.metrics, args.metrics_format)
 
 
 if __name__ == '__main__':
@@ -4,78 +4,258 @@
 #    All rights reserved.                                                      =
 #                                                                              =
 # ==============================================================================
+import argparse
 import logging
-import os
 import sys
-from typing import List, Dict, Set
+from concurrent.futures import Executor
+from typing import Iterator, List, Optional
 
+from anki_connect import DEFAULT_URL as DEFAULT_ANKI_URL, AnkiConnectError, push_to_anki
+from apkg_exporter import WORD_NOTE_TYPE, export_apkg
+from card_file import CardRecord
+from card_writer import get_card_writer_class, open_card_writer
+from corpus import DEFAULT_MAX_ITEMS, Corpus, read_items
+from extraction import DictRecord
+from generator_character_cards import (add_lookup_arguments, check_lookup_arguments,
+                                       get_dict_page, open_session)
+from metrics import REPORT_FORMATS, ProgressReporter, default_metrics
+from page_fetcher import PageFetcher, FetchError
+from pipeline import staged_map
+from zdic_word_page import ZdicWordPage
 
-def collect_words(input_files: List[str]) -> Dict[str, Set[str]]:
+WORD_FIELDS = ('pinyin', 'definitions')
+"""
+生词卡片中需要查询的字段。
+"""
+
+
+def collect_words(input_files: List[str],
+                  max_items: int = DEFAULT_MAX_ITEMS) -> Corpus:
     """
     收集所有待制作卡片的生词及其标签。
 
     :param input_files: 输入文件的文件名列表。
-    :return: 包含所有生词及其对应的标签的字典。
+    :param max_items: 在内存中聚合的最大生词个数，超出后转存到磁盘上。
+    :return: 包含所有生词及其对应的标签的语料。
+    """
+    return Corpus(read_items(input_files), 'word', max_items)
+
+
+def lookup_word(word: str, fetcher: Optional[PageFetcher] = None) -> DictRecord:
+    """
+    查询指定生词的拼音和释义。
+
+    先查询汉典的词语页面；若其中没有该生词的拼音（例如汉典未收录该词语），则由
+    生词中各个汉字的拼音拼接而成。汉字的拼音取自汉字牌组所用的字典页面，这些页面
+    通常已被汉字牌组下载并缓存，不会产生新的网络请求；只要有一个汉字的拼音无法
+    获取，生词的拼音就视为缺失。无法获取的页面只记录警告，对应的字段视为缺失。
+
+    :param word: 指定的生词。
+    :param fetcher: 用于获取页面内容的获取器；若为 `None` 则直接从网络下载。
+    :return: 该生词的信息，其中图片和读音字段总为 `None`，无法获取的字段为 `None`。
     """
     logger = logging.getLogger(__name__)
-    result = {}
-    for input_file in input_files:
-        logger.info('Processing input file: %s', input_file)
-        with open(input_file, 'r', encoding='utf-8') as file:
-            lines = file.readlines()
-            book = os.path.splitext(os.path.basename(input_file))[0]
-            chapter = ''
-            for line in lines:
-                line = line.strip()
-                if line.startswith('#'):
-                    chapter = line[1:].strip()
-                elif line:
-                    tag = f'{book}{chapter}'
-                    chars = [c.strip() for c in line.split('、') if c.strip()]
-                    total = len(chars)
-                    current = 0
-                    for c in chars:
-                        current += 1
-                        if c in result:
-                            result[c].add(tag)
-                        else:
-                            result[c] = {tag}
-                        logger.info('Reading word %d/%d: %s [%s]', current, total, c, tag)
-    return result
-
-
-def generate_cards(words: Dict[str, Set[str]], output_file: str):
+    page = ZdicWordPage(word, fetcher)
+    try:
+        record = page.lookup()
+    except FetchError as e:
+        logger.warning('Failed to fetch page for word "%s": %s', word, e)
+        record = DictRecord(None, None, None, None)
+    if not record.pinyin:
+        syllables = []
+        for ch in word:
+            try:
+                syllables.append(get_dict_page(ch, fetcher).get_pinyin() or '')
+            except FetchError as e:
+                logger.warning('Failed to fetch page for character "%s" of word "%s": %s',
+                               ch, word, e)
+                syllables.append('')
+        # 缺少任一汉字的拼音时拼接结果不完整，宁可视为缺失
+        if all(syllables):
+            record = record._replace(pinyin=' '.join(syllables))
+    return record
+
+
+def _lookup_result(word: str, record: DictRecord) -> DictRecord:
+    """
+    流水线解析阶段的函数：查询结果已在获取阶段得到，原样返回。
+
+    :param word: 指定的生词。
+    :param record: 获取阶段得到的该生词的信息。
+    :return: 该生词的信息。
+    """
+    return record
+
+
+def card_fields(word: str, record: DictRecord) -> List[str]:
+    """
+    生成指定生词对应的Anki卡片的字段值（不含标签）。
+
+    :param word: 指定的生词。
+    :param record: 该生词的信息。
+    :return: 该生词对应的Anki卡片的字段值列表，依次为生词、拼音和释义，缺失的
+        字段值为 `'None'`。
+    """
+    return [word, str(record.pinyin), str(record.definitions)]
+
+
+def note_fields(fields: List[str]) -> List[Optional[str]]:
+    """
+    将Anki卡片表格数据的字段值转换为Anki笔记的字段值，缺失的字段值转换为 `None`。
+
+    :param fields: 该卡片的字段值列表（不含标签）。
+    :return: 对应的Anki笔记的字段值列表。
+    """
+    return [None if value == 'None' else value for value in fields]
+
+
+def generate_cards(words: Corpus,
+                   output_file: str,
+                   concurrency: int = 1,
+                   fetcher: Optional[PageFetcher] = None,
+                   fetch_pool: Optional[Executor] = None) -> List[CardRecord]:
     """
     生成Anki卡片表格数据并将其写入输出文件。
 
-    :param words: 包含现有生词及其对应标签的字典
+    生词由 `concurrency` 个线程并发查询。语料中的生词已去重，因此各书籍中重复
+    出现的生词只查询一次；生词一读到就开始查询，不必等待所有输入文件读完，进度
+    报告的总数随着生词的读取而增加。所有生词都查询完成后，按生词第一次出现的顺序
+    写入输出文件。查询失败的
+    生词也会写入输出文件，其无法获取的字段值为 `'None'`，因此网络故障不会使牌组丢失
+    卡片。
+
+    :param words: 包含现有生词及其对应标签的语料。
     :param output_file: 输出文件名。
+    :param concurrency: 并发查询生词的线程数，默认为1。
+    :param fetcher: 用于获取页面内容的获取器；若为 `None` 则直接从网络下载。
+    :param fetch_pool: 查询生词的共享线程池，见 `pipeline.staged_map()`；若为 `None`
+        则创建一个有 `concurrency` 个线程的线程池。
+    :return: 写入输出文件的所有卡片的数据。
     """
     logger = logging.getLogger(__name__)
-    total = len(words)
-    current = 0
-    with open(output_file, 'w', encoding='utf-8') as file:
+    metrics = default_metrics()
+    progress = ProgressReporter(0, 'words', logger=logger)
+    looked_up = {}
+
+    def fetch(word: str) -> DictRecord:
+        with metrics.timer('hanzi_fetch_seconds', source='zdic_word'):
+            return lookup_word(word, fetcher)
+
+    def to_look_up() -> Iterator[str]:
+        for word in words.new_items():
+            progress.expect()
+            yield word
+
+    lookups = staged_map(to_look_up(),
+                         fetch,
+                         _lookup_result,
+                         fetch_workers=concurrency,
+                         parse_workers=0,
+                         max_pending=max(64, 4 * concurrency),
+                         fetch_pool=fetch_pool)
+    for word, future in lookups:
+        progress.advance()
+        try:
+            record = future.result()
+        except FetchError as e:
+            metrics.inc('hanzi_fetch_failures_total', source='zdic_word')
+            logger.error('Failed to look up word "%s": %s', word, e)
+            record = DictRecord(None, None, None, None)
+        missing = [field for field in WORD_FIELDS if not getattr(record, field)]
+        for field in missing:
+            metrics.inc('hanzi_missing_fields_total', source='zdic_word', field=field)
+        if missing:
+            logger.error('Failed to get %s for word "%s"', ', '.join(missing), word)
+        looked_up[word] = card_fields(word, record)
+    progress.finish()
+    cards = []
+    with open_card_writer(output_file) as writer:
         for word, tags in words.items():
-            current += 1
-            tags_str = ' '.join(tags)
-            logger.info('Processing word %d/%d: %s [%s]', current, total, word, tags_str)
-            line = f'{word}|{tags_str}\n'
-            file.write(line)
+            card = CardRecord(looked_up[word], tags)
+            with metrics.timer('hanzi_write_seconds', kind='word'):
+                writer.write(card)
+            metrics.inc('hanzi_cards_total', kind='word')
+            cards.append(card)
+    return cards
+
+
+def build_deck(input_files: List[str],
+               output_file: str,
+               concurrency: int = 1,
+               fetcher: Optional[PageFetcher] = None,
+               apkg_file: Optional[str] = None,
+               deck: str = '生词',
+               anki_url: Optional[str] = None,
+               fetch_pool: Optional[Executor] = None) -> List[CardRecord]:
+    """
+    为输入文件中的生词生成Anki卡片表格文件，并按需导出Anki牌组包、同步到Anki。
+
+    :param input_files: 输入文件的文件名列表。
+    :param output_file: 输出文件名。
+    :param concurrency: 并发查询生词的线程数，默认为1。
+    :param fetcher: 用于获取页面内容的获取器；若为 `None` 则直接从网络下载。
+    :param apkg_file: 导出的Anki牌组包文件；若为 `None` 则不导出。
+    :param deck: 导出的Anki牌组名称。
+    :param anki_url: AnkiConnect插件的地址；若为 `None` 则不同步到Anki。
+    :param fetch_pool: 查询生词的共享线程池，见 `generate_cards()`。
+    :return: 写入输出文件的所有卡片的数据。
+    :raise AnkiConnectError: 若同步到Anki失败。
+    """
+    words = collect_words(input_files)
+    try:
+        cards = generate_cards(words, output_file, concurrency, fetcher, fetch_pool)
+    finally:
+        words.close()
+    if apkg_file:
+        export_apkg(apkg_file, deck, WORD_NOTE_TYPE,
+                    ((note_fields(fields), tags) for fields, tags in cards))
+    if anki_url:
+        push_to_anki(anki_url, deck, WORD_NOTE_TYPE,
+                     ((note_fields(fields), tags) for fields, tags in cards))
+    return cards
 
 
 def main():
-    if len(sys.argv) < 3:
-        print(f'Usage: python3 {sys.argv[0]} input_file1 input_file2 ... output_file')
-        return
-    input_files = sys.argv[1:-1]
-    output_file = sys.argv[-1]
+    parser = argparse.ArgumentParser(description='为指定的生词制作Anki卡片。')
+    parser.add_argument('input_files', nargs='+', metavar='input_file',
+                        help='输入文件名，可指定多个')
+    parser.add_argument('output_file',
+                        help='输出文件名；扩展名为 .jsonl 时输出JSON Lines格式，为 .txt、.csv '
+                             '或 .tsv 时输出Anki卡片表格；Anki牌组包请用 --apkg 导出')
+    add_lookup_arguments(parser)
+    parser.add_argument('--apkg', metavar='FILE',
+                        help='同时将卡片直接导出为此Anki牌组包（.apkg）文件')
+    parser.add_argument('--deck', default='生词', metavar='NAME',
+                        help='导出的Anki牌组名称，默认为“生词”')
+    parser.add_argument('--anki-connect', nargs='?', const=DEFAULT_ANKI_URL, metavar='URL',
+                        help='同时通过AnkiConnect插件将卡片同步到正在运行的Anki中，只发送新增或'
+                             f'有变化的卡片；默认地址为 {DEFAULT_ANKI_URL}')
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='运行结束时将各阶段的耗时、缓存命中率和失败次数等指标写入此文件')
+    parser.add_argument('--metrics-format', choices=REPORT_FORMATS, default='json',
+                        help='指标报告的格式，默认为json')
+    args = parser.parse_args()
+    check_lookup_arguments(parser, args)
+    try:
+        get_card_writer_class(args.output_file)
+    except ValueError as e:
+        parser.error(str(e))
 
     logging.basicConfig(level=logging.INFO,
                         format='%(asctime)s %(levelname)s - %(message)s')
-    if os.path.exists(output_file):
-        os.remove(output_file)
-    words = collect_words(input_files)
-    generate_cards(words, output_file)
+    client, cache, fetcher = open_session(args)
+    try:
+        build_deck(args.input_files, args.output_file, args.concurrency, fetcher,
+                   args.apkg, args.deck, args.anki_connect)
+    except AnkiConnectError as e:
+        logging.getLogger(__name__).error('%s', e)
+        sys.exit(1)
+    finally:
+        if args.metrics:
+            default_metrics().write_report(args.metrics, args.metrics_format)
+        client.close()
+        if cache is not None:
+            cache.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,215 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import logging
+import random
+import threading
+import time
+from typing import TYPE_CHECKING, Optional
+from urllib.parse import urlparse
+
+from rate_limiter import RateLimiter, parse_retry_after
+
+if TYPE_CHECKING:
+    import requests
+
+DEFAULT_TIMEOUT = 20.0
+"""
+HTTP请求的默认超时时间，单位为秒。
+"""
+
+DEFAULT_RETRIES = 3
+"""
+HTTP请求失败后的默认重试次数。
+"""
+
+DEFAULT_BACKOFF = 0.5
+"""
+HTTP请求重试的默认初始退避时间，单位为秒；每次重试后退避时间加倍。
+"""
+
+DEFAULT_USER_AGENT = ('Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) '
+                      'AppleWebKit/537.36 (KHTML, like Gecko) '
+                      'Chrome/118.0.0.0 Safari/537.36')
+"""
+HTTP请求默认使用的 User-Agent 头。
+"""
+
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+"""
+需要重试的HTTP响应状态码。
+"""
+
+
+class FetchError(Exception):
+    """
+    表示无法获取字典网页页面内容时抛出的异常。
+    """
+
+
+class HttpClient:
+    """
+    此模型表示一个共享的HTTP客户端。
+
+    客户端内部使用一个 `requests.Session`，为每个主机维护一个保持长连接的连接池，
+    从而在多个汉字之间复用TCP/TLS连接。`requests` 模块和会话都在第一次请求时才
+    导入和创建，因此所有页面都命中缓存时不会导入HTTP相关的模块。每个请求都有超时限制；连接失败、超时或
+    返回可重试的状态码时，按指数退避（带随机抖动）重试。成功的响应会校验其状态码
+    和字符编码，并统一转换为UTF-8编码的内容。
+
+    若指定了限流器，每次请求前都先等待对应主机的限流器放行，请求结束后再将其
+    状态码、耗时和 `Retry-After` 头报告给限流器；重试前的退避时间也不短于
+    `Retry-After` 指定的时间。
+
+    此对象可在多个线程之间共享。
+    """
+    def __init__(self,
+                 timeout: float = DEFAULT_TIMEOUT,
+                 retries: int = DEFAULT_RETRIES,
+                 backoff: float = DEFAULT_BACKOFF,
+                 pool_size: int = 10,
+                 user_agent: str = DEFAULT_USER_AGENT,
+                 rate_limiter: Optional[RateLimiter] = None) -> None:
+        """
+        构造函数。
+
+        :param timeout: 每个请求的超时时间，单位为秒。
+        :param retries: 请求失败后的最大重试次数。
+        :param backoff: 第一次重试前的退避时间，单位为秒，之后每次重试加倍。
+        :param pool_size: 每个主机的连接池中最多保持的连接数，应不小于并发线程数。
+        :param user_agent: 请求使用的 User-Agent 头。
+        :param rate_limiter: 按主机限流的限流器；若为 `None` 则不限流。
+        """
+        self._timeout = timeout
+        self._retries = retries
+        self._backoff = backoff
+        self._pool_size = pool_size
+        self._user_agent = user_agent
+        self._rate_limiter = rate_limiter
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._lock = threading.Lock()
+        self._session: Optional['requests.Session'] = None
+
+    def get(self, url: str) -> bytes:
+        """
+        下载指定URL的内容。
+
+        :param url: 指定的URL。
+        :return: 该URL对应的内容，文本内容统一转换为UTF-8编码。
+        :raise FetchError: 若重试多次后仍无法成功下载。
+        """
+        import requests
+        session = self._get_session()
+        limiter = None
+        if self._rate_limiter is not None:
+            limiter = self._rate_limiter.host(urlparse(url).netloc)
+        attempt = 0
+        while True:
+            status = None
+            retry_after = None
+            if limiter is not None:
+                limiter.acquire()
+            start = time.monotonic()
+            try:
+                response = session.get(url, timeout=self._timeout)
+                status = response.status_code
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            except requests.RequestException as e:
+                error = f'{e.__class__.__name__}: {e}'
+            finally:
+                # 无论请求如何结束都要归还并发名额，否则该主机的并发上限会永久减少
+                if limiter is not None:
+                    limiter.release(status, time.monotonic() - start, retry_after)
+            if status is not None:
+                if status not in RETRY_STATUS_CODES:
+                    return self._check_response(url, response)
+                error = f'HTTP status {status}'
+            if attempt >= self._retries:
+                raise FetchError(f'Failed to download {url} after {attempt + 1} attempts: {error}')
+            delay = self._backoff * (2 ** attempt) * (0.5 + random.random())
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            attempt += 1
+            self._logger.warning('Retrying %s in %.2fs (attempt %d/%d): %s',
+                                 url, delay, attempt, self._retries, error)
+            time.sleep(delay)
+
+    def close(self) -> None:
+        """
+        关闭此客户端的所有连接。
+        """
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def _get_session(self) -> 'requests.Session':
+        """
+        获取此客户端的会话，第一次调用时创建。
+
+        :return: 此客户端的会话。
+        """
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                session.headers['User-Agent'] = self._user_agent
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self._pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._session = session
+            return self._session
+
+    @staticmethod
+    def _check_response(url: str, response: 'requests.Response') -> bytes:
+        """
+        校验响应的状态码和字符编码。
+
+        :param url: 请求的URL。
+        :param response: 响应对象。
+        :return: 响应的内容，文本内容统一转换为UTF-8编码。
+        :raise FetchError: 若响应状态码表示失败、内容为空或无法按其字符编码解码。
+        """
+        if response.status_code != 200:
+            raise FetchError(f'Unexpected HTTP status {response.status_code}: {url}')
+        content = response.content
+        if not content:
+            raise FetchError(f'Empty response: {url}')
+        content_type = response.headers.get('Content-Type', '').lower()
+        if not content_type.startswith('text/'):
+            return content
+        if 'charset=' in content_type:
+            # 响应头中明确声明的字符编码必须能正确解码
+            encodings = [response.encoding]
+        else:
+            # 未声明字符编码时 requests 默认使用 ISO-8859-1，不可信
+            encodings = ['utf-8', response.apparent_encoding]
+        for encoding in encodings:
+            if encoding is None:
+                continue
+            try:
+                return content.decode(encoding).encode('utf-8')
+            except (LookupError, UnicodeDecodeError):
+                pass
+        raise FetchError(f'Cannot decode content as {encodings}: {url}')
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def default_client() -> HttpClient:
+    """
+    获取进程内共享的默认HTTP客户端。
+
+    :return: 进程内共享的默认HTTP客户端。
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = HttpClient()
+        return _default_client
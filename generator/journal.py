@@ -0,0 +1,171 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List
+
+DEFAULT_BATCH_SIZE = 32
+"""
+日志默认的批量写入条数。
+"""
+
+DEFAULT_FLUSH_INTERVAL = 1.0
+"""
+日志默认的最长写入间隔，单位为秒。
+"""
+
+
+class Journal:
+    """
+    此模型表示记录已完成的卡片数据的只追加日志文件。
+
+    日志文件的每一行是一条JSON记录，包含汉字、字典来源和该汉字的卡片字段值。
+    记录先缓存在内存中，每累积 `batch_size` 条或距上次写入超过 `flush_interval`
+    秒时，批量追加到文件末尾并同步到磁盘。进程崩溃时最多丢失最后一批记录；文件
+    末尾不完整的一行在读取时会被忽略。
+
+    此对象可在多个线程之间共享。
+    """
+    def __init__(self,
+                 path: str,
+                 resume: bool = False,
+                 batch_size: int = DEFAULT_BATCH_SIZE,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL) -> None:
+        """
+        构造函数。
+
+        :param path: 日志文件的路径。
+        :param resume: 是否继续使用已有的日志文件；若为 `False` 则清空已有的日志。
+        :param batch_size: 批量写入的条数。
+        :param flush_interval: 最长写入间隔，单位为秒。
+        """
+        self._path = path
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._lock = threading.Lock()
+        self._buffer: List[str] = []
+        self._flushed_at = time.monotonic()
+        self._entries = self._read() if resume else []
+        self._file = open(path, 'a' if resume else 'w', encoding='utf-8')
+        if self._file.tell() > 0:
+            # 确保新的记录不会接在崩溃时写了一半的最后一行之后
+            with open(path, 'rb') as file:
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b'\n':
+                    self._file.write('\n')
+
+    @property
+    def path(self) -> str:
+        """
+        获取日志文件的路径。
+
+        :return: 日志文件的路径。
+        """
+        return self._path
+
+    def completed(self, source: str) -> Dict[str, List[str]]:
+        """
+        获取打开日志时其中已记录的、指定字典来源的已完成的卡片数据。
+
+        :param source: 字典来源。
+        :return: 以汉字为键、以卡片字段值列表（不含标签）为值的字典。
+        """
+        return {entry['char']: entry['fields'] for entry in self._entries
+                if entry.get('source') == source}
+
+    def append(self, char: str, source: str, fields: List[str]) -> None:
+        """
+        记录一张已完成的卡片。
+
+        :param char: 卡片对应的汉字。
+        :param source: 卡片数据的字典来源。
+        :param fields: 卡片字段值列表（不含标签）。
+        """
+        line = json.dumps({'char': char, 'source': source, 'fields': fields},
+                          ensure_ascii=False)
+        with self._lock:
+            self._buffer.append(line + '\n')
+            if len(self._buffer) >= self._batch_size \
+                    or time.monotonic() - self._flushed_at >= self._flush_interval:
+                self._flush()
+
+    def flush(self) -> None:
+        """
+        将缓存的记录写入日志文件并同步到磁盘。
+        """
+        with self._lock:
+            self._flush()
+
+    def close(self, remove: bool = False) -> None:
+        """
+        关闭日志文件。
+
+        :param remove: 是否同时删除日志文件；卡片全部生成并写入输出文件后，日志
+            文件就不再需要了。
+        """
+        with self._lock:
+            if not self._file.closed:
+                self._flush()
+                self._file.close()
+        if remove and os.path.exists(self._path):
+            os.remove(self._path)
+
+    def _flush(self) -> None:
+        """
+        将缓存的记录写入日志文件并同步到磁盘，调用者需持有锁。
+        """
+        self._flushed_at = time.monotonic()
+        if not self._buffer:
+            return
+        self._file.writelines(self._buffer)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._buffer.clear()
+
+    def _read(self) -> List[Dict]:
+        """
+        读取已有的日志文件。
+
+        :return: 日志中的所有完整记录。
+        """
+        if not os.path.exists(self._path):
+            return []
+        entries = []
+        with open(self._path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # 崩溃时写了一半的最后一行
+                    self._logger.warning('Ignoring incomplete journal entry in %s', self._path)
+        return entries
+
+
+def journal_path(output_file: str) -> str:
+    """
+    获取指定输出文件对应的日志文件的路径。
+
+    :param output_file: 输出文件名。
+    :return: 对应的日志文件的路径。
+    """
+    return f'{output_file}.journal'
+
+
+def replace_atomically(temp_file: str, output_file: str) -> None:
+    """
+    将已完整写入的临时文件原子地替换为输出文件。
+
+    :param temp_file: 已完整写入的临时文件。
+    :param output_file: 输出文件名。
+    """
+    with open(temp_file, 'rb+') as file:
+        os.fsync(file.fileno())
+    os.replace(temp_file, output_file)
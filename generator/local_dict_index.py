@@ -0,0 +1,281 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import argparse
+import contextlib
+import gzip
+import io
+import logging
+import mmap
+import re
+import struct
+import zipfile
+from typing import Dict, IO, Iterator, List, Optional, Tuple
+
+MAGIC = b'HZIDX\x00\x00\x01'
+"""
+本地字典索引文件的文件头标识。
+"""
+
+_HEADER = struct.Struct('<8sII')
+"""
+索引文件头：标识、首个码位、码位表的条目数。
+"""
+
+_ENTRY = struct.Struct('<II')
+"""
+码位表的条目：数据区中记录的偏移量和长度；长度为0表示该码位没有记录。
+"""
+
+RECORD_SEPARATOR = '\x1f'
+"""
+索引记录中拼音和释义之间的分隔符。
+"""
+
+_TONE_MARKS = {
+    'a': 'āáǎà', 'e': 'ēéěè', 'i': 'īíǐì',
+    'o': 'ōóǒò', 'u': 'ūúǔù', 'ü': 'ǖǘǚǜ',
+}
+
+_CEDICT_PATTERN = re.compile(r'^(\S+)\s+(\S+)\s+\[([^\]]+)\]\s+/(.*)/\s*$')
+
+
+class LocalDictIndex:
+    """
+    此模型表示一个内存映射的本地字典索引文件。
+
+    索引文件由 `build_index()` 生成，包含一个按Unicode码位直接寻址的定长码位表，
+    以及存放拼音和释义的数据区。查询某个汉字时只需按其码位计算出码位表中的位置，
+    时间复杂度为O(1)，且不需要将整个文件读入内存。
+
+    此对象是只读的，可在多个线程之间共享。
+    """
+    def __init__(self, path: str) -> None:
+        """
+        构造函数。
+
+        :param path: 索引文件的路径。
+        """
+        self._path = path
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._base, self._count = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError(f'Not a local dictionary index file: {path}')
+
+    @property
+    def path(self) -> str:
+        """
+        获取索引文件的路径。
+
+        :return: 索引文件的路径。
+        """
+        return self._path
+
+    def lookup(self, ch: str) -> Optional[bytes]:
+        """
+        查询指定汉字的索引记录。
+
+        :param ch: 指定的汉字。
+        :return: 该汉字的索引记录，为UTF-8编码的 `拼音\\x1f释义`；若索引中没有该
+            汉字，或者 `ch` 不是单个字符，则返回 `None`。
+        """
+        if len(ch) != 1:
+            return None
+        index = ord(ch) - self._base
+        if index < 0 or index >= self._count:
+            return None
+        offset, length = _ENTRY.unpack_from(self._mmap, _HEADER.size + index * _ENTRY.size)
+        if length == 0:
+            return None
+        return self._mmap[offset:offset + length]
+
+    def close(self) -> None:
+        """
+        关闭索引文件。
+        """
+        self._mmap.close()
+
+
+def parse_record(content: bytes) -> Tuple[Optional[str], Optional[str]]:
+    """
+    解析一条索引记录。
+
+    :param content: 索引记录的内容。
+    :return: `(拼音, 释义)` 二元组，缺失的值为 `None`。
+    """
+    pinyin, definitions = content.decode('utf-8').split(RECORD_SEPARATOR, 1)
+    return pinyin or None, definitions or None
+
+
+def numbered_to_tone_marks(syllable: str) -> str:
+    """
+    将数字标调的拼音音节转换为符号标调的拼音音节，例如将 `ren2` 转换为 `rén`。
+
+    :param syllable: 数字标调的拼音音节。
+    :return: 符号标调的拼音音节；若音节不以声调数字结尾，则原样返回（轻声）。
+    """
+    syllable = syllable.lower().replace('u:', 'ü').replace('v', 'ü')
+    if not syllable or not syllable[-1].isdigit():
+        return syllable
+    tone = int(syllable[-1])
+    syllable = syllable[:-1]
+    if tone < 1 or tone > 4:
+        return syllable
+    if 'a' in syllable:
+        vowel = 'a'
+    elif 'e' in syllable:
+        vowel = 'e'
+    elif 'ou' in syllable:
+        vowel = 'o'
+    else:
+        vowels = [c for c in syllable if c in _TONE_MARKS]
+        if not vowels:
+            return syllable
+        vowel = vowels[-1]
+    i = syllable.rindex(vowel) if vowel not in 'ae' else syllable.index(vowel)
+    return syllable[:i] + _TONE_MARKS[vowel][tone - 1] + syllable[i + 1:]
+
+
+def read_unihan(file: IO[str]) -> Dict[int, Dict[str, str]]:
+    """
+    读取Unihan数据库中的 `Unihan_Readings.txt`。
+
+    :param file: 以文本模式打开的 `Unihan_Readings.txt` 文件。
+    :return: 以码位为键、以 `{'kMandarin': ..., 'kDefinition': ...}` 为值的字典。
+    """
+    result = {}
+    for line in file:
+        if not line.startswith('U+'):
+            continue
+        code, field, value = line.rstrip('\n').split('\t', 2)
+        if field in ('kMandarin', 'kDefinition'):
+            result.setdefault(int(code[2:], 16), {})[field] = value
+    return result
+
+
+def read_cedict(file: IO[str]) -> Dict[int, List[Tuple[str, List[str]]]]:
+    """
+    读取CC-CEDICT词典文件中的单字词条。
+
+    :param file: 以文本模式打开的CC-CEDICT词典文件。
+    :return: 以简体字的码位为键、以 `(符号标调的拼音, 英文释义列表)` 列表为值的字典。
+    """
+    result = {}
+    for line in file:
+        if line.startswith('#'):
+            continue
+        match = _CEDICT_PATTERN.match(line)
+        if not match:
+            continue
+        traditional, simplified, pinyin, senses = match.groups()
+        if len(simplified) != 1:
+            continue
+        pinyin = ' '.join(numbered_to_tone_marks(s) for s in pinyin.split())
+        # 繁简对照如 `張|张` 中的竖线与卡片表格的字段分隔符冲突
+        senses = [s.replace('|', '/') for s in senses.split('/') if s]
+        for ch in {simplified, traditional}:
+            if len(ch) == 1:
+                result.setdefault(ord(ch), []).append((pinyin, senses))
+    return result
+
+
+def build_index(output_file: str,
+                unihan: Optional[Dict[int, Dict[str, str]]] = None,
+                cedict: Optional[Dict[int, List[Tuple[str, List[str]]]]] = None) -> int:
+    """
+    由Unihan和CC-CEDICT的数据生成本地字典索引文件。
+
+    拼音优先使用Unihan的 `kMandarin`，其次使用CC-CEDICT中第一个读音；释义优先
+    使用CC-CEDICT中该字所有读音的释义，其次使用Unihan的 `kDefinition`。
+
+    :param output_file: 输出的索引文件名。
+    :param unihan: 由 `read_unihan()` 读取的数据。
+    :param cedict: 由 `read_cedict()` 读取的数据。
+    :return: 索引中的汉字个数。
+    """
+    unihan = unihan or {}
+    cedict = cedict or {}
+    records = {}
+    for code in sorted(set(unihan) | set(cedict)):
+        readings = unihan.get(code, {})
+        entries = cedict.get(code, [])
+        pinyin = readings.get('kMandarin', '').split(' ')[0]
+        if not pinyin and entries:
+            pinyin = entries[0][0]
+        senses = [sense for _, entry_senses in entries for sense in entry_senses]
+        if not senses and readings.get('kDefinition'):
+            senses = [s.strip() for s in readings['kDefinition'].split(';') if s.strip()]
+        definitions = '<br>'.join(f'{i}. {sense}' for i, sense in enumerate(senses, 1))
+        if pinyin or definitions:
+            records[code] = f'{pinyin}{RECORD_SEPARATOR}{definitions}'.encode('utf-8')
+    base = min(records) if records else 0
+    count = max(records) - base + 1 if records else 0
+    table = bytearray(count * _ENTRY.size)
+    data = io.BytesIO()
+    data_offset = _HEADER.size + len(table)
+    for code, record in records.items():
+        _ENTRY.pack_into(table, (code - base) * _ENTRY.size,
+                         data_offset + data.tell(), len(record))
+        data.write(record)
+    with open(output_file, 'wb') as file:
+        file.write(_HEADER.pack(MAGIC, base, count))
+        file.write(table)
+        file.write(data.getbuffer())
+    return len(records)
+
+
+@contextlib.contextmanager
+def _open_text(path: str, member: str) -> Iterator[IO[str]]:
+    """
+    以UTF-8文本模式打开一个可能被压缩的数据文件。
+
+    :param path: 数据文件的路径，可以是 `.zip` 或 `.gz` 压缩文件。
+    :param member: 若为 `.zip` 文件，需要读取的成员文件名。
+    :return: 已打开的文件对象的上下文管理器。
+    """
+    if path.endswith('.zip'):
+        with zipfile.ZipFile(path) as archive, archive.open(member) as raw:
+            yield io.TextIOWrapper(raw, encoding='utf-8')
+    elif path.endswith('.gz'):
+        with gzip.open(path, 'rt', encoding='utf-8') as file:
+            yield file
+    else:
+        with open(path, 'r', encoding='utf-8') as file:
+            yield file
+
+
+def main():
+    parser = argparse.ArgumentParser(description='由Unihan和CC-CEDICT数据生成本地字典索引文件。')
+    parser.add_argument('--unihan', metavar='FILE',
+                        help='Unihan.zip 或 Unihan_Readings.txt 文件')
+    parser.add_argument('--cedict', metavar='FILE',
+                        help='CC-CEDICT词典文件，可以是 .gz 压缩文件')
+    parser.add_argument('output_file', help='输出的索引文件名')
+    args = parser.parse_args()
+    if not args.unihan and not args.cedict:
+        parser.error('at least one of --unihan and --cedict is required')
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(levelname)s - %(message)s')
+    logger = logging.getLogger(__name__)
+    unihan = None
+    cedict = None
+    if args.unihan:
+        with _open_text(args.unihan, 'Unihan_Readings.txt') as file:
+            unihan = read_unihan(file)
+        logger.info('Read %d characters from %s', len(unihan), args.unihan)
+    if args.cedict:
+        with _open_text(args.cedict, '') as file:
+            cedict = read_cedict(file)
+        logger.info('Read %d characters from %s', len(cedict), args.cedict)
+    count = build_index(args.output_file, unihan, cedict)
+    logger.info('Wrote %d characters to %s', count, args.output_file)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import threading
+from typing import Dict, Optional
+
+from dict_page import DictPage
+from extraction import DictRecord
+from http_client import FetchError
+from local_dict_index import LocalDictIndex, parse_record
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def open_index(path: str) -> LocalDictIndex:
+    """
+    打开 `LocalDictPage` 使用的本地字典索引文件。
+
+    :param path: 由 `local_dict_index.py` 生成的索引文件的路径。
+    :return: 打开的本地字典索引。
+    """
+    global _index
+    with _index_lock:
+        if _index is not None:
+            _index.close()
+        _index = LocalDictIndex(path)
+        return _index
+
+
+class LocalDictPage(DictPage):
+    """
+    此模型表示指定汉字在本地字典索引中的记录。
+
+    本地字典索引由Unihan和CC-CEDICT的数据生成（参见 `local_dict_index.py`），
+    查询时完全不访问网络。索引中的释义为英文；图片和读音沿用汉典的URL规则。
+    使用前必须先调用 `open_index()` 打开索引文件。
+    """
+    SOURCE = 'local'
+
+    # 本地索引中的记录即为提取结果，无需缓存，也无需在解析进程中提取
+    EXTRACTOR_VERSION = None
+    EXTRACT_INLINE = True
+
+    @classmethod
+    def is_available(cls) -> bool:
+        return _index is not None
+
+    def fetch_content(self) -> bytes:
+        if _index is None:
+            raise FetchError('The local dictionary index is not opened.')
+        if len(self._char) != 1:
+            raise FetchError(f'"{self._char}" is not a single character.')
+        content = _index.lookup(self._char)
+        if content is None:
+            raise FetchError(f'Character "{self._char}" is not in the local index: {_index.path}')
+        return content
+
+    @classmethod
+    def extract_record(cls,
+                       char: str,
+                       content: bytes,
+                       timings: Optional[Dict[str, float]] = None) -> DictRecord:
+        pinyin, definitions = parse_record(content)
+        pronounce = None
+        if pinyin:
+            pronounce = f'https://img.zdic.net/audio/zd/py/{pinyin}.mp3'
+        image = f'https://img.zdic.net/kai/jbh/{hex(ord(char)).upper()[2:]}.gif'
+        return DictRecord(image, pinyin, pronounce, definitions)
+
+    def _get_page_url(self, ch) -> str:
+        return f'local:{ch}'
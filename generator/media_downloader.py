@@ -0,0 +1,203 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import hashlib
+import json
+import logging
+import os
+import posixpath
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+
+from card_file import iter_records
+from card_writer import open_card_writer
+from http_client import FetchError, HttpClient, default_client
+
+MANIFEST_FILE = '_hanzi_media_index.json'
+"""
+媒体文件夹中记录已下载URL及其对应本地文件名的清单文件名。
+
+Anki不会将以下划线开头的媒体文件视为未使用的文件。
+"""
+
+
+class MediaDownloader:
+    """
+    此模型表示Anki卡片中引用的图片和音频文件的下载器。
+
+    下载器将远程的媒体文件并发地下载到指定的Anki媒体文件夹中。本地文件以其内容的
+    SHA-256摘要命名，因此内容相同的文件（例如多个汉字共用的同一拼音读音）只保存
+    一份；同一URL只会下载一次。已下载的URL记录在媒体文件夹的清单文件中，再次运行
+    时若对应的本地文件仍然存在，则不再下载。
+    """
+    def __init__(self,
+                 media_dir: str,
+                 client: Optional[HttpClient] = None,
+                 concurrency: int = 8,
+                 offline: bool = False) -> None:
+        """
+        构造函数。
+
+        :param media_dir: Anki媒体文件夹的路径，若不存在将自动创建。
+        :param client: 用于下载文件的HTTP客户端；若为 `None` 则使用进程内共享的
+            默认HTTP客户端。
+        :param concurrency: 并发下载的线程数。
+        :param offline: 是否为离线模式；离线模式下只使用已下载的文件，从不访问网络。
+        """
+        os.makedirs(media_dir, exist_ok=True)
+        self._media_dir = media_dir
+        self._client = client if client is not None else default_client()
+        self._concurrency = concurrency
+        self._offline = offline
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self._lock = threading.Lock()
+        self._manifest_path = os.path.join(media_dir, MANIFEST_FILE)
+        self._manifest = self._load_manifest()
+
+    @property
+    def media_dir(self) -> str:
+        """
+        获取Anki媒体文件夹的路径。
+
+        :return: Anki媒体文件夹的路径。
+        """
+        return self._media_dir
+
+    def download_all(self, urls: Iterable[str]) -> Dict[str, str]:
+        """
+        下载指定的所有媒体文件。
+
+        :param urls: 媒体文件的URL，可以有重复。
+        :return: 以URL为键、以媒体文件夹中的本地文件名为值的字典；下载失败的URL
+            不包含在其中。
+        """
+        unique = list(dict.fromkeys(urls))
+        todo = [url for url in unique if not self._is_downloaded(url)]
+        if self._offline and todo:
+            self._logger.warning('Skipping %d media files not downloaded yet in offline mode.',
+                                 len(todo))
+            todo = []
+        self._logger.info('Downloading %d of %d media files to %s',
+                          len(todo), len(unique), self._media_dir)
+        with ThreadPoolExecutor(max_workers=self._concurrency) as executor:
+            for url, error in zip(todo, executor.map(self._download, todo)):
+                if error is not None:
+                    self._logger.error('Failed to download media file %s: %s', url, error)
+        self._save_manifest()
+        return {url: self._manifest[url] for url in unique if url in self._manifest}
+
+    def _is_downloaded(self, url: str) -> bool:
+        """
+        判断指定URL的媒体文件是否已经下载到媒体文件夹中。
+
+        :param url: 媒体文件的URL。
+        :return: 若已下载且本地文件仍然存在，则返回 `True`。
+        """
+        filename = self._manifest.get(url)
+        return filename is not None \
+            and os.path.exists(os.path.join(self._media_dir, filename))
+
+    def _download(self, url: str) -> Optional[str]:
+        """
+        下载指定URL的媒体文件。
+
+        :param url: 媒体文件的URL。
+        :return: 若下载失败，返回错误信息；否则返回 `None`。
+        """
+        try:
+            content = self._client.get(url)
+        except FetchError as e:
+            return str(e)
+        extension = posixpath.splitext(urlparse(url).path)[1].lower()
+        digest = hashlib.sha256(content).hexdigest()
+        filename = f'hanzi-{digest[:24]}{extension}'
+        path = os.path.join(self._media_dir, filename)
+        if not os.path.exists(path):
+            temp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(temp_path, 'wb') as file:
+                file.write(content)
+            os.replace(temp_path, path)
+        with self._lock:
+            self._manifest[url] = filename
+        return None
+
+    def _load_manifest(self) -> Dict[str, str]:
+        """
+        读取媒体文件夹中的清单文件。
+
+        :return: 以URL为键、以本地文件名为值的字典。
+        """
+        if not os.path.exists(self._manifest_path):
+            return {}
+        with open(self._manifest_path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+    def _save_manifest(self) -> None:
+        """
+        将清单写入媒体文件夹。
+        """
+        temp_path = f'{self._manifest_path}.tmp'
+        with self._lock, open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(self._manifest, file, ensure_ascii=False, indent=0, sort_keys=True)
+        os.replace(temp_path, self._manifest_path)
+
+
+def is_remote(value: Optional[str]) -> bool:
+    """
+    判断卡片字段的值是否为远程媒体文件的URL。
+
+    :param value: 卡片字段的值。
+    :return: 若该值是以 `http://` 或 `https://` 开头的URL，则返回 `True`。
+    """
+    return value is not None and value.startswith(('http://', 'https://'))
+
+
+def localize_fields(rows: List[List[Optional[str]]],
+                    downloader: MediaDownloader,
+                    image_columns: List[int],
+                    sound_columns: List[int]) -> None:
+    """
+    下载卡片数据中引用的远程媒体文件，并将对应字段原地改写为本地引用。
+
+    图片字段改写为 `<img src="文件名">`，音频字段改写为 `[sound:文件名]`。已经是
+    本地引用的字段保持不变；下载失败的字段保留原来的URL。
+
+    :param rows: 卡片数据，每个元素为一张卡片的字段值列表，会被原地修改。
+    :param downloader: 媒体文件下载器。
+    :param image_columns: 图片字段所在列的下标。
+    :param sound_columns: 音频字段所在列的下标。
+    """
+    columns = image_columns + sound_columns
+    urls = [row[i] for row in rows for i in columns if i < len(row) and is_remote(row[i])]
+    local = downloader.download_all(urls)
+    for row in rows:
+        for i in image_columns:
+            if i < len(row) and row[i] in local:
+                row[i] = f'<img src="{local[row[i]]}">'
+        for i in sound_columns:
+            if i < len(row) and row[i] in local:
+                row[i] = f'[sound:{local[row[i]]}]'
+
+
+def localize_card_file(card_file: str,
+                       downloader: MediaDownloader,
+                       image_columns: List[int],
+                       sound_columns: List[int]) -> None:
+    """
+    下载Anki卡片表格文件中引用的远程媒体文件，并将对应字段改写为本地引用。
+
+    :param card_file: Anki卡片表格文件名。
+    :param downloader: 媒体文件下载器。
+    :param image_columns: 图片字段所在列的下标。
+    :param sound_columns: 音频字段所在列的下标。
+    """
+    records = list(iter_records(card_file))
+    localize_fields([record.fields for record in records], downloader,
+                    image_columns, sound_columns)
+    with open_card_writer(card_file) as writer:
+        writer.write_all(records)
@@ -0,0 +1,351 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import contextlib
+import datetime
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Iterator, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                   0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+"""
+耗时直方图的默认桶上界，单位为秒。
+"""
+
+REPORT_FORMATS = ('json', 'prometheus')
+"""
+指标报告支持的格式。
+"""
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """
+    此模型表示一个固定分桶的耗时直方图。
+
+    直方图只保存每个桶的计数、总次数和总耗时，因此内存占用与观测次数无关。
+    """
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        """
+        构造函数。
+
+        :param buckets: 按升序排列的桶上界，单位为秒。
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """
+        记录一次观测值。
+
+        :param value: 观测值，单位为秒。
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """
+        由各桶的计数估算指定的分位数，在桶内做线性插值。
+
+        :param q: 分位数，取值范围为 `[0, 1]`。
+        :return: 估算的分位数，单位为秒；若没有观测值则返回0。
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                if i == len(self.buckets):
+                    return lower
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+
+class Metrics:
+    """
+    此模型表示一组运行指标，包括计数器、数值指标和耗时直方图。
+
+    每个指标由名称和一组标签确定，例如 `hanzi_fetch_seconds{source="zdic"}`。
+    运行结束时可以将所有指标导出为JSON或Prometheus文本格式的报告。
+
+    此对象可在多个线程之间共享。
+    """
+    def __init__(self) -> None:
+        """
+        构造函数。
+        """
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._gauges: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        """
+        增加一个计数器的值。
+
+        :param name: 计数器的名称。
+        :param value: 增加的值，默认为1。
+        :param labels: 计数器的标签。
+        """
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels: str) -> None:
+        """
+        设置一个数值指标的值。
+
+        :param name: 数值指标的名称。
+        :param value: 数值指标的值。
+        :param labels: 数值指标的标签。
+        """
+        with self._lock:
+            self._gauges.setdefault(name, {})[_labels(labels)] = value
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        """
+        在一个耗时直方图中记录一次耗时。
+
+        :param name: 直方图的名称。
+        :param seconds: 耗时，单位为秒。
+        :param labels: 直方图的标签。
+        """
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels: str) -> Iterator[None]:
+        """
+        统计一段代码的耗时并记录到耗时直方图中；代码抛出异常时也会记录。
+
+        :param name: 直方图的名称。
+        :param labels: 直方图的标签。
+        :return: 上下文管理器。
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def counter(self, name: str, **labels: str) -> float:
+        """
+        获取一个计数器的当前值。
+
+        :param name: 计数器的名称。
+        :param labels: 计数器的标签。
+        :return: 计数器的当前值；若不存在则返回0。
+        """
+        with self._lock:
+            return self._counters.get(name, {}).get(_labels(labels), 0)
+
+    def to_dict(self) -> Dict:
+        """
+        将所有指标导出为可序列化为JSON的字典。
+
+        :return: 包含 `counters`、`gauges` 和 `histograms` 三部分的字典。
+        """
+        with self._lock:
+            counters = {name: [{'labels': dict(key), 'value': value}
+                               for key, value in series.items()]
+                        for name, series in self._counters.items()}
+            gauges = {name: [{'labels': dict(key), 'value': value}
+                             for key, value in series.items()]
+                      for name, series in self._gauges.items()}
+            histograms = {}
+            for name, series in self._histograms.items():
+                histograms[name] = [{
+                    'labels': dict(key),
+                    'count': h.count,
+                    'sum': round(h.sum, 6),
+                    'mean': round(h.sum / h.count, 6) if h.count else 0.0,
+                    'p50': round(h.quantile(0.50), 6),
+                    'p95': round(h.quantile(0.95), 6),
+                    'p99': round(h.quantile(0.99), 6),
+                } for key, h in series.items()]
+        return {'counters': counters, 'gauges': gauges, 'histograms': histograms}
+
+    def to_prometheus(self) -> str:
+        """
+        将所有指标导出为Prometheus文本格式。
+
+        :return: Prometheus文本格式的报告。
+        """
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f'# TYPE {name} counter')
+                lines.extend(f'{name}{_format_labels(key)} {value:g}'
+                             for key, value in series.items())
+            for name, series in sorted(self._gauges.items()):
+                lines.append(f'# TYPE {name} gauge')
+                lines.extend(f'{name}{_format_labels(key)} {value:g}'
+                             for key, value in series.items())
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f'# TYPE {name} histogram')
+                for key, h in series.items():
+                    cumulative = 0
+                    for bound, count in zip(h.buckets + (float('inf'),), h.counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                        lines.append(f'{name}_bucket{_format_labels(key + (("le", le),))} '
+                                     f'{cumulative}')
+                    lines.append(f'{name}_sum{_format_labels(key)} {h.sum:.6f}')
+                    lines.append(f'{name}_count{_format_labels(key)} {h.count}')
+        return '\n'.join(lines) + '\n'
+
+    def write_report(self, path: str, format: str = 'json') -> None:
+        """
+        将所有指标写入报告文件。
+
+        :param path: 报告文件的路径。
+        :param format: 报告的格式，`'json'` 或 `'prometheus'`。
+        """
+        if format not in REPORT_FORMATS:
+            raise ValueError(f'Unknown metrics report format: {format}')
+        with open(path, 'w', encoding='utf-8') as file:
+            if format == 'json':
+                json.dump(self.to_dict(), file, ensure_ascii=False, indent=2)
+                file.write('\n')
+            else:
+                file.write(self.to_prometheus())
+
+
+class ProgressReporter:
+    """
+    此模型表示一个限速的进度报告器。
+
+    报告器每隔一段时间输出一行包含进度、吞吐量和预计剩余时间的日志，用于代替
+    逐条记录的日志，因此日志的条数与处理的元素个数无关。边读取边处理时，总数可以
+    随着元素的读取通过 `expect()` 逐渐增加，读取结束后即为准确的总数。
+
+    此对象不是线程安全的，应只在一个线程中使用。
+    """
+    def __init__(self,
+                 total: Optional[int],
+                 unit: str,
+                 interval: float = 5.0,
+                 logger: Optional[logging.Logger] = None) -> None:
+        """
+        构造函数。
+
+        :param total: 待处理的元素总数；若为 `None` 表示总数未知，此时不估算剩余时间。
+        :param unit: 元素的名称，例如 `'characters'`。
+        :param interval: 输出进度的最小时间间隔，单位为秒。
+        :param logger: 输出进度的日志记录器；若为 `None` 则使用此模块的日志记录器。
+        """
+        self._total = total
+        self._unit = unit
+        self._interval = interval
+        self._logger = logger or logging.getLogger(__name__)
+        self._done = 0
+        self._start = time.monotonic()
+        self._last = self._start
+
+    def expect(self, count: int = 1) -> None:
+        """
+        增加待处理的元素总数。
+
+        :param count: 新读取的待处理元素个数，默认为1。
+        """
+        self._total = (self._total or 0) + count
+
+    def advance(self, count: int = 1) -> None:
+        """
+        记录已处理了若干个元素，并在距上次输出超过时间间隔时输出进度。
+
+        :param count: 新处理的元素个数，默认为1。
+        """
+        self._done += count
+        now = time.monotonic()
+        if now - self._last >= self._interval:
+            self._last = now
+            self._report(now)
+
+    def finish(self) -> None:
+        """
+        输出最终的进度。
+        """
+        self._report(time.monotonic())
+
+    def _report(self, now: float) -> None:
+        """
+        输出一行进度日志。
+
+        :param now: 当前的单调时钟时间。
+        """
+        elapsed = now - self._start
+        rate = self._done / elapsed if elapsed > 0 else 0.0
+        if self._total is None:
+            self._logger.info('Processed %d %s (%.1f/s, elapsed %s)',
+                              self._done, self._unit, rate,
+                              datetime.timedelta(seconds=round(elapsed)))
+            return
+        remaining = max(self._total - self._done, 0)
+        eta = datetime.timedelta(seconds=round(remaining / rate)) if rate > 0 else '?'
+        self._logger.info('Processed %d/%d %s (%.1f/s, elapsed %s, ETA %s)',
+                          self._done, self._total, self._unit, rate,
+                          datetime.timedelta(seconds=round(elapsed)), eta)
+
+
+_default_metrics: Optional[Metrics] = None
+_default_metrics_lock = threading.Lock()
+
+
+def default_metrics() -> Metrics:
+    """
+    获取进程内共享的默认指标集合。
+
+    :return: 进程内共享的默认指标集合。
+    """
+    global _default_metrics
+    with _default_metrics_lock:
+        if _default_metrics is None:
+            _default_metrics = Metrics()
+        return _default_metrics
+
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    """
+    将标签字典转换为可用作字典键的有序元组。
+
+    :param labels: 标签字典。
+    :return: 按标签名称排序的 `(名称, 值)` 元组。
+    """
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: Labels) -> str:
+    """
+    将标签格式化为Prometheus文本格式。
+
+    :param labels: 按标签名称排序的 `(名称, 值)` 元组。
+    :return: 形如 `{name="value"}` 的字符串；若没有标签则为空字符串。
+    """
+    if not labels:
+        return ''
+    escaped = (value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+               for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"'
+                          for (name, _), value in zip(labels, escaped)) + '}'
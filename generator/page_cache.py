@@ -0,0 +1,306 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Optional, Tuple
+
+DEFAULT_TTL = 30 * 24 * 3600
+"""
+缓存条目的默认有效期，单位为秒。
+"""
+
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+"""
+缓存内容的默认最大总字节数（压缩后）。
+"""
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS blobs (
+    digest  TEXT PRIMARY KEY,
+    content BLOB NOT NULL,
+    size    INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    source      TEXT NOT NULL,
+    url         TEXT NOT NULL,
+    digest      TEXT NOT NULL,
+    fetched_at  REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (source, url)
+);
+CREATE INDEX IF NOT EXISTS pages_accessed_at ON pages (accessed_at);
+CREATE INDEX IF NOT EXISTS pages_digest ON pages (digest);
+CREATE TABLE IF NOT EXISTS records (
+    extractor TEXT NOT NULL,
+    key       TEXT NOT NULL,
+    digest    TEXT NOT NULL,
+    version   INTEGER NOT NULL,
+    record    TEXT NOT NULL,
+    PRIMARY KEY (extractor, key)
+);
+CREATE INDEX IF NOT EXISTS records_digest ON records (digest);
+'''
+
+_ACCESS_BATCH_SIZE = 256
+
+_EVICT_BATCH_SIZE = 64
+
+
+def content_digest(content: bytes) -> str:
+    """
+    计算页面内容的摘要。
+
+    :param content: 页面的原始内容。
+    :return: 页面内容的SHA-256摘要的16进制表示。
+    """
+    return hashlib.sha256(content).hexdigest()
+
+
+class PageCache:
+    """
+    此模型表示字典网页页面内容的持久化磁盘缓存。
+
+    缓存保存在一个SQLite数据库文件中。页面内容经zlib压缩后以其SHA-256摘要为键
+    存储，内容相同的页面只保存一份；页面索引以 (来源, URL) 为键，记录内容摘要、
+    下载时间和最近访问时间。超过有效期的条目视为未命中；缓存总大小超过上限时，
+    按最近最少使用（LRU）的顺序淘汰条目。读取时只在内存中记录最近访问时间，
+    每累积一批、写入页面或关闭缓存时才批量写回数据库，因此命中缓存的读取不会各自
+    产生一个写事务。
+
+    缓存还保存从页面中提取出的记录，以 (提取器, 键) 为键，记录其所提取的页面内容
+    的摘要和提取器的版本号。只有页面内容的摘要和提取器的版本号都与记录一致时才
+    命中，因此页面内容更新或提取器升级后，旧的记录自动失效，而无需重新下载页面。
+
+    此对象可在多个线程之间共享。
+    """
+    def __init__(self,
+                 path: str,
+                 ttl: float = DEFAULT_TTL,
+                 max_size: int = DEFAULT_MAX_SIZE) -> None:
+        """
+        构造函数。
+
+        :param path: 缓存数据库文件的路径，若其所在目录不存在将自动创建。
+        :param ttl: 缓存条目的有效期，单位为秒。
+        :param max_size: 缓存内容的最大总字节数（压缩后）。
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._path = path
+        self._ttl = ttl
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._accessed: Dict[Tuple[str, str], float] = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(_SCHEMA)
+        self._size = self._conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+
+    @property
+    def path(self) -> str:
+        """
+        获取缓存数据库文件的路径。
+
+        :return: 缓存数据库文件的路径。
+        """
+        return self._path
+
+    def get(self, source: str, url: str, allow_stale: bool = False) -> Optional[bytes]:
+        """
+        从缓存中读取指定页面的内容。
+
+        :param source: 页面的来源，例如 `'zdic'` 或 `'baidu'`。
+        :param url: 页面的URL。
+        :param allow_stale: 是否允许返回已超过有效期的条目。
+        :return: 缓存的页面内容；若未命中或条目已过期，则返回 `None`。
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT p.fetched_at, b.content FROM pages p '
+                'JOIN blobs b ON b.digest = p.digest '
+                'WHERE p.source = ? AND p.url = ?', (source, url)).fetchone()
+            if row is None:
+                return None
+            fetched_at, content = row
+            if not allow_stale and now - fetched_at > self._ttl:
+                return None
+            self._touch(source, url, now)
+        return zlib.decompress(content)
+
+    def put(self, source: str, url: str, content: bytes) -> None:
+        """
+        将指定页面的内容写入缓存。
+
+        :param source: 页面的来源，例如 `'zdic'` 或 `'baidu'`。
+        :param url: 页面的URL。
+        :param content: 页面的原始内容。
+        """
+        digest = content_digest(content)
+        now = time.time()
+        with self._lock:
+            exists = self._conn.execute(
+                'SELECT 1 FROM blobs WHERE digest = ?', (digest,)).fetchone()
+            if exists is None:
+                compressed = zlib.compress(content)
+                self._conn.execute(
+                    'INSERT INTO blobs (digest, content, size) VALUES (?, ?, ?)',
+                    (digest, compressed, len(compressed)))
+                self._size += len(compressed)
+            old = self._conn.execute(
+                'SELECT digest FROM pages WHERE source = ? AND url = ?',
+                (source, url)).fetchone()
+            self._conn.execute(
+                'INSERT OR REPLACE INTO pages '
+                '(source, url, digest, fetched_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?)', (source, url, digest, now, now))
+            if old is not None and old[0] != digest:
+                self._delete_orphan_blob(old[0])
+            self._accessed.pop((source, url), None)
+            if self._size > self._max_size:
+                self._flush_accesses()
+                self._evict()
+            self._conn.commit()
+
+    def get_record(self,
+                   source: str,
+                   url: str,
+                   extractor: str,
+                   version: int,
+                   key: str,
+                   allow_stale: bool = False) -> Optional[str]:
+        """
+        从缓存中读取从指定页面的当前内容中提取出的记录。
+
+        :param source: 页面的来源，例如 `'zdic'` 或 `'baidu'`。
+        :param url: 页面的URL。
+        :param extractor: 提取器的名称。
+        :param version: 提取器的版本号。
+        :param key: 记录的键，例如页面对应的汉字。
+        :param allow_stale: 是否允许使用已超过有效期的页面。
+        :return: 缓存的记录；若页面未命中或已过期，或者没有由该版本的提取器从页面
+            的当前内容中提取出的记录，则返回 `None`。
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT p.fetched_at, r.record FROM pages p '
+                'JOIN records r ON r.digest = p.digest '
+                'WHERE p.source = ? AND p.url = ? '
+                'AND r.extractor = ? AND r.key = ? AND r.version = ?',
+                (source, url, extractor, key, version)).fetchone()
+            if row is None:
+                return None
+            fetched_at, record = row
+            if not allow_stale and now - fetched_at > self._ttl:
+                return None
+            self._touch(source, url, now)
+        return record
+
+    def put_record(self,
+                   digest: str,
+                   extractor: str,
+                   version: int,
+                   key: str,
+                   record: str) -> None:
+        """
+        将从页面中提取出的记录写入缓存，替换该提取器对同一个键的旧记录。
+
+        :param digest: 提取记录所用的页面内容的摘要，由 `content_digest()` 计算。
+            若缓存中没有该内容，则不写入。
+        :param extractor: 提取器的名称。
+        :param version: 提取器的版本号。
+        :param key: 记录的键，例如页面对应的汉字。
+        :param record: 提取出的记录。
+        """
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO records (extractor, key, digest, version, record) '
+                'SELECT ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM blobs WHERE digest = ?)',
+                (extractor, key, digest, version, record, digest))
+            self._conn.commit()
+
+    def close(self) -> None:
+        """
+        写回尚未写入的最近访问时间，并关闭缓存数据库。
+        """
+        with self._lock:
+            self._flush_accesses()
+            self._conn.commit()
+            self._conn.close()
+
+    def _touch(self, source: str, url: str, now: float) -> None:
+        """
+        记录指定页面的最近访问时间，每累积 `_ACCESS_BATCH_SIZE` 个页面批量写回一次。
+
+        调用者必须持有 `self._lock`。
+
+        :param source: 页面的来源。
+        :param url: 页面的URL。
+        :param now: 访问时间。
+        """
+        self._accessed[(source, url)] = now
+        if len(self._accessed) >= _ACCESS_BATCH_SIZE:
+            self._flush_accesses()
+            self._conn.commit()
+
+    def _flush_accesses(self) -> None:
+        """
+        将内存中记录的最近访问时间写回数据库，但不提交事务。
+
+        调用者必须持有 `self._lock`。
+        """
+        if self._accessed:
+            self._conn.executemany(
+                'UPDATE pages SET accessed_at = ? WHERE source = ? AND url = ?',
+                [(accessed_at, source, url)
+                 for (source, url), accessed_at in self._accessed.items()])
+            self._accessed.clear()
+
+    def _evict(self) -> None:
+        """
+        按最近最少使用的顺序淘汰页面，直到缓存总大小不超过上限。
+
+        每次只从数据库中取出最久未访问的 `_EVICT_BATCH_SIZE` 个页面。调用者必须持有
+        `self._lock`。
+        """
+        while self._size > self._max_size:
+            rows = self._conn.execute(
+                'SELECT source, url, digest FROM pages ORDER BY accessed_at LIMIT ?',
+                (_EVICT_BATCH_SIZE,)).fetchall()
+            if not rows:
+                break
+            for source, url, digest in rows:
+                if self._size <= self._max_size:
+                    break
+                self._conn.execute('DELETE FROM pages WHERE source = ? AND url = ?',
+                                   (source, url))
+                self._delete_orphan_blob(digest)
+
+    def _delete_orphan_blob(self, digest: str) -> None:
+        """
+        若指定的内容不再被任何页面引用，则将其及从中提取出的记录删除。
+
+        调用者必须持有 `self._lock`。
+
+        :param digest: 内容的SHA-256摘要。
+        """
+        referenced = self._conn.execute(
+            'SELECT 1 FROM pages WHERE digest = ? LIMIT 1', (digest,)).fetchone()
+        if referenced is None:
+            row = self._conn.execute('SELECT size FROM blobs WHERE digest = ?',
+                                     (digest,)).fetchone()
+            if row is not None:
+                self._conn.execute('DELETE FROM blobs WHERE digest = ?', (digest,))
+                self._conn.execute('DELETE FROM records WHERE digest = ?', (digest,))
+                self._size -= row[0]
@@ -0,0 +1,176 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import json
+import threading
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+from http_client import HttpClient, FetchError, default_client
+from metrics import default_metrics
+from page_cache import PageCache
+
+
+class PageFetcher:
+    """
+    此模型表示字典网页页面内容的获取器。
+
+    获取器优先从页面缓存中读取页面内容，未命中时再从网络下载并写入缓存。获取器的
+    工作模式可选值为：
+
+    - `'default'`: 优先使用未过期的缓存，未命中时从网络下载；
+    - `'offline'`: 只使用缓存（包括已过期的条目），从不访问网络；
+    - `'refresh'`: 忽略已有的缓存，总是从网络下载并更新缓存。
+
+    多个线程同时获取同一页面时，只有一个线程真正下载，其余线程等待并共享其结果，
+    因此不同的牌组同时用到同一页面时也只下载一次。
+
+    获取器还通过页面缓存读写从页面中提取出的记录（参见 `PageCache.get_record()`），
+    离线模式下允许使用已过期页面的记录，刷新模式下不使用已有的记录。
+
+    每次获取的缓存命中情况记录在默认指标集合的 `hanzi_cache_requests_total`
+    计数器中，共享结果的获取次数记录在 `hanzi_coalesced_requests_total` 计数器中，
+    记录缓存的命中情况记录在 `hanzi_record_cache_requests_total` 计数器中。
+
+    此对象可在多个线程之间共享。
+    """
+    MODES = ('default', 'offline', 'refresh')
+
+    def __init__(self,
+                 cache: Optional[PageCache] = None,
+                 mode: str = 'default',
+                 client: Optional[HttpClient] = None) -> None:
+        """
+        构造函数。
+
+        :param cache: 页面缓存；若为 `None` 则不使用缓存。
+        :param mode: 获取器的工作模式。
+        :param client: 用于下载页面的HTTP客户端；若为 `None` 则使用进程内共享的
+            默认HTTP客户端。
+        """
+        if mode not in self.MODES:
+            raise ValueError(f'Unknown fetch mode: {mode}')
+        if mode == 'offline' and cache is None:
+            raise ValueError('The offline mode requires a page cache.')
+        self._cache = cache
+        self._mode = mode
+        self._client = client if client is not None else default_client()
+        self._lock = threading.Lock()
+        self._in_flight: Dict[Tuple[str, str], Future] = {}
+
+    @property
+    def cache(self) -> Optional[PageCache]:
+        """
+        获取此获取器使用的页面缓存。
+
+        :return: 此获取器使用的页面缓存；若未使用缓存则返回 `None`。
+        """
+        return self._cache
+
+    @property
+    def mode(self) -> str:
+        """
+        获取此获取器的工作模式。
+
+        :return: 此获取器的工作模式。
+        """
+        return self._mode
+
+    def fetch(self, source: str, url: str) -> bytes:
+        """
+        获取指定页面的内容。
+
+        :param source: 页面的来源，例如 `'zdic'` 或 `'baidu'`。
+        :param url: 页面的URL。
+        :return: 页面的原始内容。
+        :raise FetchError: 若离线模式下缓存未命中，或者下载失败。
+        """
+        key = (source, url)
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+        if not leader:
+            default_metrics().inc('hanzi_coalesced_requests_total', source=source)
+            return future.result()
+        try:
+            content = self._fetch(source, url)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(content)
+            return content
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def get_record(self,
+                   source: str,
+                   url: str,
+                   extractor: str,
+                   version: int,
+                   key: str) -> Optional[List]:
+        """
+        获取缓存的、由指定版本的提取器从指定页面的当前内容中提取出的记录。
+
+        :param source: 页面的来源，例如 `'zdic'` 或 `'baidu'`。
+        :param url: 页面的URL。
+        :param extractor: 提取器的名称。
+        :param version: 提取器的版本号。
+        :param key: 记录的键，例如页面对应的汉字。
+        :return: 缓存的记录的字段值列表；若未使用缓存、处于刷新模式或者未命中，则
+            返回 `None`。
+        """
+        if self._cache is None or self._mode == 'refresh':
+            return None
+        record = self._cache.get_record(source, url, extractor, version, key,
+                                        allow_stale=(self._mode == 'offline'))
+        result = 'hit' if record is not None else 'miss'
+        default_metrics().inc('hanzi_record_cache_requests_total', source=source, result=result)
+        return json.loads(record) if record is not None else None
+
+    def put_record(self,
+                   digest: str,
+                   extractor: str,
+                   version: int,
+                   key: str,
+                   record: List) -> None:
+        """
+        缓存从页面中提取出的记录；若未使用缓存则什么也不做。
+
+        :param digest: 提取记录所用的页面内容的摘要，由 `content_digest()` 计算。
+        :param extractor: 提取器的名称。
+        :param version: 提取器的版本号。
+        :param key: 记录的键，例如页面对应的汉字。
+        :param record: 记录的字段值列表。
+        """
+        if self._cache is not None:
+            self._cache.put_record(digest, extractor, version, key,
+                                   json.dumps(record, ensure_ascii=False))
+
+    def _fetch(self, source: str, url: str) -> bytes:
+        """
+        从页面缓存或网络获取指定页面的内容。
+
+        :param source: 页面的来源。
+        :param url: 页面的URL。
+        :return: 页面的原始内容。
+        :raise FetchError: 若离线模式下缓存未命中，或者下载失败。
+        """
+        if self._cache is not None and self._mode != 'refresh':
+            content = self._cache.get(source, url, allow_stale=(self._mode == 'offline'))
+            result = 'hit' if content is not None else 'miss'
+            default_metrics().inc('hanzi_cache_requests_total', source=source, result=result)
+            if content is not None:
+                return content
+        if self._mode == 'offline':
+            raise FetchError(f'Page is not cached in offline mode: {url}')
+        content = self._client.get(url)
+        if self._cache is not None:
+            self._cache.put(source, url, content)
+        return content
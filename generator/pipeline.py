@@ -0,0 +1,164 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import threading
+from collections import deque
+from concurrent.futures import CancelledError, Executor, Future, ThreadPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+def open_parse_pool(workers: Optional[int] = None) -> Executor:
+    """
+    创建解析阶段所用的进程池。
+
+    调用者通常是多线程的（例如HTTP连接池、SQLite连接和日志模块都持有锁），在
+    这样的进程中直接 `fork` 子进程可能导致子进程死锁，因此进程池优先以
+    `forkserver` 方式启动子进程：子进程由一个单线程的服务进程派生；不支持该方式
+    的平台则以 `spawn` 方式启动。
+
+    :param workers: 进程数；若为 `None` 则使用CPU的核数。
+    :return: 新创建的进程池，调用者用完后需关闭。
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() \
+        else 'spawn'
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context(method))
+
+
+def staged_map(items: Iterable[T],
+               fetch: Callable[[T], Any],
+               parse: Callable[[T, Any], R],
+               fetch_workers: int = 1,
+               parse_workers: Optional[int] = None,
+               max_pending: int = 64,
+               parse_inline: Optional[Callable[[Any], bool]] = None,
+               fetch_pool: Optional[Executor] = None) \
+        -> Iterator[Tuple[T, 'Future[R]']]:
+    """
+    以两级流水线的方式处理一系列元素，并按输入顺序返回结果。
+
+    流水线分为三个阶段：
+
+    1. 获取阶段：在线程池中对每个元素调用 `fetch(item)`，适用于网络I/O等
+       I/O密集型的操作；
+    2. 解析阶段：获取阶段完成后，立即在进程池中调用 `parse(item, payload)`，
+       适用于HTML解析等CPU密集型的操作，从而不受GIL的限制；
+    3. 写出阶段：调用者按输入顺序迭代此函数的返回值，逐个取出结果。
+
+    同一时刻处于流水线中（尚未被调用者取出）的元素最多为 `max_pending` 个，
+    因此无论输入有多少元素，内存占用都保持平稳。
+
+    进程池由 `open_parse_pool()` 在第一次需要时才创建，因此若所有元素都无需在
+    进程池中解析（例如解析结果均取自缓存），则不会启动任何解析进程。
+
+    获取阶段的线程池可以由调用者提供，从而由多个同时运行的流水线共享，使它们的
+    并发下载总数不超过该线程池的大小。
+
+    :param items: 待处理的元素，会被惰性地迭代。
+    :param fetch: 获取阶段的函数，在线程池中调用。
+    :param parse: 解析阶段的函数，在进程池中调用，因此它及其参数和返回值都必须
+        可以被 pickle 序列化。
+    :param fetch_workers: 获取阶段的线程数；若指定了 `fetch_pool` 则忽略此参数。
+    :param parse_workers: 解析阶段的进程数；若为 `None` 则使用CPU的核数；若为0
+        则不使用进程池，直接在获取阶段的线程中解析。
+    :param max_pending: 流水线中最多同时存在的元素个数。
+    :param parse_inline: 若不为 `None`，则对于使此函数返回真值的获取结果，直接在
+        获取阶段的线程中解析，而不提交到进程池，适用于解析代价很小的获取结果。
+    :param fetch_pool: 获取阶段使用的共享线程池；若为 `None` 则创建一个有
+        `fetch_workers` 个线程的线程池，流水线结束时关闭。共享的线程池由调用者关闭，
+        获取阶段的函数不能等待提交到同一线程池中的其他任务，否则可能死锁。
+    :return: 按输入顺序排列的 `(元素, 结果)` 二元组的迭代器，其中结果是一个
+        `Future` 对象，调用其 `result()` 方法将得到解析结果，或者抛出获取或解析
+        过程中发生的异常。
+    """
+    if max_pending < 1:
+        raise ValueError('max_pending must be a positive integer')
+    parse_pool = None
+    shared = fetch_pool is not None
+    if not shared:
+        fetch_pool = ThreadPoolExecutor(fetch_workers)
+    lock = threading.Lock()
+    closed = False
+
+    def start_parse(item: T, fetched: Future, result: Future) -> None:
+        nonlocal parse_pool
+        try:
+            payload = fetched.result()
+            if parse_workers == 0 or (parse_inline is not None and parse_inline(payload)):
+                result.set_result(parse(item, payload))
+                return
+            with lock:
+                if closed:
+                    raise CancelledError()
+                if parse_pool is None:
+                    parse_pool = open_parse_pool(parse_workers)
+                parsed = parse_pool.submit(parse, item, payload)
+        except BaseException as e:
+            result.set_exception(e)
+            return
+        parsed.add_done_callback(lambda f: _copy_future(f, result))
+
+    def submit(item: T) -> Tuple[T, Future, Future]:
+        result = Future()
+        result.set_running_or_notify_cancel()
+        fetched = fetch_pool.submit(fetch, item)
+        fetched.add_done_callback(lambda f: start_parse(item, f, result))
+        return item, result, fetched
+
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(submit(item))
+            if len(pending) >= max_pending:
+                yield _wait(pending.popleft())
+        while pending:
+            yield _wait(pending.popleft())
+    finally:
+        with lock:
+            closed = True
+        if shared:
+            # 共享的线程池不能关闭，只取消本流水线尚未开始的获取任务，并等待其余的完成
+            for _, _, fetched in pending:
+                fetched.cancel()
+            for _, result, _ in pending:
+                result.exception()
+        else:
+            fetch_pool.shutdown(wait=True, cancel_futures=True)
+        with lock:
+            pool = parse_pool
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _wait(entry: Tuple[T, Future, Future]) -> Tuple[T, Future]:
+    """
+    等待流水线中的一个元素处理完毕。
+
+    :param entry: `(元素, 结果, 获取阶段的任务)` 三元组。
+    :return: 处理完毕的 `(元素, 结果)` 二元组。
+    """
+    item, result, _ = entry
+    result.exception()
+    return item, result
+
+
+def _copy_future(source: Future, target: Future) -> None:
+    """
+    将一个已完成的 `Future` 的结果复制到另一个 `Future`。
+
+    :param source: 已完成的 `Future`。
+    :param target: 目标 `Future`。
+    """
+    if source.cancelled():
+        target.set_exception(CancelledError())
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
@@ -0,0 +1,251 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from metrics import default_metrics
+
+DEFAULT_MAX_RATE = 20.0
+"""
+每个主机默认的最大请求速率，单位为次/秒。
+"""
+
+DEFAULT_MAX_CONCURRENCY = 16
+"""
+每个主机默认的最大并发请求数。
+"""
+
+DEFAULT_SLOW_THRESHOLD = 5.0
+"""
+默认的慢响应阈值，单位为秒；响应时间超过此值视为主机过载。
+"""
+
+THROTTLE_STATUS_CODES = frozenset({429, 503})
+"""
+表示主机正在限流或过载的HTTP响应状态码。
+"""
+
+_EWMA_WEIGHT = 0.2
+"""
+计算平均响应时间的指数加权移动平均中，最新一次响应时间所占的权重。
+"""
+
+
+class HostLimiter:
+    """
+    此模型表示对单个主机的自适应限流器。
+
+    限流器同时限制请求速率和并发请求数：
+
+    - 请求速率由令牌桶控制，桶的容量为一秒的请求量；
+    - 速率上限和并发上限的初始值即为其最大值，只在主机表现出过载时才减小，之后
+      按AIMD（加性增、乘性减）的方式调整：每个正常的响应使
+      并发上限在每个平均响应时间内约增加1、速率上限按比例增加；遇到限流（HTTP 429/503）、
+      服务端错误、网络错误或慢响应时，两者都减半；
+    - 若限流或服务端错误的响应中带有 `Retry-After`，则在其指定的时间之前暂停向该
+      主机发出任何请求；成功响应中的 `Retry-After` 被忽略。
+
+    此对象可在多个线程之间共享。
+    """
+    def __init__(self,
+                 host: str,
+                 max_rate: float = DEFAULT_MAX_RATE,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 slow_threshold: float = DEFAULT_SLOW_THRESHOLD) -> None:
+        """
+        构造函数。
+
+        速率上限和并发上限的初始值都是其最大值，令牌桶初始为满，之后根据响应情况
+        调整，因此从不限流的主机（例如本地镜像）不会被额外地减速。
+
+        :param host: 主机名。
+        :param max_rate: 最大请求速率，单位为次/秒。
+        :param max_concurrency: 最大并发请求数。
+        :param slow_threshold: 慢响应阈值，单位为秒。
+        """
+        self._host = host
+        self._max_rate = max_rate
+        self._min_rate = min(1.0, max_rate)
+        self._max_concurrency = max_concurrency
+        self._slow_threshold = slow_threshold
+        self._rate = max(self._min_rate, max_rate)
+        self._concurrency = max(1.0, float(max_concurrency))
+        self._tokens = max(1.0, self._rate)
+        self._in_flight = 0
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._decreased_at = 0.0
+        self._latency = 0.0
+        self._condition = threading.Condition()
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    @property
+    def rate(self) -> float:
+        """
+        获取当前的请求速率上限。
+
+        :return: 当前的请求速率上限，单位为次/秒。
+        """
+        return self._rate
+
+    @property
+    def concurrency(self) -> int:
+        """
+        获取当前的并发请求数上限。
+
+        :return: 当前的并发请求数上限。
+        """
+        return int(self._concurrency)
+
+    def acquire(self) -> None:
+        """
+        等待直到可以向该主机发出一个请求。
+
+        每次成功调用此方法后，必须在请求结束时调用一次 `release()`。
+        """
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._blocked_until:
+                    timeout = self._blocked_until - now
+                elif self._in_flight >= int(self._concurrency):
+                    timeout = None
+                elif self._tokens < 1:
+                    timeout = (1 - self._tokens) / self._rate
+                else:
+                    self._tokens -= 1
+                    self._in_flight += 1
+                    return
+                self._condition.wait(timeout)
+
+    def release(self,
+                status: Optional[int],
+                elapsed: float,
+                retry_after: Optional[float] = None) -> None:
+        """
+        报告一个请求的结果，并据此调整限额。
+
+        :param status: 响应的HTTP状态码；若请求因网络错误或超时而失败则为 `None`。
+        :param elapsed: 请求的耗时，单位为秒。
+        :param retry_after: 响应中 `Retry-After` 头指定的等待时间，单位为秒；只有在
+            状态码表示限流或服务器错误时才生效，成功的响应中的此头被忽略。
+        """
+        with self._condition:
+            self._in_flight -= 1
+            now = time.monotonic()
+            throttled = status in THROTTLE_STATUS_CODES \
+                or (retry_after is not None and status is not None and status >= 500)
+            if throttled and retry_after is not None:
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+            if status is not None:
+                self._latency += _EWMA_WEIGHT * (elapsed - self._latency)
+            if throttled or status is None or status >= 500 or elapsed > self._slow_threshold:
+                self._decrease(now, status, elapsed)
+            else:
+                self._concurrency = min(self._max_concurrency,
+                                        self._concurrency + 1 / self._concurrency)
+                self._rate = min(self._max_rate, self._rate + self._rate / (8 * self._concurrency))
+            rate = self._rate
+            concurrency = int(self._concurrency)
+            self._condition.notify_all()
+        metrics = default_metrics()
+        if throttled:
+            metrics.inc('hanzi_throttled_responses_total', host=self._host)
+        metrics.set('hanzi_rate_limit_rate', round(rate, 3), host=self._host)
+        metrics.set('hanzi_rate_limit_concurrency', concurrency, host=self._host)
+
+    def _refill(self, now: float) -> None:
+        """
+        按当前的速率上限向令牌桶中补充令牌。
+
+        :param now: 当前的单调时钟时间。
+        """
+        capacity = max(1.0, self._rate)
+        self._tokens = min(capacity, self._tokens + (now - self._updated_at) * self._rate)
+        self._updated_at = now
+
+    def _decrease(self, now: float, status: Optional[int], elapsed: float) -> None:
+        """
+        将速率上限和并发上限减半。
+
+        与TCP的拥塞控制类似，每个平均响应时间内最多减半一次，避免同一批并发请求的
+        失败使限额连续减半。
+
+        :param now: 当前的单调时钟时间。
+        :param status: 触发减小的响应的HTTP状态码。
+        :param elapsed: 触发减小的请求的耗时，单位为秒。
+        """
+        if now - self._decreased_at < self._latency:
+            return
+        self._decreased_at = now
+        self._concurrency = max(1.0, self._concurrency / 2)
+        self._rate = max(self._min_rate, self._rate / 2)
+        self._logger.warning('Backing off %s to %.1f requests/s and %d concurrent requests '
+                             '(status %s, %.2fs)', self._host, self._rate,
+                             int(self._concurrency), status, elapsed)
+
+
+class RateLimiter:
+    """
+    此模型表示按主机分别限流的自适应限流器。
+
+    此对象可在多个线程之间共享。
+    """
+    def __init__(self,
+                 max_rate: float = DEFAULT_MAX_RATE,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 slow_threshold: float = DEFAULT_SLOW_THRESHOLD) -> None:
+        """
+        构造函数。
+
+        :param max_rate: 每个主机的最大请求速率，单位为次/秒。
+        :param max_concurrency: 每个主机的最大并发请求数。
+        :param slow_threshold: 慢响应阈值，单位为秒。
+        """
+        self._max_rate = max_rate
+        self._max_concurrency = max_concurrency
+        self._slow_threshold = slow_threshold
+        self._hosts: Dict[str, HostLimiter] = {}
+        self._lock = threading.Lock()
+
+    def host(self, host: str) -> HostLimiter:
+        """
+        获取指定主机的限流器。
+
+        :param host: 主机名。
+        :return: 该主机的限流器。
+        """
+        with self._lock:
+            limiter = self._hosts.get(host)
+            if limiter is None:
+                limiter = self._hosts[host] = HostLimiter(host, self._max_rate,
+                                                          self._max_concurrency,
+                                                          self._slow_threshold)
+            return limiter
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    解析HTTP响应的 `Retry-After` 头。
+
+    :param value: `Retry-After` 头的值，可以是秒数或HTTP日期。
+    :return: 需要等待的时间，单位为秒；若该值不存在或无法解析，则返回 `None`。
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    import email.utils
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, date.timestamp() - time.time())
@@ -0,0 +1,109 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import threading
+import unittest
+from typing import List, Optional, Tuple
+
+from anki_connect import AnkiConnectError, SyncResult, push_to_anki
+from anki_connect_server import MockAnkiConnect
+from apkg_exporter import CHARACTER_NOTE_TYPE
+
+NOTE_COUNT = 620
+"""
+测试同步的笔记个数，超过 `anki_connect.DEFAULT_BATCH_SIZE`，因此新增的笔记分多批发送。
+"""
+
+
+def make_notes(count: int) -> List[Tuple[List[Optional[str]], List[str]]]:
+    """
+    生成测试用的汉字笔记数据。
+
+    :param count: 笔记个数。
+    :return: 笔记数据列表，每个元素为 `(字段值列表, 标签)` 二元组，其中读音和例词
+        例句字段缺失。
+    """
+    return [([chr(0x4E00 + i), f'pinyin{i}', f'<img src="{i}.gif">', None,
+              f'definition {i}', None], ['四五快读S1U1'])
+            for i in range(count)]
+
+
+class PushToAnkiTest(unittest.TestCase):
+    """
+    通过模拟AnkiConnect插件的替身服务器测试 `push_to_anki()`。
+    """
+    def setUp(self) -> None:
+        self.server = MockAnkiConnect()
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def push(self, notes, deck: str = '汉字') -> SyncResult:
+        self.server.calls.clear()
+        return push_to_anki(self.server.url, deck, CHARACTER_NOTE_TYPE, notes)
+
+    def test_add_then_unchanged_then_update(self):
+        notes = make_notes(NOTE_COUNT)
+
+        result = self.push(notes)
+        self.assertEqual(SyncResult(added=NOTE_COUNT, updated=0, unchanged=0, failed=0), result)
+        self.assertEqual(NOTE_COUNT, len(self.server.notes))
+        self.assertIn('汉字', self.server.decks)
+        self.assertIn(CHARACTER_NOTE_TYPE.name, self.server.models)
+
+        result = self.push(notes)
+        self.assertEqual(SyncResult(added=0, updated=0, unchanged=NOTE_COUNT, failed=0), result)
+        self.assertNotIn('addNotes', self.server.calls)
+        self.assertNotIn('updateNoteFields', self.server.calls)
+        self.assertNotIn('updateNoteTags', self.server.calls)
+
+        fields, tags = notes[5]
+        notes[5] = (fields[:1] + ['changed'] + fields[2:], tags)
+        fields, tags = notes[7]
+        notes[7] = (fields, tags + ['新标签'])
+        result = self.push(notes)
+        self.assertEqual(SyncResult(added=0, updated=2, unchanged=NOTE_COUNT - 2, failed=0),
+                         result)
+        self.assertNotIn('addNotes', self.server.calls)
+        stored = {note['fields']['汉字']: note for note in self.server.notes.values()}
+        self.assertEqual('changed', stored[notes[5][0][0]]['fields']['拼音'])
+        self.assertEqual({'四五快读S1U1', '新标签'}, set(stored[notes[7][0][0]]['tags']))
+
+        result = self.push(notes)
+        self.assertEqual(SyncResult(added=0, updated=0, unchanged=NOTE_COUNT, failed=0), result)
+
+    def test_notes_in_other_decks_are_moved(self):
+        notes = make_notes(NOTE_COUNT)
+        self.push(notes[:3], deck='其他')
+        fields, tags = notes[0]
+        notes[0] = (fields[:1] + ['changed'] + fields[2:], tags)
+
+        result = self.push(notes)
+        self.assertEqual(SyncResult(added=NOTE_COUNT - 3, updated=1, unchanged=2, failed=0,
+                                    moved=3), result)
+        self.assertEqual(1, self.server.calls['changeDeck'])
+        self.assertEqual(NOTE_COUNT, len(self.server.notes))
+        self.assertEqual({'汉字'}, {note['deckName'] for note in self.server.notes.values()})
+
+        result = self.push(notes)
+        self.assertEqual(SyncResult(added=0, updated=0, unchanged=NOTE_COUNT, failed=0), result)
+        self.assertNotIn('changeDeck', self.server.calls)
+
+    def test_failed_notes_raise_error(self):
+        notes = make_notes(3)
+        fields, tags = notes[1]
+        notes[1] = ([''] + fields[1:], tags)
+        with self.assertRaises(AnkiConnectError):
+            self.push(notes)
+        self.assertEqual(2, len(self.server.notes))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import os
+import tempfile
+import unittest
+
+from card_file import CardRecord, iter_records, read_cards
+from card_writer import JsonlCardWriter, TextCardWriter, get_card_writer_class, open_card_writer
+
+RECORDS = [
+    CardRecord(['人', 'rén', 'None', 'None', '1. 由类人猿进化而成的人'], {'四五快读S1U1'}),
+    CardRecord(['口', 'kǒu', 'a|b', '"quoted" at start', 'line 1\nline 2'],
+               {'四五快读S1U1', '小羊上山S2'}),
+    CardRecord(['大', 'dà', 'say "hi"', 'carriage\rreturn', ''], set()),
+]
+"""
+测试用的卡片，其中含有分隔符、引号、换行符和空字段。
+"""
+
+
+class CardFileRoundTripTest(unittest.TestCase):
+    """
+    测试卡片输出端写出的文件能被 `card_file` 原样读回。
+    """
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.temp_dir.name, name)
+
+    def write(self, path: str) -> None:
+        with open_card_writer(path, batch_size=2) as writer:
+            writer.write_all(RECORDS)
+        self.assertFalse(os.path.exists(f'{path}.tmp'))
+
+    def test_text_round_trip(self):
+        path = self.path('cards.txt')
+        self.write(path)
+        self.assertEqual(RECORDS, list(iter_records(path)))
+
+    def test_jsonl_round_trip(self):
+        path = self.path('cards.jsonl')
+        self.write(path)
+        self.assertEqual(RECORDS, list(iter_records(path)))
+
+    def test_read_cards_keeps_tags_column(self):
+        path = self.path('cards.txt')
+        self.write(path)
+        cards = read_cards(path)
+        self.assertEqual(['人', '口', '大'], list(cards))
+        self.assertEqual(RECORDS[1].fields, cards['口'][:-1])
+        self.assertEqual(RECORDS[1].tags, set(cards['口'][-1].split()))
+
+    def test_abort_keeps_existing_file(self):
+        path = self.path('cards.txt')
+        self.write(path)
+        with open(path, 'rb') as file:
+            before = file.read()
+        with self.assertRaises(RuntimeError):
+            with open_card_writer(path, batch_size=1) as writer:
+                writer.write(CardRecord(['新', 'xīn', 'None', 'None', 'None'], set()))
+                raise RuntimeError('interrupted')
+        with open(path, 'rb') as file:
+            self.assertEqual(before, file.read())
+        self.assertFalse(os.path.exists(f'{path}.tmp'))
+
+    def test_writer_class_by_extension(self):
+        self.assertIs(TextCardWriter, get_card_writer_class('cards.txt'))
+        self.assertIs(TextCardWriter, get_card_writer_class('cards.TSV'))
+        self.assertIs(JsonlCardWriter, get_card_writer_class('cards.jsonl'))
+        with self.assertRaises(ValueError):
+            get_card_writer_class('cards.apkg')
+        with self.assertRaises(ValueError):
+            get_card_writer_class('cards')
+
+
+if __name__ == '__main__':
+    unittest.main()
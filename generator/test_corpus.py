@@ -0,0 +1,93 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import os
+import tempfile
+import unittest
+from typing import List
+
+from corpus import Corpus, read_items, read_paragraphs
+
+
+class CorpusTest(unittest.TestCase):
+    """
+    测试输入文件的读取和语料中标签的聚合。
+    """
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def input_file(self, name: str, lines: List[str]) -> str:
+        path = os.path.join(self.temp_dir.name, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write('\n'.join(lines) + '\n')
+        return path
+
+    def test_read_items_separators(self):
+        path = self.input_file('书.txt', ['# U1', '', '人、口, 大 中\t小、、', '# U2', '上，下'])
+        self.assertEqual([('人', '书', 'U1'), ('口', '书', 'U1'), ('大', '书', 'U1'),
+                          ('中', '书', 'U1'), ('小', '书', 'U1'),
+                          # 全角逗号不是分隔符
+                          ('上，下', '书', 'U2')],
+                         list(read_items([path])))
+
+    def test_read_paragraphs(self):
+        path = self.input_file('书.txt', ['# U1', '', '第一句，', '接着写。', '', '第二句。',
+                                         '# U2', '第三句。'])
+        self.assertEqual([('第一句，接着写。', '书', 'U1'), ('第二句。', '书', 'U1'),
+                          ('第三句。', '书', 'U2')],
+                         list(read_paragraphs([path])))
+
+    def test_new_items_streams_first_occurrences(self):
+        path = self.input_file('书.txt', ['# U1', '人、口、人', '# U2', '口、大'])
+        corpus = Corpus(read_items([path]), 'character')
+        try:
+            items = corpus.new_items()
+            self.assertEqual('人', next(items))
+            self.assertEqual(1, len(corpus))
+            self.assertEqual(['口', '大'], list(items))
+            self.assertEqual([('人', {'书U1'}), ('口', {'书U1', '书U2'}), ('大', {'书U2'})],
+                             list(corpus.items()))
+        finally:
+            corpus.close()
+
+    def test_tags_are_aggregated_after_spill(self):
+        first = self.input_file('甲.txt', ['# U1', '人、口、大', '# U2', '人、中'])
+        second = self.input_file('乙.txt', ['# S1', '口、小、人'])
+        corpus = Corpus(read_items([first, second]), 'character', max_items=2)
+        try:
+            self.assertEqual(5, corpus.read_all())
+            self.assertIsNotNone(corpus._db)
+            self.assertEqual([('人', {'甲U1', '甲U2', '乙S1'}),
+                              ('口', {'甲U1', '乙S1'}),
+                              ('大', {'甲U1'}),
+                              ('中', {'甲U2'}),
+                              ('小', {'乙S1'})],
+                             list(corpus.items()))
+            self.assertIn('人', corpus)
+            self.assertIn('小', corpus)
+            self.assertNotIn('上', corpus)
+            spill_dir = corpus._db_dir.name
+        finally:
+            corpus.close()
+        self.assertFalse(os.path.exists(spill_dir))
+
+    def test_items_are_the_same_with_and_without_spill(self):
+        path = self.input_file('书.txt', ['# U1', '人、口、大、中', '# U2', '大、人、上、下',
+                                         '# U3', '下、口'])
+        expected = list(Corpus(read_items([path]), 'character').items())
+        for max_items in (1, 2, 3, 100):
+            corpus = Corpus(read_items([path]), 'character', max_items=max_items)
+            try:
+                self.assertEqual(expected, list(corpus.items()), max_items)
+            finally:
+                corpus.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
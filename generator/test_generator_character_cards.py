@@ -0,0 +1,153 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import json
+import os
+import tempfile
+import unittest
+from typing import Dict, List, Optional, Set
+from unittest import mock
+
+import generator_character_cards
+from card_file import read_cards
+from dict_page import DictPage
+from extraction import DictRecord
+from generator_character_cards import IncompleteDeckError, collect_characters, generate_cards
+from http_client import FetchError
+from journal import Journal, journal_path
+
+
+class FakeDictPage(DictPage):
+    """
+    测试用的字典页面，不访问网络，记录被查询的汉字。
+    """
+    SOURCE = 'fake'
+    EXTRACTOR_VERSION = None
+    EXTRACT_INLINE = True
+    failing: Set[str] = set()
+    fetched: List[str] = []
+
+    def fetch_content(self) -> bytes:
+        self.fetched.append(self._char)
+        if self._char in self.failing:
+            raise FetchError(f'Failed to fetch "{self._char}"')
+        return self._char.encode('utf-8')
+
+    @classmethod
+    def extract_record(cls,
+                       char: str,
+                       content: bytes,
+                       timings: Optional[Dict[str, float]] = None) -> DictRecord:
+        return DictRecord(f'{char}.gif', f'pinyin-{char}', f'{char}.mp3', f'definition-{char}')
+
+    def _get_page_url(self, ch) -> str:
+        return f'fake:{ch}'
+
+
+def fake_fields(ch: str) -> List[str]:
+    """
+    获取 `FakeDictPage` 查询得到的汉字卡片字段值。
+
+    :param ch: 指定的汉字。
+    :return: 该汉字卡片的字段值列表（不含标签）。
+    """
+    return [ch, f'pinyin-{ch}', f'{ch}.gif', f'{ch}.mp3', f'definition-{ch}']
+
+
+class GenerateCardsTest(unittest.TestCase):
+    """
+    使用替身字典来源测试 `generate_cards()` 的断点续查、增量生成和查询失败的处理。
+    """
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.input_file = os.path.join(self.temp_dir.name, '书.txt')
+        with open(self.input_file, 'w', encoding='utf-8') as file:
+            file.write('# U1\n人、口、大\n# U2\n口、中\n')
+        self.output_file = os.path.join(self.temp_dir.name, 'cards.txt')
+        FakeDictPage.failing = set()
+        FakeDictPage.fetched = []
+        patcher = mock.patch.object(generator_character_cards, 'get_dict_page_class',
+                                    return_value=FakeDictPage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def generate(self, **kwargs) -> Dict[str, List[str]]:
+        characters = collect_characters([self.input_file])
+        try:
+            generate_cards(characters, self.output_file, **kwargs)
+        finally:
+            characters.close()
+        return read_cards(self.output_file)
+
+    def test_generate(self):
+        cards = self.generate()
+        self.assertEqual(['人', '口', '大', '中'], list(cards))
+        self.assertEqual(fake_fields('口'), cards['口'][:5])
+        self.assertEqual({'书U1', '书U2'}, set(cards['口'][5].split()))
+        self.assertEqual(['人', '口', '大', '中'], FakeDictPage.fetched)
+
+    def test_resume_after_partial_journal(self):
+        path = journal_path(self.output_file)
+        with open(path, 'w', encoding='utf-8') as file:
+            for ch in ('人', '口'):
+                entry = {'char': ch, 'source': 'fake', 'fields': fake_fields(ch)[:4] + ['journal']}
+                file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            # 其他字典来源的记录不会被沿用
+            entry = {'char': '大', 'source': 'other', 'fields': fake_fields('大')}
+            file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            # 崩溃时写了一半的最后一行
+            file.write('{"char": "中", "source": "fa')
+        journal = Journal(path, resume=True)
+        try:
+            cards = self.generate(journal=journal)
+        finally:
+            journal.close()
+        self.assertEqual(['大', '中'], FakeDictPage.fetched)
+        self.assertEqual('journal', cards['人'][4])
+        self.assertEqual('journal', cards['口'][4])
+        self.assertEqual(fake_fields('中'), cards['中'][:5])
+        journal = Journal(path, resume=True)
+        try:
+            self.assertEqual(['人', '口', '大', '中'], list(journal.completed('fake')))
+        finally:
+            journal.close()
+
+    def test_failed_lookups_keep_previous_cards(self):
+        self.generate()
+        previous = read_cards(self.output_file)
+        previous['口'][4] = 'previous'
+        del previous['中']
+        FakeDictPage.failing = {'口', '中'}
+        characters = collect_characters([self.input_file])
+        try:
+            with self.assertRaises(IncompleteDeckError) as context:
+                generate_cards(characters, self.output_file, previous=previous)
+        finally:
+            characters.close()
+        self.assertEqual(['口', '中'], context.exception.failed)
+        self.assertTrue(context.exception.written)
+        cards = read_cards(self.output_file)
+        self.assertEqual(['人', '口', '大', '中'], list(cards))
+        self.assertEqual('previous', cards['口'][4])
+        self.assertEqual(['中', 'None', 'None', 'None', 'None'], cards['中'][:5])
+
+    def test_incremental_rebuild_looks_up_missing_fields_again(self):
+        self.generate()
+        existing = read_cards(self.output_file)
+        existing['大'][1] = 'None'
+        existing['口'][4] = 'existing'
+        FakeDictPage.fetched = []
+        cards = self.generate(existing=existing)
+        self.assertEqual(['大'], FakeDictPage.fetched)
+        self.assertEqual(fake_fields('大'), cards['大'][:5])
+        self.assertEqual('existing', cards['口'][4])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import os
+import tempfile
+import time
+import unittest
+import zlib
+from typing import Dict, Optional
+
+from dict_page import DictPage
+from extraction import DictRecord
+from page_cache import PageCache, content_digest
+from page_fetcher import PageFetcher
+
+
+class CountingDictPage(DictPage):
+    """
+    测试用的字典页面，记录提取的次数。
+    """
+    SOURCE = 'test'
+    EXTRACTOR_VERSION = 1
+    extractions = 0
+
+    @classmethod
+    def extract_record(cls,
+                       char: str,
+                       content: bytes,
+                       timings: Optional[Dict[str, float]] = None) -> DictRecord:
+        cls.extractions += 1
+        return DictRecord(None, content.decode('utf-8'), None, f'v{cls.EXTRACTOR_VERSION}')
+
+    def _get_page_url(self, ch) -> str:
+        return f'test:{ch}'
+
+
+class PageCacheTest(unittest.TestCase):
+    """
+    测试页面缓存和记录缓存的命中与失效。
+    """
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = PageCache(os.path.join(self.temp_dir.name, 'cache.sqlite3'))
+
+    def tearDown(self) -> None:
+        self.cache.close()
+        self.temp_dir.cleanup()
+
+    def test_get_put(self):
+        self.assertIsNone(self.cache.get('zdic', 'u1'))
+        self.cache.put('zdic', 'u1', b'content')
+        self.assertEqual(b'content', self.cache.get('zdic', 'u1'))
+        self.assertIsNone(self.cache.get('baidu', 'u1'))
+
+    def test_expired_page_is_a_miss_unless_stale_is_allowed(self):
+        self.cache.close()
+        self.cache = PageCache(os.path.join(self.temp_dir.name, 'ttl.sqlite3'), ttl=0.01)
+        self.cache.put('zdic', 'u1', b'content')
+        time.sleep(0.05)
+        self.assertIsNone(self.cache.get('zdic', 'u1'))
+        self.assertEqual(b'content', self.cache.get('zdic', 'u1', allow_stale=True))
+
+    def test_record_is_invalidated_by_version_and_content(self):
+        self.cache.put('zdic', 'u1', b'old')
+        self.cache.put_record(content_digest(b'old'), 'Extractor', 1, '人', 'record-1')
+        self.assertEqual('record-1', self.cache.get_record('zdic', 'u1', 'Extractor', 1, '人'))
+        # 提取器升级后旧记录失效
+        self.assertIsNone(self.cache.get_record('zdic', 'u1', 'Extractor', 2, '人'))
+        # 其他提取器的记录互不影响
+        self.assertIsNone(self.cache.get_record('zdic', 'u1', 'Other', 1, '人'))
+        # 页面内容更新后旧记录失效
+        self.cache.put('zdic', 'u1', b'new')
+        self.assertIsNone(self.cache.get_record('zdic', 'u1', 'Extractor', 1, '人'))
+
+    def test_record_requires_cached_content(self):
+        self.cache.put_record(content_digest(b'missing'), 'Extractor', 1, '人', 'record')
+        self.cache.put('zdic', 'u1', b'missing')
+        self.assertIsNone(self.cache.get_record('zdic', 'u1', 'Extractor', 1, '人'))
+
+    def test_eviction_keeps_recently_accessed_pages(self):
+        contents = {f'u{i}': os.urandom(100) for i in range(4)}
+        size = len(zlib.compress(contents['u0']))
+        self.cache.close()
+        # 最多容纳3个页面
+        self.cache = PageCache(os.path.join(self.temp_dir.name, 'lru.sqlite3'),
+                               max_size=3 * size + size // 2)
+        for url in ('u0', 'u1', 'u2'):
+            self.cache.put('zdic', url, contents[url])
+            time.sleep(0.01)
+        self.assertEqual(contents['u0'], self.cache.get('zdic', 'u0'))
+        time.sleep(0.01)
+        self.cache.put('zdic', 'u3', contents['u3'])
+        self.assertEqual(contents['u0'], self.cache.get('zdic', 'u0'))
+        self.assertIsNone(self.cache.get('zdic', 'u1'))
+        self.assertEqual(contents['u2'], self.cache.get('zdic', 'u2'))
+        self.assertEqual(contents['u3'], self.cache.get('zdic', 'u3'))
+
+    def test_dict_page_reextracts_after_version_bump(self):
+        self.cache.put(CountingDictPage.SOURCE, 'test:人', b'ren')
+        fetcher = PageFetcher(self.cache, 'offline')
+        CountingDictPage.extractions = 0
+        self.assertEqual('ren', CountingDictPage('人', fetcher).lookup().pinyin)
+        self.assertEqual('ren', CountingDictPage('人', fetcher).lookup().pinyin)
+        self.assertEqual(1, CountingDictPage.extractions)
+        CountingDictPage.EXTRACTOR_VERSION = 2
+        try:
+            record = CountingDictPage('人', fetcher).lookup()
+        finally:
+            CountingDictPage.EXTRACTOR_VERSION = 1
+        self.assertEqual('v2', record.definitions)
+        self.assertEqual(2, CountingDictPage.extractions)
+
+
+if __name__ == '__main__':
+    unittest.main()
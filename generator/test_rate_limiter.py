@@ -0,0 +1,158 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import threading
+import time
+import unittest
+from unittest import mock
+
+from http_client import HttpClient
+from rate_limiter import HostLimiter, RateLimiter, parse_retry_after
+
+
+class HostLimiterTest(unittest.TestCase):
+    """
+    测试单个主机的自适应限流器的AIMD调整和 `Retry-After` 处理。
+    """
+    def test_starts_at_ceiling(self):
+        limiter = HostLimiter('example.com', max_rate=20.0, max_concurrency=8)
+        self.assertEqual(20.0, limiter.rate)
+        self.assertEqual(8, limiter.concurrency)
+
+    def test_throttling_halves_limits_once_per_latency(self):
+        limiter = HostLimiter('example.com', max_rate=20.0, max_concurrency=8)
+        limiter.acquire()
+        limiter.acquire()
+        limiter.release(429, 1.0)
+        self.assertEqual(10.0, limiter.rate)
+        self.assertEqual(4, limiter.concurrency)
+        # 同一批并发请求的失败不会使限额连续减半
+        limiter.release(503, 1.0)
+        self.assertEqual(10.0, limiter.rate)
+        self.assertEqual(4, limiter.concurrency)
+
+    def test_network_errors_and_slow_responses_back_off(self):
+        limiter = HostLimiter('example.com', max_rate=20.0, max_concurrency=8,
+                              slow_threshold=0.5)
+        limiter.acquire()
+        limiter.release(None, 0.1)
+        self.assertEqual(10.0, limiter.rate)
+        limiter = HostLimiter('example.com', max_rate=20.0, max_concurrency=8,
+                              slow_threshold=0.5)
+        limiter.acquire()
+        limiter.release(200, 1.0)
+        self.assertEqual(10.0, limiter.rate)
+
+    def test_success_increases_additively_up_to_ceiling(self):
+        # 速率上限足够高，令牌桶不会使测试变慢
+        limiter = HostLimiter('example.com', max_rate=1000.0, max_concurrency=8)
+        limiter.acquire()
+        limiter.release(429, 0.0)
+        rates = []
+        for _ in range(200):
+            limiter.acquire()
+            limiter.release(200, 0.0)
+            rates.append(limiter.rate)
+        self.assertEqual(sorted(rates), rates)
+        self.assertGreater(rates[0], 500.0)
+        self.assertLess(rates[0] - 500.0, 25.0)
+        self.assertEqual(1000.0, rates[-1])
+        self.assertEqual(8, limiter.concurrency)
+
+    def test_rate_never_drops_below_minimum(self):
+        limiter = HostLimiter('example.com', max_rate=4.0, max_concurrency=2)
+        for _ in range(3):
+            limiter.acquire()
+            limiter.release(429, 0.0)
+        self.assertEqual(1.0, limiter.rate)
+        self.assertEqual(1, limiter.concurrency)
+
+    def test_retry_after_blocks_requests(self):
+        limiter = HostLimiter('example.com', max_rate=100.0, max_concurrency=8)
+        limiter.acquire()
+        limiter.release(429, 0.0, retry_after=0.3)
+        start = time.monotonic()
+        limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.25)
+        limiter.release(200, 0.0)
+
+    def test_retry_after_on_success_is_ignored(self):
+        limiter = HostLimiter('example.com', max_rate=100.0, max_concurrency=8)
+        limiter.acquire()
+        limiter.release(200, 0.0, retry_after=60.0)
+        self.assertEqual(100.0, limiter.rate)
+        self.assertEqual(8, limiter.concurrency)
+        start = time.monotonic()
+        limiter.acquire()
+        self.assertLess(time.monotonic() - start, 1.0)
+        limiter.release(200, 0.0)
+
+    def test_concurrency_limit_blocks_until_release(self):
+        limiter = HostLimiter('example.com', max_rate=100.0, max_concurrency=1)
+        limiter.acquire()
+        acquired = threading.Event()
+
+        def acquire():
+            limiter.acquire()
+            acquired.set()
+
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        self.assertFalse(acquired.wait(0.1))
+        limiter.release(200, 0.0)
+        self.assertTrue(acquired.wait(1.0))
+        thread.join()
+        limiter.release(200, 0.0)
+
+
+class RateLimiterTest(unittest.TestCase):
+    """
+    测试按主机分别限流。
+    """
+    def test_hosts_are_limited_separately(self):
+        limiter = RateLimiter(max_rate=20.0, max_concurrency=8)
+        self.assertIs(limiter.host('a.com'), limiter.host('a.com'))
+        limiter.host('a.com').acquire()
+        limiter.host('a.com').release(429, 0.0)
+        self.assertEqual(10.0, limiter.host('a.com').rate)
+        self.assertEqual(20.0, limiter.host('b.com').rate)
+
+
+class HttpClientLimiterTest(unittest.TestCase):
+    """
+    测试 `HttpClient` 在请求异常结束时也会归还限流器的并发名额。
+    """
+    def test_limiter_is_released_on_unexpected_error(self):
+        limiter = RateLimiter(max_rate=100.0, max_concurrency=1)
+        client = HttpClient(rate_limiter=limiter)
+        session = mock.Mock()
+        session.get.side_effect = ValueError('unexpected')
+        with mock.patch.object(client, '_get_session', return_value=session):
+            with self.assertRaises(ValueError):
+                client.get('https://example.com/page')
+        acquired = threading.Event()
+        thread = threading.Thread(target=lambda: (limiter.host('example.com').acquire(),
+                                                  acquired.set()),
+                                  daemon=True)
+        thread.start()
+        self.assertTrue(acquired.wait(1.0))
+        thread.join()
+
+
+class ParseRetryAfterTest(unittest.TestCase):
+    """
+    测试 `Retry-After` 响应头的解析。
+    """
+    def test_parse(self):
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after(''))
+        self.assertIsNone(parse_retry_after('soon'))
+        self.assertEqual(120.0, parse_retry_after(' 120 '))
+        self.assertEqual(0.0, parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,53 +4,68 @@
 #     All rights reserved.                                                     #
 #                                                                              #
 # ##############################################################################
-from typing import Optional
+import re
+from typing import TYPE_CHECKING, Optional
 from urllib.parse import quote
 
-from bs4 import BeautifulSoup
-
 from dict_page import DictPage
+from extraction import ExtractionPlan, FieldSpec
+
+if TYPE_CHECKING:
+    from bs4 import Tag
+
+
+def _get_image(element: None, ch: str) -> Optional[str]:
+    return f'https://img.zdic.net/kai/jbh/{hex(ord(ch)).upper()[2:]}.gif'
+
+
+def _get_pinyin(element: 'Tag', ch: str) -> Optional[str]:
+    return element.contents[0].text.strip().split()[0]
+
+
+def _get_pronounce(element: 'Tag', ch: str) -> Optional[str]:
+    url = element.attrs['data-src-mp3']
+    return f'https:{url}'
+
+
+def _get_definitions(element: 'Tag', ch: str) -> Optional[str]:
+    definitions = []
+    for index, li in enumerate(element.find_all('li'), 1):
+        definition = li.text\
+            .replace('～', ch)\
+            .strip()
+        definitions.append(f"{index}. {definition}")
+    if len(definitions) == 0:
+        for index, li in enumerate(element.find_all('p'), 1):
+            definition = li.text\
+                .replace('◎', '')\
+                .replace('～', ch)\
+                .strip()
+            definitions.append(f"{index}. {definition}")
+    return '<br>'.join(definitions)
 
 
 class ZdicDictPage(DictPage):
     """
     此模型表示指定汉字对应的汉典页面内容。
     """
+    SOURCE = 'zdic'
+
+    BASE_URL = 'https://www.zdic.net'
+
+    # 修改下面的提取规则后须递增此版本号
+    EXTRACTOR_VERSION = 1
+
+    EXTRACTION_PLAN = ExtractionPlan(
+        fields={
+            'image': FieldSpec(None, _get_image),
+            'pinyin': FieldSpec('span.dicpy', _get_pinyin),
+            'pronounce': FieldSpec('.dicpy > .ptr > .audio_play_button', _get_pronounce),
+            'definitions': FieldSpec('.content.definitions.jnr > ol', _get_definitions),
+        },
+        # 只解析拼音（span.dicpy）和释义（div.content.definitions）所在的子树
+        parse_only={'class_': re.compile(r'(^|\s)(dicpy|definitions)(\s|$)')},
+    )
+
     def _get_page_url(self, ch) -> str:
-        return f'https://www.zdic.net/hans/{quote(ch)}'
-
-    def _get_image(self, soup: BeautifulSoup) -> Optional[str]:
-        return f'https://img.zdic.net/kai/jbh/{self._unicodeHex}.gif'
-
-    def _get_pinyin(self, soup: BeautifulSoup) -> Optional[str]:
-        pinyin_element = soup.select_one('span.dicpy')
-        if pinyin_element:
-            pinyin_text = pinyin_element.contents[0].text.strip().split()[0]
-            return pinyin_text
-        return None
-
-    def _get_pronounce(self, soup: BeautifulSoup) -> Optional[str]:
-        pronounce_element = soup.select_one('.dicpy > .ptr > .audio_play_button')
-        if pronounce_element:
-            url = pronounce_element.attrs['data-src-mp3']
-            return f'https:{url}'
-        return None
-
-    def _get_definitions(self, soup: BeautifulSoup) -> Optional[str]:
-        definitions_element = soup.select_one('.content.definitions.jnr > ol')
-        if definitions_element:
-            definitions = []
-            for index, li in enumerate(definitions_element.find_all('li'), 1):
-                definition = li.text\
-                    .replace('～', self._char)\
-                    .strip()
-                definitions.append(f"{index}. {definition}")
-            if len(definitions) == 0:
-                for index, li in enumerate(definitions_element.find_all('p'), 1):
-                    definition = li.text\
-                        .replace('◎', '')\
-                        .replace('～', self._char)\
-                        .strip()
-                    definitions.append(f"{index}. {definition}")
-            return '<br>'.join(definitions)
-        return None
+        return f'{self.BASE_URL}/hans/{quote(ch)}'
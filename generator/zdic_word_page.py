@@ -0,0 +1,40 @@
+# ##############################################################################
+#                                                                              #
+#     Copyright (c) 2023. Haixing Hu                                           #
+#     All rights reserved.                                                     #
+#                                                                              #
+# ##############################################################################
+import re
+from typing import TYPE_CHECKING, Optional
+
+from extraction import ExtractionPlan, FieldSpec
+from zdic_dict_page import ZdicDictPage, _get_definitions
+
+if TYPE_CHECKING:
+    from bs4 import Tag
+
+
+def _get_pinyin(element: 'Tag', word: str) -> Optional[str]:
+    # 词语的拼音由多个音节组成，音节之间以空格隔开
+    return ' '.join(element.contents[0].text.split()) or None
+
+
+class ZdicWordPage(ZdicDictPage):
+    """
+    此模型表示指定词语对应的汉典页面内容。
+
+    汉典的词语页面与汉字页面的URL格式相同，来源名称也相同，因此单字词语直接复用
+    汉字牌组已下载并缓存的页面。词语页面没有图片和读音，只提取拼音和释义。
+    """
+
+    # 修改下面的提取规则后须递增此版本号；与汉字页面的提取规则各自独立编号
+    EXTRACTOR_VERSION = 1
+
+    EXTRACTION_PLAN = ExtractionPlan(
+        fields={
+            'pinyin': FieldSpec('span.dicpy', _get_pinyin),
+            # 词语的释义可能是列表，也可能是若干段落，均由 _get_definitions 处理
+            'definitions': FieldSpec('.content.definitions', _get_definitions),
+        },
+        parse_only={'class_': re.compile(r'(^|\s)(dicpy|definitions)(\s|$)')},
+    )